@@ -0,0 +1,418 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import random
+import shutil
+import struct
+import zlib
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MODES = {
+    "http": {"fetch_mode": "http"},
+    "http-main": {"fetch_mode": "http", "main_content": "only"},
+    "auto": {"fetch_mode": "auto"},
+    "browser-lite": {"fetch_mode": "browser", "profile": "lite"},
+    "browser-full": {"fetch_mode": "browser", "profile": "full"}
+}
+
+@dataclass
+class FixtureSpec:
+    seed: int = 1234
+    static_pages: int = 60
+    js_pages: int = 20
+    image_pages: int = 10
+    images_per_page: int = 20
+    large_files: int = 2
+    large_file_bytes: int = 8 * 1024 * 1024
+    slow_pages: int = 4
+    slow_seconds: float = 1.5
+    error_pages: int = 4
+
+class FixtureSite:
+    WORDS = ("murder", "orient", "express", "detective", "poirot", "train", "snow", "compartment", "passenger",
+             "conductor", "alibi", "clue", "witness", "istanbul", "calais", "midnight", "dagger", "ticket")
+
+    def __init__(self, spec: FixtureSpec):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.pages: Dict[str, str] = {}
+        self.images: Dict[str, bytes] = {}
+        self.files: Dict[str, bytes] = {}
+        self.file_dir = ""
+        self.build()
+
+    def paragraph(self, words: int = 80) -> str:
+        return " ".join(self.rng.choice(self.WORDS) for _ in range(words)).capitalize() + "."
+
+    @staticmethod
+    def png(width: int, height: int, color: tuple) -> bytes:
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+        rows = b"".join(b"\x00" + bytes(color) * width for _ in range(height))
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+    def static_html(self, title: str, body: str) -> str:
+        links = "".join(f'<a href="/static/{self.rng.randrange(self.spec.static_pages)}.html">related</a> '
+                        for _ in range(5))
+        return (f"<!DOCTYPE html><html><head><title>{title}</title></head><body><h1>{title}</h1>"
+                f"{body}<nav>{links}</nav></body></html>")
+
+    def build(self):
+        spec = self.spec
+        for i in range(spec.static_pages):
+            body = "".join(f"<p>{self.paragraph()}</p>" for _ in range(6))
+            self.pages[f"/static/{i}.html"] = self.static_html(f"Static page {i}", body)
+
+        for i in range(spec.js_pages):
+            text = json.dumps([self.paragraph() for _ in range(6)])
+            self.pages[f"/js/{i}.html"] = (
+                f"<!DOCTYPE html><html><head><title>JS page {i}</title></head><body><div id=\"app\"></div>"
+                f"<script>document.getElementById('app').innerHTML = {text}"
+                ".map(p => '<p>' + p + '</p>').join('');</script></body></html>"
+            )
+
+        for i in range(spec.image_pages):
+            imgs = []
+            for j in range(spec.images_per_page):
+                name = f"/img/{i}-{j}.png"
+                self.images[name] = self.png(64, 64, (self.rng.randrange(256), self.rng.randrange(256), i % 256))
+                imgs.append(f'<img src="{name}" alt="image {j}" width="64" height="64">')
+            self.pages[f"/images/{i}.html"] = self.static_html(f"Image page {i}", f"<p>{self.paragraph()}</p>" + "".join(imgs))
+
+        for i in range(spec.large_files):
+            name = f"/files/report-{i}.pdf"
+            block = self.rng.randbytes(64 * 1024)
+            self.files[name] = (b"%PDF-1.4\n" + block * (spec.large_file_bytes // len(block) + 1))[:spec.large_file_bytes]
+            self.pages[f"/files/{i}.html"] = self.static_html(
+                f"Download page {i}", f'<p>{self.paragraph()}</p><a href="{name}">Full report (PDF)</a>')
+
+    def urls(self, base: str) -> List[str]:
+        paths = list(self.pages)
+        paths += [f"/slow/{i}.html" for i in range(self.spec.slow_pages)]
+        paths += [f"/error/{500 if i % 2 else 404}/{i}.html" for i in range(self.spec.error_pages)]
+        return [base + path for path in paths]
+
+    async def handle_page(self, request: web.Request) -> web.Response:
+        html = self.pages.get(request.path)
+        if html is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=html, content_type="text/html")
+
+    async def handle_slow(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.spec.slow_seconds)
+        return web.Response(text=self.static_html("Slow page", f"<p>{self.paragraph()}</p>" * 6), content_type="text/html")
+
+    async def handle_error(self, request: web.Request) -> web.Response:
+        return web.Response(status=int(request.match_info["status"]), text="fixture error")
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        data = self.images.get(request.path)
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data, content_type="image/png")
+
+    async def handle_robots(self, request: web.Request) -> web.Response:
+        return web.Response(text="User-agent: *\nAllow: /\n")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/robots.txt", self.handle_robots)
+        app.router.add_get("/slow/{name}", self.handle_slow)
+        app.router.add_get("/error/{status}/{name}", self.handle_error)
+        app.router.add_get("/img/{name}", self.handle_image)
+        for name in self.files:
+            # Static file responses support HEAD and Range, so large files exercise resumable downloads
+            path = os.path.join(self.file_dir, name.lstrip("/"))
+            app.router.add_get(name, lambda request, path=path: web.FileResponse(path))
+        app.router.add_get("/{section}/{name}", self.handle_page)
+        return app
+
+    def write_files(self, root: str):
+        self.file_dir = root
+        for name, data in self.files.items():
+            path = os.path.join(root, name.lstrip("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+class TreeRssSampler:
+    # ru_maxrss only knows the largest single child, and only once it has exited; Chromium is a tree
+    # of renderer and GPU processes, so the total is sampled while the run is going
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @staticmethod
+    def tree_rss() -> Optional[int]:
+        if psutil is not None:
+            total = 0
+            root = psutil.Process()
+            for process in [root] + root.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total
+        if not os.path.isdir("/proc"):
+            return None
+        parents: Dict[int, int] = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat", encoding='utf-8') as f:
+                    # The command name may contain spaces; the fields after it do not
+                    parents[int(name)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+        tree = {os.getpid()}
+        grew = True
+        while grew:
+            found = {pid for pid, parent in parents.items() if parent in tree and pid not in tree}
+            tree |= found
+            grew = bool(found)
+        total = 0
+        for pid in tree:
+            try:
+                with open(f"/proc/{pid}/status", encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+                            break
+            except (OSError, ValueError):
+                continue
+        return total
+
+    def sample(self):
+        rss = self.tree_rss()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> "TreeRssSampler":
+        self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+        self.sample()
+
+def run_mode(mode: str, urls: List[str], concurrency: int, workdir: str) -> Dict:
+    # Runs in its own process so peak RSS and CPU belong to this mode alone
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    import webscrapping
+
+    settings = MODES[mode]
+    config = webscrapping.ScrapeConfig(
+        fetch_mode=settings["fetch_mode"],
+        concurrency=concurrency,
+        host_concurrency=concurrency,
+        min_host_interval=0.0,
+        skip_unchanged_pages=False,
+        main_content=settings.get("main_content", "off"),
+        output_format="jsonl",
+        trace_file=os.path.join(workdir, "trace.jsonl")
+    )
+    if "profile" in settings:
+        config = config.with_profile(settings["profile"])
+
+    started = time.perf_counter()
+    with TreeRssSampler() as memory:
+        stats = asyncio.run(webscrapping.ScrapeCore(config).scrape_batch(urls))
+    wall = time.perf_counter() - started
+
+    latencies = []
+    stages: Dict[str, List[float]] = {}
+    with open(config.trace_file, encoding='utf-8') as f:
+        for line in f:
+            trace = json.loads(line)
+            if trace["outcome"] == "ok":
+                # Downloads are spans of their own; only page spans count towards page latency
+                if trace.get("span", "page") == "page":
+                    latencies.append(trace["seconds"])
+                for stage in trace["stages"]:
+                    stages.setdefault(stage["stage"], []).append(stage["seconds"])
+
+    output_bytes = 0
+    for root, _, files in os.walk(os.path.join(workdir, "output", "pages")):
+        output_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+
+    total_bytes = sum(value for (name, _), value in webscrapping.METRICS.counters.items() if name == "bytes_total")
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    summary = stats.as_dict()
+    return {
+        "mode": mode,
+        "pages": summary["total"],
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "assets_downloaded": summary["assets_downloaded"],
+        "retries": summary["retries"],
+        "wall_seconds": round(wall, 3),
+        "pages_per_second": round(summary["succeeded"] / wall, 3) if wall else 0.0,
+        "p50_page_seconds": round(percentile(latencies, 50), 4),
+        "p95_page_seconds": round(percentile(latencies, 95), 4),
+        "bytes": int(total_bytes),
+        "bytes_per_second": round(total_bytes / wall, 1) if wall else 0.0,
+        "output_bytes": output_bytes,
+        "stage_p50_seconds": {stage: round(percentile(values, 50), 4) for stage, values in sorted(stages.items())},
+        # ru_maxrss is in KiB on Linux; for children it is the largest single process that has exited
+        "peak_rss_mb": round(own.ru_maxrss / 1024, 1),
+        "largest_child_rss_mb": round(children.ru_maxrss / 1024, 1),
+        "peak_tree_rss_mb": round(memory.peak / 1024 / 1024, 1) if memory.peak is not None else None,
+        "cpu_seconds": round(own.ru_utime + own.ru_stime, 3),
+        "child_cpu_seconds": round(children.ru_utime + children.ru_stime, 3)
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def start_server(site: FixtureSite) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(site.app())
+    await runner.setup()
+    site_runner = web.TCPSite(runner, "127.0.0.1", 0)
+    await site_runner.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+async def run_suite(args: argparse.Namespace) -> Dict:
+    spec = FixtureSpec(seed=args.seed)
+    if args.quick:
+        spec = FixtureSpec(seed=args.seed, static_pages=15, js_pages=5, image_pages=3, images_per_page=10,
+                           large_files=1, large_file_bytes=2 * 1024 * 1024, slow_pages=2, error_pages=2)
+    site = FixtureSite(spec)
+    root = tempfile.mkdtemp(prefix="scrape-bench-")
+    site.write_files(os.path.join(root, "fixture"))
+    runner, base = await start_server(site)
+    urls = site.urls(base)
+
+    results: Dict[str, List[Dict]] = {}
+    try:
+        for mode in args.modes:
+            for run in range(args.repeat):
+                workdir = os.path.join(root, f"{mode}-{run}")
+                os.makedirs(workdir)
+                out_path = os.path.join(workdir, "result.json")
+                command = [sys.executable, os.path.abspath(__file__), "--worker", mode, "--workdir", workdir,
+                           "--concurrency", str(args.concurrency), "--result", out_path, "--"] + urls
+                process = await asyncio.create_subprocess_exec(*command)
+                if await process.wait() != 0:
+                    raise RuntimeError(f"Benchmark run for {mode} exited with {process.returncode}")
+                with open(out_path, encoding='utf-8') as f:
+                    result = json.load(f)
+                results.setdefault(mode, []).append(result)
+                print(f"{mode} #{run + 1}: {result['pages_per_second']} pages/s, "
+                      f"p50 {result['p50_page_seconds']}s, p95 {result['p95_page_seconds']}s, "
+                      f"{result['bytes_per_second'] / 1e6:.1f} MB/s, peak RSS {result['peak_tree_rss_mb'] or result['peak_rss_mb']} MB")
+    finally:
+        await runner.cleanup()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "fixture": asdict(spec),
+        "runs": results,
+        "median": {mode: median_run(runs) for mode, runs in results.items()}
+    }
+
+def median_run(runs: List[Dict]) -> Dict:
+    return {key: percentile([run[key] for run in runs], 50) for key in runs[0]
+            if isinstance(runs[0][key], (int, float))}
+
+def compare(report: Dict, baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    for mode, current in report["median"].items():
+        previous = baseline.get("median", {}).get(mode)
+        if not previous:
+            continue
+        if current["pages_per_second"] < previous["pages_per_second"] * (1 - tolerance):
+            regressions.append(f"{mode}: {previous['pages_per_second']} -> {current['pages_per_second']} pages/s")
+        if previous["p95_page_seconds"] and current["p95_page_seconds"] > previous["p95_page_seconds"] * (1 + tolerance):
+            regressions.append(f"{mode}: p95 {previous['p95_page_seconds']}s -> {current['p95_page_seconds']}s")
+    return regressions
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ScrapeCore against a local fixture site")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=["http", "auto", "browser-lite"])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per mode; the report keeps the median")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--quick", action="store_true", help="smaller fixture site for smoke runs")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report path")
+    parser.add_argument("--baseline", metavar="FILE", help="fail if slower than this earlier report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown against --baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the fixture and per-run output directories")
+    parser.add_argument("--worker", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("urls", nargs="*", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.worker:
+        result = run_mode(args.worker, args.urls, args.concurrency, args.workdir)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    report = asyncio.run(run_suite(args))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        regressions = compare(report, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
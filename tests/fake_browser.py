@@ -0,0 +1,76 @@
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+import webscrapping as W
+
+
+class FakeResponse:
+    def __init__(self, url, body=b"<html><body><div id=app></div></body></html>"):
+        self.url = url
+        self.status = 200
+        self.status_text = "OK"
+        self.headers = {"content-type": "text/html"}
+        self._body = body
+
+    async def body(self):
+        return self._body
+
+
+class FakePage:
+    # goto fails like a navigation timeout unless the test sets FakePage.respond
+    respond = False
+
+    def __init__(self, context):
+        self.context = context
+
+    async def goto(self, url, **kwargs):
+        if not self.respond:
+            raise PlaywrightTimeoutError("Timeout 30000ms exceeded")
+        return FakeResponse(url)
+
+    async def close(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def clear_cookies(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    async def close(self):
+        pass
+
+
+def make_core(**overrides):
+    # A ScrapeCore whose browser pool hands out fake contexts; returns the core and every context created
+    config = W.ScrapeConfig(**dict(dict(humanize=False, browser_pool_size=1, near_duplicate_distance=None,
+                                        respect_robots=False, min_host_interval=0.0, asset_processors=0), **overrides))
+    core = W.ScrapeCore(config)
+    core.scheduler = W.HostScheduler(config, None)
+    core.retry.policy.base_delay = 0.0
+    created = []
+
+    async def launch_browser(config):
+        return FakeBrowser()
+
+    async def new_context(config, browser):
+        context = FakeContext()
+        created.append(context)
+        return context
+
+    core.launch_browser = launch_browser
+    core.new_context = new_context
+    core.pool = W.BrowserPool(core, core.config)
+    return core, created
@@ -0,0 +1,26 @@
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+
+@asynccontextmanager
+async def serve(routes):
+    # routes maps a path to an aiohttp handler; yields the base URL of a server on a free port
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def html_page(title, body, links=()):
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return web.Response(text=f"<html><head><title>{title}</title></head><body><p>{body}</p>{anchors}</body></html>",
+                        content_type="text/html")
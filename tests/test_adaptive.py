@@ -0,0 +1,77 @@
+import asyncio
+
+import webscrapping as W
+
+
+def test_limiter_grows_additively_and_halves_on_overload():
+    limiter = W.AdaptiveLimiter("test", 4, 1, 8, {"throttled"}, cooldown=0.0)
+    for _ in range(4):
+        limiter.on_success(0.1)
+    assert 4.9 < limiter.limit < 5.0
+    limiter.on_error("throttled")
+    assert 2.4 < limiter.limit < 2.5
+    limiter.on_error("client")
+    assert 2.4 < limiter.limit < 2.5
+    for _ in range(10):
+        limiter.on_error("throttled")
+    assert limiter.limit == 1
+
+
+def test_limiter_backs_off_once_per_cooldown_and_respects_maximum():
+    limiter = W.AdaptiveLimiter("test", 8, 1, 8, {"timeout"}, cooldown=60.0)
+    limiter.on_error("timeout")
+    limiter.on_error("timeout")
+    assert limiter.limit == 4
+    for _ in range(200):
+        limiter.on_success(0.1)
+    assert limiter.limit == 8
+
+
+def test_latency_inflation_only_backs_off_host_limiters():
+    limits = W.AdaptiveLimits("pages", 16, 16, 8, 8)
+    host = limits.host("a.test")
+    host.cooldown = limits.global_limiter.cooldown = 0.0
+    for seconds in [0.1] * 5 + [1.0] * 5:
+        host.on_success(seconds)
+        limits.global_limiter.on_success(seconds)
+    assert host.limit < 8
+    assert limits.global_limiter.limit == 16
+
+
+def test_slot_reports_time_to_the_stopped_clock():
+    # A large download stops the clock at its headers; the body time must not look like latency
+    limits = W.AdaptiveLimits("downloads", 16, 16, 8, 8)
+
+    async def download(body_seconds):
+        async with limits.slot("cdn.test") as clock:
+            await asyncio.sleep(0.01)
+            clock.stop()
+            await asyncio.sleep(body_seconds)
+
+    async def run():
+        for _ in range(3):
+            await download(0.0)
+        for _ in range(3):
+            await download(0.2)
+
+    asyncio.run(run())
+    host = limits.host("cdn.test")
+    assert host.latency < 0.05
+    assert host.limit == 8
+    assert limits.global_limiter.in_flight == host.in_flight == 0
+
+
+def test_slot_feeds_errors_to_both_limiters():
+    limits = W.AdaptiveLimits("pages", 8, 8, 4, 4)
+
+    async def fail():
+        async with limits.slot("a.test"):
+            raise W.HttpStatusError(429, "http://a.test/")
+
+    try:
+        asyncio.run(fail())
+    except W.HttpStatusError:
+        pass
+    assert limits.host("a.test").limit == 2
+    assert limits.global_limiter.limit == 8
+    assert limits.global_limiter.in_flight == 0
@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import json
+import zlib
+
+import pytest
+
+import webscrapping as W
+
+
+def pdf(pages):
+    objects = b"".join(b"%d 0 obj << /Type /Page /Parent 2 0 R >> endobj\n" % (i + 3) for i in range(pages))
+    return b"%PDF-1.4\n2 0 obj << /Type /Pages /Kids [] /Count " + str(pages).encode() + b" >> endobj\n" + objects
+
+
+def test_pdf_page_count_uses_page_objects_or_the_page_tree(tmp_path):
+    plain = tmp_path / "plain.pdf"
+    plain.write_bytes(pdf(3))
+    assert W.pdf_page_count(str(plain)) == 3
+
+    # Page objects inside a compressed object stream are invisible; the tree's /Count still says 12
+    packed = tmp_path / "packed.pdf"
+    packed.write_bytes(b"%PDF-1.5\n1 0 obj << /Count 12 /Type /Pages >> endobj\n"
+                       b"5 0 obj << /Type /ObjStm /Filter /FlateDecode >> stream\n"
+                       + zlib.compress(b"<< /Type /Page >>" * 12) + b"\nendstream endobj\n")
+    assert W.pdf_page_count(str(packed)) == 12
+
+    empty = tmp_path / "empty.pdf"
+    empty.write_bytes(b"")
+    assert W.pdf_page_count(str(empty)) is None
+
+
+def test_analyze_asset_fills_hash_mime_and_pages(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(pdf(2))
+    result = W.analyze_asset({"url": "http://a.test/doc.pdf", "path": str(path)})
+    assert result["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert (result["mime"], result["pdf_pages"]) == ("application/pdf", 2)
+
+    missing = W.analyze_asset({"url": "http://a.test/gone.pdf", "path": str(tmp_path / "gone.pdf")})
+    assert missing["error"].startswith("FileNotFoundError")
+
+
+def test_analyze_asset_reads_image_dimensions_and_dhash(tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    path = tmp_path / "gradient.png"
+    image = image_module.new("L", (32, 16))
+    image.putdata([x * 8 for _ in range(16) for x in range(32)])
+    image.save(path)
+    result = W.analyze_asset({"url": "http://a.test/g.png", "path": str(path), "mime": "image/png"})
+    assert (result["width"], result["height"], result["format"]) == (32, 16, "PNG")
+    assert len(result["dhash"]) == 16
+
+
+def test_processor_appends_every_result_to_the_manifest(tmp_path):
+    manifest = tmp_path / "asset_manifest.jsonl"
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"doc{i}.pdf"
+        path.write_bytes(pdf(i + 1))
+        paths.append(str(path))
+
+    async def run():
+        processor = W.AssetProcessor(1, str(manifest), batch_size=2, batch_wait=0.05)
+        try:
+            for path in paths:
+                await processor.submit({"url": "http://a.test/" + path, "path": path})
+            await processor.join()
+            return processor.processed
+        finally:
+            processor.close()
+
+    assert asyncio.run(run()) == 5
+    with open(manifest, encoding="utf-8") as f:
+        records = sorted((json.loads(line) for line in f), key=lambda r: r["path"])
+    assert [r["pdf_pages"] for r in records] == [1, 2, 3, 4, 5]
@@ -0,0 +1,61 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = W.AssetStore(str(tmp_path / "assets"))
+    paths = []
+    for url in ("http://a.test/logo.png", "http://b.test/copy.png"):
+        tmp = store.temp_path()
+        with open(tmp, "wb") as f:
+            f.write(PNG)
+        digest, size = W.AssetStore.hash_file(tmp)
+        paths.append(store.commit(url, tmp, digest, size, "png"))
+        assert not os.path.exists(tmp)
+    assert paths[0] == paths[1]
+    assert store.lookup("http://b.test/copy.png") == paths[0]
+    assert store.lookup("http://c.test/never.png") is None
+
+    # An index row whose blob has gone is not a hit
+    os.remove(paths[0])
+    assert store.lookup("http://a.test/logo.png") is None
+    store.close()
+
+
+def test_known_assets_are_skipped_then_revalidated(workdir):
+    requests = []
+
+    async def image(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=PNG, content_type="image/png", headers={"ETag": '"v1"'})
+
+    async def run(base, revalidate_after):
+        core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, near_duplicate_distance=None,
+                                           asset_revalidate_after=revalidate_after))
+        await core.start()
+        try:
+            await core.downloader.submit(base + "/logo.png", "images")
+            await core.downloader.join()
+            return core.downloader.completed, core.downloader.skipped
+        finally:
+            await core.close()
+
+    async def runs():
+        async with serve({"/logo.png": image}) as base:
+            return [await run(base, 3600.0), await run(base, 3600.0), await run(base, 0.0)]
+
+    first, fresh, revalidated = asyncio.run(runs())
+    assert first == (1, 0)
+    assert fresh == (0, 1)
+    assert revalidated == (0, 1)
+    assert requests == [None, '"v1"']
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
+
+import webscrapping as W
+from fake_browser import make_core
+
+
+def test_failed_navigation_returns_every_rotated_context(workdir):
+    core, created = make_core()
+
+    async def run():
+        await core.pool.start()
+        try:
+            await core.scrape_browser("http://example.test/")
+        except PlaywrightTimeoutError:
+            pass
+        else:
+            raise AssertionError("navigation should have failed")
+
+    asyncio.run(run())
+
+    attempts = core.retry.policy.attempts_for("timeout")
+    assert len(created) == attempts
+    assert core.pool.leases == {}
+    assert sum(slot.open_contexts for slot in core.pool.slots) == len(core.pool.idle)
+    assert all(context.closed for context in created[:-1])
+
+
+def test_default_config_launches_a_browser(workdir):
+    # Playwright checks launch options before it looks for Chromium, so a bad option fails
+    # even where no browser is installed; where one is, this is a real launch
+    core = W.ScrapeCore(W.ScrapeConfig(near_duplicate_distance=None))
+
+    async def run():
+        core.playwright = await async_playwright().start()
+        try:
+            browser = await core.launch_browser(core.config)
+            await browser.close()
+            return True
+        except PlaywrightError as e:
+            if "Executable doesn't exist" not in str(e):
+                raise
+            return False
+        finally:
+            await core.close()
+
+    if not asyncio.run(run()):
+        pytest.skip("Chromium is not installed")
+
+
+def test_context_is_returned_when_page_creation_fails(workdir):
+    core, created = make_core()
+
+    async def broken_page():
+        raise RuntimeError("Target closed")
+
+    async def run():
+        await core.pool.start()
+        context = await core.pool.acquire(core.make_config())
+        await core.pool.release(context)
+        context.new_page = broken_page
+        try:
+            await core.scrape_browser("http://example.test/")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("page creation should have failed")
+
+    asyncio.run(run())
+    assert core.pool.leases == {}
+    assert created[0].closed
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import webscrapping as W
+
+
+class Locator:
+    def __init__(self, page, selector):
+        self.page, self.selector = page, selector
+
+    async def count(self):
+        return sum(1 for present in self.page.present if present in self.selector)
+
+
+class CaptchaPage:
+    url = "http://a.test/"
+
+    def __init__(self, present=(), sitekey=None, challenge_after=None):
+        self.present = list(present)
+        self.sitekey = sitekey
+        self.challenge_after = challenge_after
+        self.listeners = []
+        self.waited_for_widget = False
+
+    def on(self, event, callback):
+        self.listeners.append(callback)
+        if self.challenge_after is not None:
+            # The challenge script arrives a moment after navigation, then attaches its iframe
+            async def arrive():
+                await asyncio.sleep(self.challenge_after)
+                callback(type("Response", (), {"url": "https://www.google.com/recaptcha/api.js"})())
+            asyncio.get_running_loop().create_task(arrive())
+
+    def remove_listener(self, event, callback):
+        self.listeners.remove(callback)
+
+    def locator(self, selector):
+        return Locator(self, selector)
+
+    async def wait_for_selector(self, selector, state=None, timeout=None):
+        self.waited_for_widget = True
+        self.present.append('iframe[src*="recaptcha"]')
+
+    async def evaluate(self, script, arg=None):
+        return self.sitekey if arg is None else None
+
+
+class Solver:
+    def __init__(self):
+        self.solved = []
+
+    async def solve_recaptcha_v2(self, sitekey, pageurl):
+        self.solved.append(sitekey)
+        return "token"
+
+
+def detect(page, solver=None):
+    async def run():
+        started = time.monotonic()
+        result = await W.DynamicCaptchaDetector.detect_and_solve(page, solver or Solver())
+        return result, time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def test_clean_page_is_released_after_a_short_settle():
+    page = CaptchaPage()
+    solved, elapsed = detect(page)
+    assert not solved
+    assert elapsed < 1.0
+    assert page.listeners == [] and not page.waited_for_widget
+
+
+def test_challenge_on_the_wire_waits_for_its_widget_and_is_solved():
+    page, solver = CaptchaPage(sitekey="key", challenge_after=0.05), Solver()
+    solved, elapsed = detect(page, solver)
+    assert solved and solver.solved == ["key"]
+    assert page.waited_for_widget and elapsed < W.DynamicCaptchaDetector.SETTLE_SECONDS
+    assert page.listeners == []
+
+
+def test_widget_already_on_the_page_is_solved_without_waiting():
+    page, solver = CaptchaPage(present=['iframe[src*="recaptcha"]'], sitekey="key"), Solver()
+    solved, elapsed = detect(page, solver)
+    assert solved and solver.solved == ["key"]
+    assert elapsed < 0.2 and not page.waited_for_widget
+    assert page.listeners == []
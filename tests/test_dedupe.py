@@ -0,0 +1,39 @@
+import random
+
+import webscrapping as W
+
+
+def story(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(["train", "snow", "detective", "knife", "passport", "conductor", "alibi", "cabin",
+                                "midnight", "letter", "whistle", "count", "princess", "colonel"]) + str(rng.randint(0, 40))
+                    for _ in range(words))
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_fingerprint_is_close_for_small_edits_and_far_otherwise():
+    text = story(1, words=1000)
+    edited = text.replace(text.split()[10], "edited", 1)
+    original = W.NearDuplicateIndex.fingerprint(text)
+    assert distance(original, W.NearDuplicateIndex.fingerprint(edited)) <= 6
+    assert distance(original, W.NearDuplicateIndex.fingerprint(story(2, words=1000))) > 16
+    assert W.NearDuplicateIndex.fingerprint("too short to judge", min_words=50) is None
+
+
+def test_index_flags_near_duplicates_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "near_duplicates.sqlite")
+    index = W.NearDuplicateIndex(path, max_distance=3)
+    original = W.NearDuplicateIndex.fingerprint(story(1))
+    assert index.check("http://a.test/1", original) is None
+    # Re-checking a page against itself is not a duplicate
+    assert index.check("http://a.test/1", original) is None
+    assert index.check("http://a.test/copy", original ^ 0b101) == "http://a.test/1"
+    assert index.check("http://a.test/other", W.NearDuplicateIndex.fingerprint(story(2))) is None
+    index.close()
+
+    reopened = W.NearDuplicateIndex(path, max_distance=3)
+    assert reopened.check("http://b.test/copy", original ^ (1 << 63)) == "http://a.test/1"
+    reopened.close()
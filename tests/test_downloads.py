@@ -0,0 +1,130 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+class FakeCurlResponse:
+    def __init__(self, status, headers=None, body=b""):
+        self.status_code = status
+        self.headers = headers or {}
+        self.body = body
+
+    async def aiter_content(self):
+        yield self.body
+
+    async def aclose(self):
+        pass
+
+
+class FakeCurlSession:
+    # Stands in for curl_cffi's AsyncSession: returns the canned response, or raises it
+    def __init__(self, result):
+        self.result = result
+        self.requests = 0
+
+    async def get(self, url, **kwargs):
+        self.requests += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def download(tls_result, routes, monkeypatch, tmp_path):
+    # Runs ScrapeCore.download_file with a fake TLS session; returns the outcome, meta, TLS requests
+    # and how many requests reached the aiohttp fallback
+    monkeypatch.setattr(W, "AsyncSession", FakeCurlSession)
+    tls = FakeCurlSession(tls_result)
+    hits = []
+
+    def counted(handler):
+        async def wrapper(request):
+            hits.append(request.path)
+            return await handler(request)
+        return wrapper
+
+    async def run():
+        async with serve({path: counted(handler) for path, handler in routes.items()}) as base:
+            core = W.ScrapeCore(W.ScrapeConfig(near_duplicate_distance=None))
+            core.downloader = W.AssetDownloader(core, core.config)
+            core.downloader.tls_session = tls
+            meta = {}
+            async with aiohttp.ClientSession() as session:
+                try:
+                    result = await core.download_file(session, base + "/a.png", str(tmp_path / "a.png"), meta=meta)
+                except W.HttpStatusError as e:
+                    result = e
+            return result, meta
+
+    result, meta = asyncio.run(run())
+    return result, meta, tls.requests, len(hits)
+
+
+async def image(request):
+    return web.Response(body=PNG, content_type="image/png")
+
+
+def test_tls_throttling_raises_with_retry_after_and_skips_the_fallback(workdir, monkeypatch, tmp_path):
+    result, _, tls_requests, fallback = download(FakeCurlResponse(429, {"retry-after": "7"}),
+                                                 {"/a.png": image}, monkeypatch, tmp_path)
+    assert isinstance(result, W.HttpStatusError)
+    assert (result.status, result.retry_after) == (429, "7")
+    assert (tls_requests, fallback) == (1, 0)
+
+
+def test_tls_client_errors_are_rejected_without_a_second_request(workdir, monkeypatch, tmp_path):
+    result, meta, _, fallback = download(FakeCurlResponse(404), {"/a.png": image}, monkeypatch, tmp_path)
+    assert result is False
+    assert meta["rejected"] == "status 404"
+    assert fallback == 0
+
+
+def test_curl_failures_fall_back_to_aiohttp(workdir, monkeypatch, tmp_path, caplog):
+    with caplog.at_level("WARNING"):
+        result, meta, _, fallback = download(RuntimeError("curl: (35) TLS handshake failed"), {"/a.png": image},
+                                             monkeypatch, tmp_path)
+    assert result is True
+    assert fallback == 1
+    assert meta["sha256"]
+    assert "falling back to aiohttp" in caplog.text
+
+
+def test_downloader_caps_each_host_and_skips_queued_duplicates(workdir):
+    active = {}
+    peak = {}
+
+    async def slow_image(request):
+        host = request.host
+        active[host] = active.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        await asyncio.sleep(0.05)
+        active[host] -= 1
+        return web.Response(body=PNG + request.path.encode(), content_type="image/png")
+
+    async def run():
+        async with serve({"/img/{n}.png": slow_image}) as base:
+            port = base.rsplit(":", 1)[1]
+            core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, near_duplicate_distance=None,
+                                               download_concurrency=8, download_per_host=2))
+            await core.start()
+            try:
+                for host in ("127.0.0.1", "localhost"):
+                    for n in range(6):
+                        await core.downloader.submit(f"http://{host}:{port}/img/{n}.png", "images")
+                await core.downloader.submit(f"http://127.0.0.1:{port}/img/0.png", "images")
+                await core.downloader.join()
+                return core.downloader.completed, core.downloader.skipped
+            finally:
+                await core.close()
+
+    completed, skipped = asyncio.run(run())
+    assert completed == 12
+    assert skipped == 1
+    assert max(peak.values()) == 2
+    assert len(peak) == 2
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+import webscrapping as W
+from fixture_site import html_page, serve
+
+
+PAGE = """<html><head><title> The  Story </title><base href="http://example.test/books/"></head>
+<body><p>Visible chapter text.</p><p style="display:none">Hidden spoiler.</p><script>var x = 1;</script>
+<a href="next.html">Next</a><a href="/files/plan.pdf">Plan</a><img src="cover.png">
+<video><source src="clip"></video></body></html>"""
+
+
+@pytest.fixture(params=["selectolax", "html.parser"])
+def extract(request, monkeypatch):
+    if request.param == "selectolax" and W.SelectolaxParser is None:
+        pytest.skip("selectolax not installed")
+    if request.param == "html.parser":
+        monkeypatch.setattr(W, "SelectolaxParser", None)
+    return W.HtmlExtractor.extract
+
+
+def test_extract_keeps_visible_text_and_sorts_links(extract):
+    content = extract(PAGE, "http://example.test/index.html")
+    assert content["title"] == "The Story"
+    assert "Visible chapter text." in content["text"]
+    assert "Hidden spoiler" not in content["text"] and "var x" not in content["text"]
+    assert content["links"]["other"] == ["http://example.test/books/next.html"]
+    assert content["links"]["documents"] == ["http://example.test/files/plan.pdf"]
+    assert content["links"]["images"] == ["http://example.test/books/cover.png"]
+    assert content["links"]["videos"] == ["http://example.test/books/clip"]
+
+
+def test_extract_stops_at_the_budget(extract):
+    html = "<html><body>" + "".join(f"<p>paragraph {i}</p><a href='/p{i}'>x</a>" for i in range(50)) + "</body></html>"
+    content = extract(html, "http://example.test/", max_text_chars=40, max_links=5)
+    assert len(content["text"]) <= 40
+    assert len(content["links"]["other"]) == 5
+    assert content["truncated"]["text"] and content["truncated"]["other"]
+
+
+def test_empty_app_shell_looks_js_rendered():
+    shell = '<html><body><div id="root"></div><noscript>Enable JavaScript</noscript></body></html>'
+    assert W.HtmlExtractor.looks_js_rendered(shell, W.HtmlExtractor.extract(shell, "http://a.test/"), 200)
+    article = "<html><body>" + "<p>A long enough paragraph of article text.</p>" * 20 + "</body></html>"
+    assert not W.HtmlExtractor.looks_js_rendered(article, W.HtmlExtractor.extract(article, "http://a.test/"), 200)
+
+
+def test_http_runs_never_start_playwright(workdir, monkeypatch):
+    def no_playwright():
+        raise AssertionError("playwright started")
+
+    monkeypatch.setattr(W, "async_playwright", no_playwright)
+
+    async def page(request):
+        return html_page("Article", "A long enough paragraph of article text. " * 20)
+
+    async def run(mode):
+        async with serve({"/a": page}) as base:
+            core = W.ScrapeCore(W.ScrapeConfig(fetch_mode=mode, asset_processors=0, min_host_interval=0.0,
+                                               near_duplicate_distance=None, respect_robots=False))
+            await core.start()
+            try:
+                return await core.scrape_page(base + "/a"), core.pool
+            finally:
+                await core.close()
+
+    for mode in ("http", "auto"):
+        content, pool = asyncio.run(run(mode))
+        assert content["title"] == "Article"
+        assert pool is None
+
+
+class ScriptedPage:
+    # Stands in for the browser side of ContentExtractor: keeps the extracted text and links "in the page"
+    def __init__(self, text, links, truncated):
+        self.window = {}
+        self.text, self.links, self.truncated = text, links, truncated
+        self.calls = []
+
+    async def wait_for_function(self, script, timeout=None):
+        pass
+
+    async def evaluate(self, script, arg=None):
+        self.calls.append(script)
+        if script is W.ContentExtractor.EXTRACT_SCRIPT:
+            self.window.update(__scrapeExtractText=self.text, __scrapeExtractLinks=self.links)
+            return {"title": "Big", "textLength": len(self.text), "truncated": self.truncated,
+                    "linkCounts": {kind: len(urls) for kind, urls in self.links.items()}}
+        if script is W.ContentExtractor.CHUNK_SCRIPT:
+            key, start, size = arg
+            return self.window.get(key, "")[start:start + size]
+        if script is W.ContentExtractor.LINKS_SCRIPT:
+            kind, start, size = arg
+            return self.window["__scrapeExtractLinks"][kind][start:start + size]
+        if script is W.ContentExtractor.CLEAR_SCRIPT:
+            self.window.clear()
+            return None
+        raise AssertionError("unexpected script")
+
+
+def test_browser_extract_pages_text_and_links_out(monkeypatch):
+    monkeypatch.setattr(W.ContentExtractor, "LINK_CHUNK_SIZE", 3)
+    links = {"images": [f"http://a.test/{i}.png" for i in range(7)], "videos": [], "documents": [],
+             "other": ["http://a.test/next"]}
+    page = ScriptedPage("y" * 25, links, {"text": True, "images": True})
+    content = asyncio.run(W.ContentExtractor.extract_all(page, "http://a.test/", chunk_chars=10, main_content="off"))
+    assert content["text"] == "y" * 25
+    assert content["links"] == links
+    assert content["truncated"] == {"text": True, "images": True}
+    assert page.calls.count(W.ContentExtractor.CHUNK_SCRIPT) == 3
+    assert page.calls.count(W.ContentExtractor.LINKS_SCRIPT) == 4
+    assert page.calls[-1] is W.ContentExtractor.CLEAR_SCRIPT and not page.window
+
+
+def test_browser_extract_marks_what_it_cut(workdir):
+    from playwright.async_api import Error as PlaywrightError
+
+    html = "<html><body>" + "".join(f"<p>paragraph {i}</p><a href='http://a.test/p{i}'>x</a>"
+                                     f"<img src='http://a.test/i{i}.png'>" for i in range(50)) + "</body></html>"
+    core = W.ScrapeCore(W.ScrapeConfig(near_duplicate_distance=None))
+
+    async def run():
+        core.playwright = await W.async_playwright().start()
+        try:
+            browser = await core.launch_browser(core.config)
+            try:
+                page = await browser.new_page()
+                await page.set_content(html)
+                return await W.ContentExtractor.extract_all(page, "http://a.test/", max_text_chars=40, max_links=5,
+                                                            chunk_chars=7, main_content="off")
+            finally:
+                await browser.close()
+        except PlaywrightError as e:
+            if "Executable doesn't exist" not in str(e):
+                raise
+            return None
+        finally:
+            await core.close()
+
+    content = asyncio.run(run())
+    if content is None:
+        pytest.skip("Chromium is not installed")
+    assert len(content["text"]) <= 40
+    assert len(content["links"]["other"]) == len(content["links"]["images"]) == 5
+    assert content["truncated"] == {"text": True, "other": True, "images": True}
@@ -0,0 +1,109 @@
+import asyncio
+import glob
+import os
+from dataclasses import replace
+
+import webscrapping as W
+from fixture_site import html_page, serve
+
+
+def test_normalize_url_canonicalises_equivalent_forms():
+    assert W.normalize_url("HTTP://Example.COM:80/a/./b/../c?b=2&a=1#frag") == "http://example.com/a/c?a=1&b=2"
+    assert W.normalize_url("https://example.com") == "https://example.com/"
+    assert W.normalize_url("https://example.com:8443/x/") == "https://example.com:8443/x/"
+    assert W.normalize_url("mailto:someone@example.com") is None
+    assert W.normalize_url("http://[::1:bad") is None
+
+
+def test_bloom_filter_membership_survives_save_and_load(tmp_path):
+    bloom = W.BloomFilter(capacity=1000, error_rate=0.001)
+    for i in range(500):
+        bloom.add(f"http://example.com/{i}")
+    path = str(tmp_path / "seen.bloom")
+    bloom.save(path)
+    loaded = W.BloomFilter.load(path)
+    assert all(f"http://example.com/{i}" in loaded for i in range(500))
+    false_positives = sum(f"http://other.test/{i}" in loaded for i in range(10_000))
+    assert false_positives < 100
+
+
+def test_frontier_resumes_claimed_urls_and_expires_finished_ones(tmp_path):
+    path = str(tmp_path / "frontier.sqlite")
+    frontier = W.UrlFrontier(path, bloom_capacity=1000)
+    assert frontier.add("http://a.test/1", 0)
+    assert not frontier.add("http://a.test/1", 0)
+    frontier.add("http://a.test/2", 1)
+    assert frontier.pop() == ("http://a.test/1", 0)
+    frontier.close()
+
+    # A crashed run left a/1 in progress; reopening puts it back in the queue
+    frontier = W.UrlFrontier(path, bloom_capacity=1000)
+    assert frontier.pending() == 2
+    url, _ = frontier.pop()
+    frontier.finish(url)
+    assert frontier.expire(3600) == 0
+    assert frontier.expire(0) == 1
+    assert frontier.pending() == 2
+    frontier.close()
+
+
+def test_fetch_cache_keeps_links_for_unchanged_pages(tmp_path):
+    cache = W.FetchCache(str(tmp_path / "fetch_cache.sqlite"))
+    cache.record("http://a.test/", content_hash="abc", links=["http://a.test/next"])
+    cache.record("http://a.test/", content_hash="abc")
+    assert cache.links("http://a.test/") == ["http://a.test/next"]
+    assert cache.links("http://a.test/missing") == []
+    cache.close()
+
+
+def chain_site(pages):
+    def handler(i):
+        async def page(request):
+            links = [f"/p{i + 1}"] if i + 1 < pages else []
+            return html_page(f"Page {i}", f"Chapter {i} of the story.", links)
+        return page
+    return {f"/p{i}": handler(i) for i in range(pages)}
+
+
+def crawl_config():
+    return W.ScrapeConfig(fetch_mode="http", min_host_interval=0.0, asset_processors=0,
+                          near_duplicate_distance=None, concurrency=2)
+
+
+def test_repeated_crawls_follow_links_through_unchanged_pages(workdir):
+    def remove_frontier():
+        for path in glob.glob(os.path.join("output", "frontier.sqlite*")):
+            os.remove(path)
+
+    async def crawl(base, config):
+        return await W.ScrapeCore(config).crawl([base + "/p0"], W.CrawlScope(max_depth=10))
+
+    async def run():
+        async with serve(chain_site(5)) as base:
+            first = await crawl(base, crawl_config())
+            resumed = await crawl(base, crawl_config())
+            remove_frontier()
+            warm_cache = await crawl(base, crawl_config())
+            recrawl = await crawl(base, replace(crawl_config(), recrawl_after=0))
+        return first, resumed, warm_cache, recrawl
+
+    first, resumed, warm_cache, recrawl = asyncio.run(run())
+    assert (first.succeeded, first.unchanged) == (5, 0)
+    assert resumed.total == 0
+    assert (warm_cache.succeeded, warm_cache.unchanged) == (5, 5)
+    assert (recrawl.succeeded, recrawl.unchanged) == (5, 5)
+
+
+def test_frontier_writes_its_bloom_filter_only_on_close(tmp_path):
+    path = str(tmp_path / "frontier.sqlite")
+    frontier = W.UrlFrontier(path, bloom_capacity=10_000)
+    for i in range(2500):
+        frontier.add(f"http://a.test/{i}", 1)
+    assert not os.path.exists(path + ".bloom")
+    frontier.close()
+    assert os.path.exists(path + ".bloom")
+
+    reopened = W.UrlFrontier(path, bloom_capacity=10_000)
+    assert not reopened.add("http://a.test/2499", 1)
+    assert reopened.pending() == 2500
+    reopened.close()
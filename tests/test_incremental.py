@@ -0,0 +1,34 @@
+import asyncio
+
+import webscrapping as W
+from fake_browser import FakePage, make_core
+
+
+def test_browser_pages_are_compared_by_extracted_content(workdir, monkeypatch):
+    # Every visit gets the same script-rendered shell; only the extracted text changes
+    texts = iter(["first version", "second version", "second version"])
+
+    async def extract_all(page, base_url, *args):
+        return {"title": "App", "url": base_url, "text": next(texts), "links": {"other": ["http://example.test/next"]}}
+
+    async def no_captcha(page, capsolver):
+        return False
+
+    monkeypatch.setattr(FakePage, "respond", True)
+    monkeypatch.setattr(W.ContentExtractor, "extract_all", staticmethod(extract_all))
+    monkeypatch.setattr(W.DynamicCaptchaDetector, "detect_and_solve", staticmethod(no_captcha))
+    core, _ = make_core(output_format="jsonl")
+
+    async def run():
+        await core.pool.start()
+        core.sink = W.make_sink(core.config, core.output_dir)
+        core.downloader = W.AssetDownloader(core, core.config)
+        try:
+            return [await core.scrape_browser("http://example.test/") for _ in range(3)]
+        finally:
+            core.sink.close()
+
+    first, second, third = asyncio.run(run())
+    assert not first.get("unchanged")
+    assert second["text"] == "second version" and not second.get("unchanged")
+    assert third == {"url": "http://example.test/", "unchanged": True, "links": {"other": ["http://example.test/next"]}}
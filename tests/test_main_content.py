@@ -0,0 +1,30 @@
+import webscrapping as W
+
+
+ARTICLE = " ".join(["The conductor found the compartment locked from the inside, and the snow had stopped the train."] * 6)
+
+PAGE = f"""<html><body>
+<header><a href="/">Home</a> <a href="/news">News</a> <a href="/sport">Sport</a></header>
+<nav class="menu"><ul><li><a href="/a">Section A</a></li><li><a href="/b">Section B</a></li></ul></nav>
+<div id="sidebar"><p>Related: ten trains you must ride, and a sponsored travel offer.</p></div>
+<article class="post"><h1>Murder on the train</h1><p>{ARTICLE}</p><p>{ARTICLE}</p></article>
+<div class="comments"><p>Great read, thanks for sharing this story with us!</p></div>
+<footer><p>Copyright and cookie consent text.</p></footer>
+</body></html>"""
+
+
+def test_main_content_keeps_the_article_and_drops_the_chrome():
+    main = W.MainContentExtractor.extract(PAGE)
+    assert "compartment locked from the inside" in main
+    for boilerplate in ("Section A", "sponsored", "Great read", "Copyright"):
+        assert boilerplate not in main
+
+
+def test_main_content_respects_the_character_budget():
+    assert len(W.MainContentExtractor.extract(PAGE, max_chars=100)) <= 100
+
+
+def test_negative_labels_and_boilerplate_tags_weigh_against_a_block():
+    assert W.MainContentExtractor.weight("article", {"class": "post"}) > 0
+    assert W.MainContentExtractor.weight("div", {"id": "sidebar"}) < 0
+    assert W.MainContentExtractor.weight("footer", {}) < 0
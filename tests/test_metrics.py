@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def test_prometheus_text_has_counters_gauges_and_histograms():
+    metrics = W.Metrics(prefix="t")
+    metrics.inc("pages_total", outcome="ok")
+    metrics.inc("pages_total", 2, outcome="ok")
+    metrics.set_gauge("in_flight", 3)
+    metrics.observe("goto", 0.2)
+    text = metrics.render_prometheus()
+    assert 't_pages_total{outcome="ok"} 3' in text
+    assert "t_in_flight 3" in text
+    assert 't_stage_seconds_bucket{stage="goto",le="0.25"} 1' in text
+    assert 't_stage_seconds_bucket{stage="goto",le="0.1"} 0' in text
+    assert 't_stage_seconds_count{stage="goto"} 1' in text
+
+
+def test_asset_downloads_are_traced_as_spans_of_their_page(workdir):
+    async def page(request):
+        return web.Response(text='<html><head><title>Gallery</title></head><body><p>Pictures.</p>'
+                                 '<img src="/a.png"><img src="/b.png"></body></html>', content_type="text/html")
+
+    async def image(request):
+        return web.Response(body=PNG + request.path.encode(), content_type="image/png")
+
+    async def run():
+        async with serve({"/": page, "/a.png": image, "/b.png": image}) as base:
+            config = W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                    near_duplicate_distance=None, trace_file="trace.jsonl")
+            return await W.ScrapeCore(config).scrape_batch([base + "/"])
+
+    stats = asyncio.run(run())
+    assert stats.assets_downloaded == 2
+    with open("trace.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    pages = [r for r in records if r["span"] == "page"]
+    downloads = [r for r in records if r["span"] == "download"]
+    assert len(pages) == 1 and len(downloads) == 2
+    assert all(r["trace_id"] == pages[0]["trace_id"] and r["outcome"] == "ok" for r in downloads)
+    assert all(any(stage["stage"] == "download" for stage in r["stages"]) for r in downloads)
@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+
+import aiohttp
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+DATA = b"%PDF-1.4\n" + bytes(range(256)) * 400
+
+
+def range_site(tmp_path, headers=None, ignore_range=False):
+    # Serves DATA at /file.pdf with HEAD, Range and If-Range support; records each GET's Range header
+    path = tmp_path / "file.pdf"
+    path.write_bytes(DATA)
+    ranges = []
+
+    async def handler(request):
+        if request.method == "GET":
+            ranges.append(request.headers.get("Range"))
+        if ignore_range and request.method == "GET":
+            return web.Response(body=DATA, content_type="application/pdf")
+        return web.FileResponse(path, headers=headers or {})
+
+    return {"/file.pdf": handler}, ranges
+
+
+def run_download(tmp_path, routes, segments=1, threshold=1 << 30, prepare=None):
+    async def run():
+        async with serve(routes) as base:
+            url = base + "/file.pdf"
+            async with aiohttp.ClientSession() as session:
+                ranges = W.RangeDownloader(session, str(tmp_path / "partial"), segments, threshold)
+                if prepare is not None:
+                    async with session.head(url) as response:
+                        await asyncio.to_thread(prepare, ranges.partial_path(url), response.headers)
+                meta = {}
+                target = tmp_path / "out.pdf"
+                result = await ranges.download(url, str(target), None, meta, None)
+                body = target.read_bytes() if target.exists() else None
+                return result, meta, body
+
+    return asyncio.run(run())
+
+
+def partial(length, etag_override=None):
+    def prepare(part_path, headers):
+        with open(part_path, "wb") as f:
+            f.write(DATA[:length] if etag_override is None else b"x" * length)
+        with open(f"{part_path}.json", "w") as f:
+            json.dump({"etag": etag_override or headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                       "total": len(DATA), "segments": 1}, f)
+    return prepare
+
+
+def test_truncated_download_resumes_from_the_partial_file(tmp_path):
+    routes, ranges = range_site(tmp_path)
+    result, meta, body = run_download(tmp_path, routes, prepare=partial(40_000))
+    assert result is True and body == DATA
+    assert ranges == ["bytes=40000-"]
+    assert meta["checksum"] == "unverified"
+
+
+def test_changed_validators_discard_the_partial_file(tmp_path):
+    routes, ranges = range_site(tmp_path)
+    result, _, body = run_download(tmp_path, routes, prepare=partial(40_000, etag_override='"old"'))
+    assert result is True and body == DATA
+    assert ranges == [None]
+
+
+def test_large_files_are_fetched_in_segments_and_assembled(tmp_path):
+    routes, ranges = range_site(tmp_path)
+    result, _, body = run_download(tmp_path, routes, segments=4, threshold=1024)
+    assert result is True and body == DATA
+    assert len(ranges) == 4 and all(r.startswith("bytes=") for r in ranges)
+    assert os.listdir(tmp_path / "partial") == []
+
+
+def test_a_server_that_ignores_range_restarts_the_file(tmp_path):
+    routes, ranges = range_site(tmp_path, ignore_range=True)
+    result, _, body = run_download(tmp_path, routes, prepare=partial(40_000))
+    assert result is True and body == DATA
+    assert ranges == ["bytes=40000-"]
+
+
+def test_digest_headers_are_verified(tmp_path):
+    sha256 = base64.b64encode(hashlib.sha256(DATA).digest()).decode()
+    routes, _ = range_site(tmp_path, headers={"Repr-Digest": f"sha-256=:{sha256}:"})
+    result, meta, _ = run_download(tmp_path, routes)
+    assert result is True and meta["checksum"] == "sha-256"
+
+    wrong = base64.b64encode(hashlib.md5(b"something else").digest()).decode()
+    routes, _ = range_site(tmp_path, headers={"Digest": f"md5={wrong}"})
+    result, meta, _ = run_download(tmp_path, routes)
+    assert result is False
+    assert meta["rejected"] == "size or checksum mismatch"
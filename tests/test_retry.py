@@ -0,0 +1,148 @@
+import asyncio
+import socket
+import time
+
+import aiohttp
+from aiohttp import web
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+import webscrapping as W
+from fixture_site import html_page, serve
+
+
+def test_classify_error_maps_failures_to_classes():
+    assert W.classify_error(W.HttpStatusError(429, "u")) == "throttled"
+    assert W.classify_error(W.HttpStatusError(503, "u")) == "throttled"
+    assert W.classify_error(W.HttpStatusError(502, "u")) == "server"
+    assert W.classify_error(W.HttpStatusError(403, "u")) == "blocked"
+    assert W.classify_error(W.HttpStatusError(404, "u")) == "client"
+    assert W.classify_error(asyncio.TimeoutError()) == "timeout"
+    assert W.classify_error(PlaywrightTimeoutError("Timeout 30000ms exceeded")) == "timeout"
+    assert W.classify_error(PlaywrightError("net::ERR_NAME_NOT_RESOLVED at http://x")) == "dns"
+    assert W.classify_error(PlaywrightError("net::ERR_CERT_AUTHORITY_INVALID")) == "tls"
+    assert W.classify_error(PlaywrightError("Target closed")) == "browser"
+    assert W.classify_error(socket.gaierror()) == "dns"
+    assert W.classify_error(aiohttp.ServerDisconnectedError()) == "connect"
+    assert W.classify_error(W.CircuitOpenError("open")) == "circuit_open"
+    assert W.classify_error(W.RobotsDisallowed()) == "robots"
+    assert W.classify_error(ValueError()) == "other"
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert W.parse_retry_after("120") == 120.0
+    assert W.parse_retry_after(None) is None
+    assert W.parse_retry_after("soon") is None
+    future = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert 55 <= W.parse_retry_after(future) <= 61
+
+
+def test_circuit_breaker_opens_after_threshold_and_half_opens():
+    breaker = W.CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.failures == 0
+
+
+def test_retry_backoff_is_reported_for_the_host():
+    engine = W.RetryEngine(W.RetryPolicy(base_delay=0.0))
+    deferred = []
+    calls = []
+
+    async def on_backoff(url, delay):
+        deferred.append((url, delay))
+
+    async def operation():
+        calls.append(1)
+        if len(calls) == 1:
+            raise W.HttpStatusError(429, "http://a.test/", retry_after="0")
+        return "ok"
+
+    engine.on_backoff = on_backoff
+    assert asyncio.run(engine.run("http://a.test/", operation)) == "ok"
+    assert deferred == [("http://a.test/", 0.0)]
+
+
+def test_deferring_a_host_marks_it_busy():
+    scheduler = W.HostScheduler(W.ScrapeConfig(respect_robots=False), None)
+    asyncio.run(scheduler.defer("http://a.test/page", 30.0))
+    assert "a.test" in asyncio.run(scheduler.busy_hosts())
+
+
+def test_retries_keep_the_crawl_delay(workdir):
+    hits = []
+
+    async def robots(request):
+        return web.Response(text="User-agent: *\nCrawl-delay: 1\n")
+
+    async def flaky(request):
+        hits.append(time.monotonic())
+        if len(hits) < 3:
+            return web.Response(status=502)
+        return html_page("Flaky", "Finally served.")
+
+    async def run():
+        async with serve({"/robots.txt": robots, "/flaky": flaky}) as base:
+            core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                               near_duplicate_distance=None))
+            core.retry.policy.base_delay = 0.01
+            await core.start()
+            try:
+                return await core.scrape_page(base + "/flaky")
+            finally:
+                await core.close()
+
+    content = asyncio.run(run())
+    assert content["title"] == "Flaky"
+    gaps = [later - earlier for earlier, later in zip(hits, hits[1:])]
+    assert len(gaps) == 2
+    assert min(gaps) >= 0.95
+
+
+def outage_site(failures):
+    # The first `failures` requests to the host fail with 502, everything after succeeds
+    hits = []
+
+    def handler(i):
+        async def page(request):
+            hits.append(i)
+            if len(hits) <= failures:
+                return web.Response(status=502)
+            return html_page(f"Page {i}", f"Page number {i}.")
+        return page
+    return {f"/p{i}": handler(i) for i in range(4)}
+
+
+def outage_core():
+    core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                       near_duplicate_distance=None, respect_robots=False))
+    core.retry.policy.base_delay = 0.01
+    core.retry.policy.breaker_threshold = 2
+    core.retry.policy.breaker_cooldown = 0.3
+    return core
+
+
+def test_crawl_defers_urls_while_the_circuit_is_open(workdir):
+    async def run():
+        async with serve(outage_site(2)) as base:
+            return await outage_core().crawl([f"{base}/p{i}" for i in range(4)], W.CrawlScope(max_depth=0))
+
+    stats = asyncio.run(run())
+    assert (stats.total, stats.succeeded, stats.failed) == (4, 4, 0)
+    frontier = W.UrlFrontier("output/frontier.sqlite")
+    assert frontier.db.execute("SELECT COUNT(*) FROM frontier WHERE status = 'done'").fetchone()[0] == 4
+    frontier.close()
+
+
+def test_batch_retries_urls_after_the_circuit_reopens(workdir):
+    async def run():
+        async with serve(outage_site(2)) as base:
+            return await outage_core().scrape_batch([f"{base}/p{i}" for i in range(4)])
+
+    stats = asyncio.run(run())
+    assert (stats.succeeded, stats.failed) == (4, 0)
+    assert not (workdir / "output" / "dead_letter.jsonl").exists()
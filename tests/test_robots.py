@@ -0,0 +1,56 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+ROBOTS = """User-agent: *
+Disallow: /private/
+Crawl-delay: 120
+Sitemap: {base}/sitemap.xml
+"""
+
+
+def check(robots_text, urls, **config):
+    async def robots(request):
+        if robots_text is None:
+            return web.Response(status=404)
+        return web.Response(text=robots_text.format(base=request.url.origin()))
+
+    async def run():
+        async with serve({"/robots.txt": robots}) as base:
+            async with aiohttp.ClientSession() as session:
+                scheduler = W.HostScheduler(W.ScrapeConfig(**dict(dict(min_host_interval=0.5), **config)), session)
+                allowed = [await scheduler.allowed(base + url) for url in urls]
+                host = base.split("//", 1)[1]
+                return allowed, scheduler.intervals[host], scheduler.robots[host][0]
+
+    return asyncio.run(run())
+
+
+def test_disallowed_paths_are_refused_and_crawl_delay_is_capped():
+    allowed, interval, parser = check(ROBOTS, ["/", "/private/x"], max_crawl_delay=10.0)
+    assert allowed == [True, False]
+    assert interval == 10.0
+    assert parser.site_maps()[0].endswith("/sitemap.xml")
+
+
+def test_request_rate_sets_the_interval_when_there_is_no_crawl_delay():
+    allowed, interval, _ = check("User-agent: *\nRequest-rate: 1/4\n", ["/"])
+    assert allowed == [True]
+    assert interval == 4.0
+
+
+def test_missing_robots_allows_everything_at_the_minimum_interval():
+    allowed, interval, parser = check(None, ["/", "/private/x"])
+    assert allowed == [True, True]
+    assert interval == 0.5
+    assert parser is None
+
+
+def test_robots_can_be_ignored():
+    scheduler = W.HostScheduler(W.ScrapeConfig(respect_robots=False), None)
+    assert asyncio.run(scheduler.allowed("http://a.test/private/x"))
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import os
+import socket
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import html_page, serve
+
+
+def make_service():
+    return W.ScrapeService(W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                          respect_robots=False, output_format="jsonl"))
+
+
+async def serve_service(service):
+    runner = web.AppRunner(service.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def test_submit_rejects_json_that_is_not_an_object(workdir):
+    async def run():
+        service = make_service()
+        runner, base = await serve_service(service)
+        try:
+            async with aiohttp.ClientSession() as session:
+                for body in ([], "x", 3):
+                    async with session.post(f"{base}/jobs", json=body) as response:
+                        assert response.status == 400
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_job_results_keep_status_and_output_not_content(workdir):
+    async def page(request):
+        return html_page("Story", "plot " * 200)
+
+    async def run():
+        service = make_service()
+        async with serve({"/story": page}) as site:
+            await service.core.start()
+            service.workers = [asyncio.create_task(service.worker())]
+            runner, base = await serve_service(service)
+            try:
+                async with aiohttp.ClientSession() as session:
+                    urls = [f"{site}/story", f"{site}/missing"]
+                    async with session.post(f"{base}/jobs", json={"urls": urls}) as response:
+                        job_id = (await response.json())["id"]
+                    async with session.get(f"{base}/jobs/{job_id}/results") as response:
+                        streamed = [json.loads(line) for line in (await response.text()).splitlines()]
+            finally:
+                for worker in service.workers:
+                    worker.cancel()
+                await runner.cleanup()
+                await service.core.close()
+        return service.jobs[job_id].results, streamed
+
+    results, streamed = asyncio.run(run())
+    assert streamed == results
+    by_status = {entry["status"]: entry for entry in results}
+    assert set(by_status) == {"ok", "failed"}
+    assert by_status["ok"]["title"] == "Story"
+    assert os.path.exists(by_status["ok"]["output"])
+    assert "text" not in by_status["ok"] and "html" not in by_status["ok"]
+    assert by_status["failed"]["url"].endswith("/missing")
+
+
+def test_stale_socket_is_removed_but_a_live_one_is_kept(tmp_path):
+    path = str(tmp_path / "service.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    with pytest.raises(RuntimeError):
+        W.ScrapeService.remove_stale_socket(path)
+    server.close()
+    assert os.path.exists(path)
+
+    W.ScrapeService.remove_stale_socket(path)
+    assert not os.path.exists(path)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+
+import webscrapping as W
+from fixture_site import html_page, serve
+
+
+STORY = " ".join(f"word{i}" for i in range(120))
+
+
+def test_shared_near_duplicate_index_sees_other_processes_pages(tmp_path):
+    path = str(tmp_path / "near_duplicates.sqlite")
+    first = W.NearDuplicateIndex(path, shared=True)
+    second = W.NearDuplicateIndex(path, shared=True)
+    fingerprint = W.NearDuplicateIndex.fingerprint(STORY)
+    assert first.check("http://a.test/1", fingerprint) is None
+    assert second.check("http://b.test/1", fingerprint ^ 1) == "http://a.test/1"
+    first.close()
+    second.close()
+
+    # A later single-process run reads the same bands back
+    local = W.NearDuplicateIndex(path)
+    assert local.check("http://c.test/1", fingerprint ^ 2) == "http://a.test/1"
+    local.close()
+
+
+def test_host_leases_follow_the_adaptive_host_limit(tmp_path):
+    config = W.ScrapeConfig(respect_robots=False, adaptive_concurrency=True, host_concurrency=4,
+                            adaptive_max_per_host=8, min_host_interval=0.0)
+    leases = W.HostLeases(str(tmp_path / "frontier.sqlite"), 0)
+    scheduler = W.HostScheduler(config, None, leases)
+    scheduler.page_limits.host("a.test").limit = 1.0
+
+    async def run():
+        async with scheduler.slot("http://a.test/1"):
+            busy = await scheduler.busy_hosts()
+            second, _ = await asyncio.to_thread(leases.try_acquire, "a.test", scheduler.host_cap("a.test"), 0.0)
+            return busy, second
+
+    busy, second = asyncio.run(run())
+    assert "a.test" in busy
+    assert second is None
+    leases.close()
+
+
+def append_many(path, marker):
+    for _ in range(50):
+        W.append_lines(path, [json.dumps({"marker": marker, "padding": marker * 20_000})])
+
+
+def test_appended_lines_stay_whole_across_processes(tmp_path):
+    path = str(tmp_path / "dead_letter.jsonl")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=append_many, args=(path, marker)) for marker in "abcd"]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 200
+    assert all(record["padding"] == record["marker"] * 20_000 for record in records)
+
+
+def test_sharded_batch_scrapes_every_url_once(workdir):
+    async def page(request):
+        return html_page(f"Page {request.match_info['n']}", f"Chapter {request.match_info['n']}.")
+
+    async def run():
+        async with serve({"/p/{n}": page}) as base:
+            config = W.ScrapeConfig(fetch_mode="http", min_host_interval=0.0, asset_processors=0,
+                                    near_duplicate_distance=None, respect_robots=False, concurrency=2)
+            urls = [f"{base}/p/{i}" for i in range(8)]
+            return await asyncio.to_thread(W.ShardSupervisor(config, 2).run, urls)
+
+    stats = asyncio.run(run())
+    assert stats.total == 8
+    assert stats.succeeded == 8
+
+
+def scrape_while_blocked(core, base, unblock):
+    # Scrapes one page while unblock() runs 0.5 s later in another thread; returns how often a
+    # 10 ms ticker got to run meanwhile, which is near zero if the event loop was held
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        await core.start()
+        tick_task = asyncio.create_task(ticker())
+        timer = threading.Timer(0.5, unblock)
+        timer.start()
+        try:
+            content = await core.scrape_page(base + "/page")
+        finally:
+            tick_task.cancel()
+            timer.join()
+            await core.close()
+        return content, ticks
+
+    return asyncio.run(run())
+
+
+def page_site():
+    async def page(request):
+        return html_page("Page", "Some words about the train.")
+    return serve({"/page": page})
+
+
+def test_a_locked_fetch_cache_does_not_hold_the_event_loop(workdir):
+    async def run():
+        async with page_site() as base:
+            core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                               near_duplicate_distance=None, respect_robots=False))
+            other = sqlite3.connect(os.path.join("output", "fetch_cache.sqlite"), isolation_level=None,
+                                    check_same_thread=False)
+            other.execute("BEGIN EXCLUSIVE")
+            try:
+                return await asyncio.to_thread(scrape_while_blocked, core, base, lambda: other.execute("COMMIT"))
+            finally:
+                other.close()
+
+    content, ticks = asyncio.run(run())
+    assert content["title"] == "Page"
+    assert ticks >= 20
+
+
+def test_a_full_shard_queue_does_not_hold_the_event_loop(workdir):
+    records = multiprocessing.get_context("spawn").Queue(maxsize=1)
+    records.put({"url": "http://other.test/"})
+
+    async def run():
+        async with page_site() as base:
+            core = W.ScrapeCore(W.ScrapeConfig(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                               near_duplicate_distance=None, respect_robots=False),
+                                sink=W.QueueSink(records))
+            return await asyncio.to_thread(scrape_while_blocked, core, base, records.get)
+
+    content, ticks = asyncio.run(run())
+    assert ticks >= 20
+    assert records.get(timeout=5)["url"] == content["url"]
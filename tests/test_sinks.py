@@ -0,0 +1,70 @@
+import glob
+import json
+import os
+
+import pytest
+
+import webscrapping as W
+
+
+def records(count):
+    return [{"url": f"http://a.test/{i}", "title": f"page {i}", "text": "x" * 200,
+             "links": {"images": [f"http://a.test/{i}.png"]}} for i in range(count)]
+
+
+def test_jsonl_flushes_in_batches_and_on_close(tmp_path):
+    sink = W.JsonlSink(str(tmp_path), rotate_bytes=1 << 30, rotate_seconds=3600, flush_records=3, flush_seconds=3600)
+    for record in records(2):
+        sink.write(record)
+    path = sink.location({})
+    assert os.path.getsize(path) == 0
+    sink.write(records(3)[2])
+    assert os.path.getsize(path) > 0
+    sink.write(records(4)[3])
+    sink.close()
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["url"] for line in f] == [r["url"] for r in records(4)]
+
+
+def test_jsonl_rotates_past_the_size_limit(tmp_path):
+    sink = W.JsonlSink(str(tmp_path), rotate_bytes=1000, rotate_seconds=3600, flush_records=1)
+    for record in records(12):
+        sink.write(record)
+    sink.close()
+    files = sorted(glob.glob(str(tmp_path / "pages-*.jsonl")))
+    assert len(files) > 1
+    urls = []
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            urls += [json.loads(line)["url"] for line in f]
+    assert urls == [r["url"] for r in records(12)]
+
+
+def test_zstd_jsonl_rotates_into_complete_frames(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    sink = W.JsonlSink(str(tmp_path), rotate_bytes=300, rotate_seconds=3600, compression="zstd", flush_records=2)
+    for record in records(12):
+        sink.write(record)
+    sink.close()
+    files = sorted(glob.glob(str(tmp_path / "pages-*.jsonl.zst")))
+    assert len(files) > 1
+    urls = []
+    for path in files:
+        with open(path, "rb") as f:
+            text = zstandard.ZstdDecompressor().stream_reader(f).read().decode("utf-8")
+        urls += [json.loads(line)["url"] for line in text.splitlines()]
+    assert urls == [r["url"] for r in records(12)]
+
+
+def test_parquet_rotates_and_publishes_finished_files(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    sink = W.ParquetSink(str(tmp_path), rotate_bytes=1 << 30, rotate_seconds=0, batch_size=4)
+    for record in records(10):
+        sink.write(record)
+    sink.close()
+    assert not glob.glob(str(tmp_path / "*.inprogress"))
+    files = sorted(glob.glob(str(tmp_path / "pages-*.parquet")))
+    assert len(files) == 3
+    rows = [row for path in files for row in pq.read_table(path).to_pylist()]
+    assert [row["url"] for row in rows] == [r["url"] for r in records(10)]
+    assert rows[0]["images"] == ["http://a.test/0.png"]
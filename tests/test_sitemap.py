@@ -0,0 +1,105 @@
+import asyncio
+import gzip
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+def utc(*parts):
+    return datetime(*parts, tzinfo=timezone.utc).timestamp()
+
+
+def test_parse_lastmod_accepts_every_w3c_precision():
+    parse = W.SitemapDiscovery.parse_lastmod
+    assert parse("2024-03-05T10:20:30Z") == utc(2024, 3, 5, 10, 20, 30)
+    assert parse("2024-03-05T10:20:30.5z") == utc(2024, 3, 5, 10, 20, 30) + 0.5
+    assert parse("2024-03-05T12:20:30+02:00") == utc(2024, 3, 5, 10, 20, 30)
+    assert parse(" 2024-03-05 ") == utc(2024, 3, 5)
+    assert parse("2024-03") == utc(2024, 3, 1)
+    assert parse("2024") == utc(2024, 1, 1)
+    assert parse("last week") is None
+    assert parse("") is None and parse(None) is None
+
+
+def urlset(*entries):
+    urls = "".join(f"<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>" for loc, lastmod in entries)
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+
+def test_discover_follows_indexes_and_gzip_and_orders_by_lastmod(workdir):
+    async def robots(request):
+        return web.Response(text=f"Sitemap: {request.url.origin()}/index.xml\n")
+
+    async def index(request):
+        return web.Response(text=(
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            "<sitemap><loc>/pages.xml</loc></sitemap><sitemap><loc>/old.xml.gz</loc></sitemap></sitemapindex>"
+        ), content_type="application/xml")
+
+    async def pages(request):
+        origin = request.url.origin()
+        return web.Response(text=urlset((f"{origin}/new", "2024-06-01T00:00:00Z"), (f"{origin}/mid", "2024-03")),
+                            content_type="application/xml")
+
+    async def old(request):
+        origin = request.url.origin()
+        return web.Response(body=gzip.compress(urlset((f"{origin}/old", "2019")).encode()),
+                            content_type="application/octet-stream")
+
+    async def run():
+        async with serve({"/robots.txt": robots, "/index.xml": index, "/pages.xml": pages, "/old.xml.gz": old}) as base:
+            config = W.ScrapeConfig(min_host_interval=0.0)
+            urls = await W.SitemapDiscovery.collect(config, [base + "/"])
+            return base, urls
+
+    base, urls = asyncio.run(run())
+    assert urls == [f"{base}/new", f"{base}/mid", f"{base}/old"]
+
+
+def test_a_corrupt_gzip_sitemap_is_skipped(workdir):
+    async def robots(request):
+        origin = request.url.origin()
+        return web.Response(text=f"Sitemap: {origin}/broken.xml.gz\nSitemap: {origin}/pages.xml\n")
+
+    async def broken(request):
+        return web.Response(body=b"\x1f\x8b\x08\x00" + b"not really gzip" * 10, content_type="application/octet-stream")
+
+    async def pages(request):
+        return web.Response(text=urlset((f"{request.url.origin()}/kept", "2024")), content_type="application/xml")
+
+    async def run():
+        async with serve({"/robots.txt": robots, "/broken.xml.gz": broken, "/pages.xml": pages}) as base:
+            return base, await W.SitemapDiscovery.collect(W.ScrapeConfig(min_host_interval=0.0), [base + "/"])
+
+    base, urls = asyncio.run(run())
+    assert urls == [f"{base}/kept"]
+
+
+def test_sitemap_requests_keep_the_host_interval(workdir):
+    hits = []
+
+    async def index(request):
+        hits.append(time.monotonic())
+        children = "".join(f"<sitemap><loc>/part{i}.xml</loc></sitemap>" for i in range(3))
+        return web.Response(text=f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{children}</sitemapindex>',
+                            content_type="application/xml")
+
+    async def part(request):
+        hits.append(time.monotonic())
+        return web.Response(text=urlset((f"{request.url.origin()}{request.path}.html", "2024")), content_type="application/xml")
+
+    async def run():
+        routes = {"/index.xml": index}
+        routes.update({f"/part{i}.xml": part for i in range(3)})
+        async with serve(routes) as base:
+            return await W.SitemapDiscovery.collect(W.ScrapeConfig(min_host_interval=0.3, respect_robots=False),
+                                                    [base + "/index.xml"])
+
+    urls = asyncio.run(run())
+    assert len(urls) == 3
+    gaps = [b - a for a, b in zip(hits, hits[1:])]
+    assert len(gaps) == 3 and min(gaps) >= 0.28
@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import os
+
+import webscrapping as W
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def stream(chunks, path, max_bytes=None):
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    meta = {}
+    result = asyncio.run(W.stream_to_file(source(), str(path), max_bytes, meta))
+    return result, meta
+
+
+def test_sniff_mime_reads_magic_bytes_not_names():
+    assert W.sniff_mime(PNG) == "image/png"
+    assert W.sniff_mime(b"%PDF-1.7\n") == "application/pdf"
+    assert W.sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert W.sniff_mime(b"  <?xml version='1.0'?><svg xmlns='http://www.w3.org/2000/svg'>") == "image/svg+xml"
+    assert W.sniff_mime(b"\n<!DOCTYPE html><html>") == "text/html"
+    assert W.sniff_mime(b"plain bytes") is None
+
+
+def test_precheck_rejects_html_and_oversized_responses():
+    meta = {}
+    assert not W.precheck_response({"Content-Type": "text/html; charset=utf-8"}, None, meta)
+    assert meta["rejected"] == "html content type"
+    meta = {}
+    assert not W.precheck_response({"content-length": "2048"}, 1024, meta)
+    assert meta["rejected"].startswith("content length 2048")
+    assert W.precheck_response({"Content-Type": "image/png", "Content-Length": "512"}, 1024, {})
+
+
+def test_stream_to_file_writes_atomically_and_hashes(tmp_path):
+    target = tmp_path / "image.png"
+    result, meta = stream([PNG[:10], PNG[10:]], target)
+    assert result is True
+    assert target.read_bytes() == PNG
+    assert meta["sha256"] == hashlib.sha256(PNG).hexdigest()
+    assert (meta["size"], meta["mime"]) == (len(PNG), "image/png")
+    assert os.listdir(tmp_path) == ["image.png"]
+
+
+def test_stream_to_file_leaves_nothing_behind_when_it_rejects(tmp_path):
+    target = tmp_path / "asset.bin"
+    result, meta = stream([b"<html><body>Not found</body></html>"], target)
+    assert result is False and meta["rejected"] == "html body"
+    result, meta = stream([PNG, PNG], target, max_bytes=len(PNG) + 1)
+    assert result is False and meta["rejected"].startswith("body over")
+    result, meta = stream([b""], target)
+    assert result is False and meta["rejected"] == "empty body"
+    assert os.listdir(tmp_path) == []
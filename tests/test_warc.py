@@ -0,0 +1,55 @@
+import asyncio
+
+from aiohttp import web
+
+import webscrapping as W
+from fixture_site import serve
+
+
+def test_archive_round_trips_responses_by_requested_and_final_url(tmp_path):
+    archive = W.WarcArchive(str(tmp_path / "warc"))
+    body = "<html><body>café</body></html>".encode("utf-8")
+    archive.write("http://a.test/old", "http://a.test/new/", 200, "OK",
+                  {"Content-Type": "text/html; charset=utf-8", "Content-Encoding": "gzip"}, body)
+    for url in ("http://a.test/old", "http://a.test/new/"):
+        status, headers, stored, final_url = archive.read(url)
+        assert (status, stored, final_url) == (200, body, "http://a.test/new/")
+        assert headers["Content-Type"] == "text/html; charset=utf-8"
+        assert "Content-Encoding" not in headers
+    assert archive.read("http://a.test/missing") is None
+    assert set(archive.urls()) == {"http://a.test/old", "http://a.test/new/"}
+    archive.close()
+
+
+def test_replay_resolves_links_against_the_redirect_target(workdir):
+    async def old(request):
+        raise web.HTTPFound("/articles/story.html")
+
+    async def story(request):
+        return web.Response(text='<html><head><title>Story</title></head><body><p>Once upon a time.</p>'
+                                 '<a href="next.html">next</a></body></html>', content_type="text/html")
+
+    def config(**overrides):
+        return W.ScrapeConfig(**dict(dict(fetch_mode="http", asset_processors=0, min_host_interval=0.0,
+                                          near_duplicate_distance=None, skip_unchanged_pages=False), **overrides))
+
+    async def scrape(config, url):
+        core = W.ScrapeCore(config)
+        await core.start()
+        try:
+            return await core.scrape_page(url)
+        finally:
+            await core.close()
+            if core.archive is not None:
+                core.archive.close()
+
+    async def run():
+        async with serve({"/old": old, "/articles/story.html": story}) as base:
+            live = await scrape(config(archive=True), base + "/old")
+        replayed = await scrape(config(replay=True), base + "/old")
+        return base, live, replayed
+
+    base, live, replayed = asyncio.run(run())
+    assert live["links"]["other"] == [base + "/articles/next.html"]
+    assert replayed["links"] == live["links"]
+    assert replayed["text"] == live["text"]
@@ -4,13 +4,38 @@ import random
 import time
 import re
 import os
+import sys
 import uuid
-from urllib.parse import urlparse, urljoin
-from typing import Dict, List, Optional
-from dataclasses import dataclass
-from playwright.async_api import async_playwright, Page, BrowserContext, Browser, Request, Response
+import base64
+import hashlib
+import gzip
+import sqlite3
+import queue
+import threading
+import mmap
+import zlib
+import multiprocessing
+from html.parser import HTMLParser
+import argparse
+import socket
+import stat
+import signal
+import contextvars
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from xml.etree import ElementTree
+import math
+import posixpath
+from urllib.parse import urlparse, urljoin, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from dataclasses import dataclass, field, replace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from playwright.async_api import async_playwright, Page, BrowserContext, Browser, Request, Response, Route
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 import aiohttp
-from aiohttp import ClientSession
+from aiohttp import ClientSession, web
 import logging
 
 # Optional: pip install curl-cffi
@@ -19,6 +44,39 @@ try:
 except ImportError:
     AsyncSession = None
 
+# Optional: pip install psutil (enables the browser memory ceiling)
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Optional: pip install selectolax (fast parser for the HTTP fetch path)
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+# Optional: pip install zstandard (compressed JSONL output)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Optional: pip install Pillow (image dimensions, EXIF and perceptual hashes in the asset manifest)
+try:
+    from PIL import Image as PILImage, ExifTags
+except ImportError:
+    PILImage = None
+    ExifTags = None
+
+# Optional: pip install pyarrow (Parquet output)
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+    pq = None
+
 logging.basicConfig(level=logging.ERROR)
 
 CAPSOLVER_API_KEY = "YOUR_KEY"
@@ -35,7 +93,560 @@ class ScrapeConfig:
     viewport_width: int = 1920
     viewport_height: int = 1080
     proxy: Optional[str] = None
-    headless: bool = "new"  # Use Chrome's new headless mode
+    headless: bool = True
+    concurrency: int = 4  # Page workers sharing one browser in batch mode
+    browser_pool_size: int = 1  # Warm Chromium processes kept by BrowserPool
+    max_pages_per_context: int = 20
+    max_context_age: float = 300.0  # Seconds before a context is retired
+    max_browser_memory_mb: Optional[int] = None  # Recycle a browser above this RSS (needs psutil)
+    download_concurrency: int = 16  # Asset downloads in flight across all hosts
+    download_per_host: int = 4
+    download_queue_size: int = 1000  # Backpressure on page workers when assets fall behind
+    asset_processors: int = 2  # Processes analysing downloaded assets for the manifest; 0 disables it
+    asset_revalidate_after: Optional[float] = 86400.0  # Seconds before a stored asset is revalidated; None never does
+    skip_unchanged_pages: bool = True  # Skip pages unchanged since the last crawl (HTTP body, or extracted content in the browser)
+    recrawl_after: Optional[float] = None  # Seconds after which finished frontier pages are crawled again
+    sitemap_max_urls: int = 1_000_000  # Stop discovery after this many distinct page URLs
+    sitemap_max_bytes: int = 64 * 1024 * 1024  # Per sitemap file after decompression (the protocol allows 50MB)
+    blocked_resource_types: Tuple[str, ...] = ()  # Playwright resource types to abort, e.g. "image", "font"
+    blocked_url_patterns: Tuple[str, ...] = ()  # Regexes matched against every request URL
+    wait_until: str = "networkidle"  # goto load state: commit, domcontentloaded, load or networkidle
+    wait_for_selector: Optional[str] = None  # Extra readiness condition after goto
+    wait_for_function: Optional[str] = None  # JS predicate that must return truthy after goto
+    humanize: bool = True  # Scroll, mouse movement and click after each navigation
+    fetch_mode: str = "browser"  # browser, http, or auto (HTTP first, browser when the page looks JS-rendered)
+    http_min_text_chars: int = 200  # Below this much visible text, auto mode falls back to the browser
+    max_text_chars: int = 5_000_000  # Visible text kept per page; the rest is dropped and marked truncated
+    max_links_per_kind: int = 20_000
+    max_html_bytes: int = 32 * 1024 * 1024  # HTTP-mode page bodies are cut off here
+    extract_chunk_chars: int = 1_000_000  # Text is pulled out of the browser in evaluate calls of this size
+    archive: bool = False  # Write fetched pages to output/warc/*.warc.gz with an offset index
+    archive_rotate_bytes: int = 1024 * 1024 * 1024
+    replay: bool = False  # Re-extract pages from the WARC archive without touching the network
+    main_content: str = "off"  # off, add (main_text next to text) or only (main_text instead of text)
+    near_duplicate_distance: Optional[int] = 3  # SimHash bits two pages may differ by and still be duplicates; None disables
+    near_duplicate_min_words: int = 50  # Shorter pages are never treated as duplicates
+    respect_robots: bool = True
+    host_concurrency: int = 2  # Pages in flight per host
+    min_host_interval: float = 1.0  # Seconds between page requests to one host, raised by Crawl-delay
+    max_crawl_delay: float = 30.0  # Cap on a site's Crawl-delay
+    adaptive_concurrency: bool = False  # AIMD limits between the bounds below instead of fixed ones
+    adaptive_min_concurrency: int = 1
+    adaptive_max_concurrency: int = 32  # Page workers across all hosts
+    adaptive_max_per_host: int = 8  # Pages in flight per host
+    adaptive_max_downloads: int = 64
+    adaptive_max_downloads_per_host: int = 16
+    adaptive_rss_limit_mb: Optional[int] = None  # Back off page concurrency while Chromium RSS is above this (needs psutil)
+    output_format: str = "json"  # json (per-domain content.json), jsonl or parquet
+    output_compression: Optional[str] = None  # "zstd" for jsonl output
+    output_rotate_bytes: int = 256 * 1024 * 1024  # Start a new jsonl/parquet file past this size
+    output_rotate_seconds: float = 3600.0  # ...or once a file is this old
+    output_batch_size: int = 500  # Records per Parquet row group, and per jsonl flush
+    output_flush_seconds: float = 1.0  # ...or flush jsonl at least this often
+    metrics_port: Optional[int] = None  # Serve Prometheus text on 127.0.0.1:<port>/metrics
+    metrics_file: Optional[str] = None  # Rewrite Prometheus text here every metrics_interval seconds
+    metrics_interval: float = 15.0
+    trace_file: Optional[str] = None  # Append one JSON trace per page with its stage timings
+    max_asset_bytes: Dict[str, int] = field(default_factory=lambda: {
+        "images": 25 * 1024 * 1024,
+        "videos": 2 * 1024 * 1024 * 1024,
+        "documents": 250 * 1024 * 1024
+    })
+    resumable_kinds: Tuple[str, ...] = ("videos", "documents")  # Downloaded with Range resume support
+    segment_threshold: int = 64 * 1024 * 1024  # Files at least this big are fetched in parallel segments
+    download_segments: int = 4
+    
+    def with_profile(self, name: str) -> "ScrapeConfig":
+        if name not in LOAD_PROFILES:
+            raise ValueError(f"Unknown load profile: {name}")
+        return replace(self, **LOAD_PROFILES[name])
+
+TRACKER_PATTERNS = (
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"facebook\.net",
+    r"hotjar\.com",
+    r"segment\.(io|com)",
+    r"/ads?/",
+)
+
+LOAD_PROFILES = {
+    "full": {
+        "blocked_resource_types": (),
+        "blocked_url_patterns": (),
+        "wait_until": "networkidle",
+        "humanize": True
+    },
+    "lite": {
+        "blocked_resource_types": ("image", "media", "font", "stylesheet", "texttrack", "eventsource", "websocket", "manifest"),
+        "blocked_url_patterns": TRACKER_PATTERNS,
+        "wait_until": "domcontentloaded",
+        "humanize": False
+    }
+}
+
+@dataclass
+class CrawlStats:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    disallowed: int = 0
+    images: int = 0
+    videos: int = 0
+    documents: int = 0
+    assets_downloaded: int = 0
+    assets_failed: int = 0
+    assets_skipped: int = 0
+    retries: int = 0
+    page_seconds: float = 0.0
+    slowest_page: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    errors: Dict[str, str] = field(default_factory=dict)
+    failures_by_class: Dict[str, int] = field(default_factory=dict)
+    
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+    
+    def record_success(self, content: Dict, seconds: float):
+        self.succeeded += 1
+        if content.get("unchanged"):
+            self.unchanged += 1
+        if content.get("duplicate_of"):
+            self.duplicates += 1
+        self.page_seconds += seconds
+        self.slowest_page = max(self.slowest_page, seconds)
+        links = content.get("links", {})
+        self.images += len(links.get("images", []))
+        self.videos += len(links.get("videos", []))
+        self.documents += len(links.get("documents", []))
+    
+    def record_failure(self, url: str, error: Exception):
+        self.failed += 1
+        self.errors[url] = str(error)[:200]
+        error_class = classify_error(error)
+        self.failures_by_class[error_class] = self.failures_by_class.get(error_class, 0) + 1
+    
+    def finish(self):
+        self.finished_at = time.monotonic()
+    
+    def merge(self, other: "CrawlStats"):
+        for name in ("total", "succeeded", "failed", "unchanged", "duplicates", "disallowed", "images", "videos", "documents",
+                     "assets_downloaded", "assets_failed", "assets_skipped", "retries", "page_seconds"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.slowest_page = max(self.slowest_page, other.slowest_page)
+        self.errors.update(other.errors)
+        for error_class, count in other.failures_by_class.items():
+            self.failures_by_class[error_class] = self.failures_by_class.get(error_class, 0) + count
+    
+    def as_dict(self) -> Dict:
+        done = self.succeeded + self.failed
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "unchanged": self.unchanged,
+            "duplicates": self.duplicates,
+            "disallowed": self.disallowed,
+            "images": self.images,
+            "videos": self.videos,
+            "documents": self.documents,
+            "assets_downloaded": self.assets_downloaded,
+            "assets_failed": self.assets_failed,
+            "assets_skipped": self.assets_skipped,
+            "retries": self.retries,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "pages_per_second": round(done / self.elapsed, 3) if self.elapsed > 0 else 0.0,
+            "mean_page_seconds": round(self.page_seconds / self.succeeded, 3) if self.succeeded else 0.0,
+            "slowest_page_seconds": round(self.slowest_page, 3),
+            "failures_by_class": self.failures_by_class,
+            "errors": self.errors
+        }
+
+CURRENT_TRACE: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+def append_lines(path: str, lines: List[str]):
+    # One write on an O_APPEND descriptor keeps lines whole when several shard processes
+    # append to the same file; buffered writes can split a long line between flushes
+    data = "".join(line + "\n" for line in lines).encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+class Metrics:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+    
+    def __init__(self, prefix: str = "scrape"):
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple, List[float]] = {}
+        self.trace_path: Optional[str] = None
+    
+    @staticmethod
+    def label_key(labels: Dict) -> Tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, self.label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges[(name, self.label_key(labels))] = value
+    
+    def add_gauge(self, name: str, delta: float, **labels):
+        key = (name, self.label_key(labels))
+        self.gauges[key] = self.gauges.get(key, 0) + delta
+    
+    def observe(self, stage: str, seconds: float, **labels):
+        key = self.label_key(dict(labels, stage=stage))
+        # Bucket counts, then sum and count
+        series = self.histograms.setdefault(key, [0.0] * (len(self.BUCKETS) + 2))
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+    
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(stage, elapsed, **labels)
+            trace = CURRENT_TRACE.get()
+            if trace is not None:
+                trace["stages"].append(dict(labels, stage=stage, offset=round(started - trace["t0"], 4),
+                                            seconds=round(elapsed, 4)))
+    
+    def begin_trace(self, url: str, span: str = "page", parent: Optional[Dict] = None) -> Optional[contextvars.Token]:
+        # Work that outlives a page's record, like its asset downloads, is written as a span of its own
+        # under the page's trace_id
+        if not self.trace_path:
+            return None
+        trace_id = parent["trace_id"] if parent is not None else uuid.uuid4().hex
+        return CURRENT_TRACE.set({"trace_id": trace_id, "span": span, "url": url, "started_at": time.time(),
+                                  "t0": time.perf_counter(), "stages": []})
+    
+    def end_trace(self, token: Optional[contextvars.Token], outcome: str):
+        if token is None:
+            return
+        trace = CURRENT_TRACE.get()
+        CURRENT_TRACE.reset(token)
+        record = {k: v for k, v in trace.items() if k != "t0"}
+        record["outcome"] = outcome
+        record["seconds"] = round(time.perf_counter() - trace["t0"], 4)
+        append_lines(self.trace_path, [json.dumps(record, ensure_ascii=False)])
+    
+    @staticmethod
+    def format_labels(labels: Tuple) -> str:
+        if not labels:
+            return ""
+        escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+        return "{" + ",".join(escaped) + "}"
+    
+    def render_prometheus(self) -> str:
+        lines = []
+        for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+            for name in sorted({name for name, _ in series}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} {kind}")
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f"{metric}{self.format_labels(labels)} {value:g}")
+        
+        if self.histograms:
+            metric = f"{self.prefix}_stage_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, series in sorted(self.histograms.items()):
+                for bound, count in zip(self.BUCKETS, series):
+                    lines.append(f"{metric}_bucket{self.format_labels(labels + (('le', f'{bound:g}'),))} {count:g}")
+                lines.append(f"{metric}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {series[-1]:g}")
+                lines.append(f"{metric}_sum{self.format_labels(labels)} {series[-2]:.6f}")
+                lines.append(f"{metric}_count{self.format_labels(labels)} {series[-1]:g}")
+        return "\n".join(lines) + "\n"
+    
+    def write_file(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+    
+    async def handle_metrics(self, request: "web.Request") -> "web.Response":
+        return web.Response(text=self.render_prometheus(), content_type="text/plain", charset="utf-8")
+    
+    async def serve(self, port: int, host: str = "127.0.0.1") -> "web.AppRunner":
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+    
+    async def write_periodically(self, path: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write_file, path)
+            except OSError as e:
+                logging.warning("Could not write metrics file %s: %s", path, e)
+
+METRICS = Metrics()
+
+def load_urls(source: str) -> List[str]:
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    
+    urls = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if not url or url.startswith('#') or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> Optional[str]:
+    try:
+        parsed = urlparse(url.strip())
+        port = parsed.port
+    except ValueError:
+        return None
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return None
+    
+    netloc = parsed.hostname.lower().rstrip('.')
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    
+    path = parsed.path or "/"
+    if "/." in path:
+        trailing = path.endswith("/")
+        path = posixpath.normpath(path)
+        path = path if not trailing or path.endswith("/") else path + "/"
+        if path.startswith("//"):
+            path = "/" + path.lstrip("/")
+    
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, netloc, path, "", query, ""))
+
+class HttpStatusError(Exception):
+    def __init__(self, status: int, url: str, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.retry_after = retry_after
+
+class CircuitOpenError(Exception):
+    # Not a failure of the URL: callers with a queue put it back until the breaker reopens
+    def __init__(self, message: str, reopens_in: float = 0.0):
+        super().__init__(message)
+        self.reopens_in = reopens_in
+
+class ReplayMiss(LookupError):
+    pass
+
+class RobotsDisallowed(Exception):
+    pass
+
+PLAYWRIGHT_NET_ERRORS = (
+    ("ERR_NAME_NOT_RESOLVED", "dns"),
+    ("ERR_NAME_RESOLUTION_FAILED", "dns"),
+    ("ERR_TIMED_OUT", "timeout"),
+    ("ERR_CONNECTION_TIMED_OUT", "timeout"),
+    ("ERR_CONNECTION_REFUSED", "connect"),
+    ("ERR_CONNECTION_RESET", "connect"),
+    ("ERR_CONNECTION_CLOSED", "connect"),
+    ("ERR_EMPTY_RESPONSE", "connect"),
+    ("ERR_ADDRESS_UNREACHABLE", "connect"),
+    ("ERR_CERT_", "tls"),
+    ("ERR_SSL_", "tls"),
+)
+
+def classify_status(status: int) -> str:
+    if status in (429, 503):
+        return "throttled"
+    if status >= 500:
+        return "server"
+    if status in (401, 403):
+        return "blocked"
+    return "client"
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, HttpStatusError):
+        return classify_status(error.status)
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, RobotsDisallowed):
+        return "robots"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return classify_status(error.status)
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return "dns" if isinstance(getattr(error, "os_error", None), socket.gaierror) else "connect"
+    if isinstance(error, socket.gaierror):
+        return "dns"
+    if isinstance(error, (asyncio.TimeoutError, PlaywrightTimeoutError)):
+        return "timeout"
+    if isinstance(error, (aiohttp.ServerDisconnectedError, aiohttp.ClientPayloadError, ConnectionError)):
+        return "connect"
+    if isinstance(error, PlaywrightError):
+        message = str(error)
+        for marker, error_class in PLAYWRIGHT_NET_ERRORS:
+            if marker in message:
+                return error_class
+        return "browser"
+    return "other"
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class RetryPolicy:
+    # Attempts per error class, including the first; classes not listed use "other"
+    max_attempts: Dict[str, int] = field(default_factory=lambda: {
+        "dns": 1,
+        "tls": 1,
+        "client": 1,
+        "robots": 1,
+        "circuit_open": 1,
+        "blocked": 3,
+        "throttled": 5,
+        "server": 4,
+        "timeout": 3,
+        "connect": 3,
+        "browser": 2,
+        "other": 2
+    })
+    base_delay: float = 1.0
+    max_delay: float = 120.0
+    # Classes that say something about the host rather than the URL, and so count towards its breaker
+    host_failures: Tuple[str, ...] = ("dns", "timeout", "connect", "server", "throttled")
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 60.0
+    
+    def attempts_for(self, error_class: str) -> int:
+        return self.max_attempts.get(error_class, self.max_attempts.get("other", 1))
+    
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+    
+    def allow(self) -> bool:
+        # Once the cooldown passes the breaker is half-open: the next call is a trial
+        return time.monotonic() >= self.open_until
+    
+    def record_success(self):
+        self.failures = 0
+        self.trips = 0
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.trips += 1
+            self.open_until = time.monotonic() + min(self.cooldown * (2 ** (self.trips - 1)), 600.0)
+            self.failures = self.threshold - 1
+
+class DeadLetterLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+    
+    def record(self, url: str, error: BaseException, error_class: str, attempts: int):
+        self.count += 1
+        entry = {
+            "url": url,
+            "error_class": error_class,
+            "reason": str(error)[:500],
+            "attempts": attempts,
+            "failed_at": time.time()
+        }
+        append_lines(self.path, [json.dumps(entry, ensure_ascii=False)])
+
+class RetryEngine:
+    def __init__(self, policy: RetryPolicy, dead_letters: Optional[DeadLetterLog] = None):
+        self.policy = policy
+        self.dead_letters = dead_letters
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        # Told about every backoff on a host failure, so other requests to the host wait too
+        self.on_backoff: Optional[Callable[[str, float], Awaitable[None]]] = None
+    
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.policy.breaker_threshold, self.policy.breaker_cooldown)
+        return self.breakers[host]
+    
+    async def run(self, url: str, operation: Callable[[], Awaitable[Any]],
+                  before_retry: Optional[Callable[[BaseException, str], Awaitable[None]]] = None) -> Any:
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlparse(url).netloc}",
+                                       breaker.open_until - time.monotonic())
+            try:
+                result = await operation()
+                breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error_class = classify_error(e)
+                if error_class in self.policy.host_failures:
+                    breaker.record_failure()
+                if attempt >= self.policy.attempts_for(error_class):
+                    self.dead_letter(url, e, error_class, attempt)
+                    raise
+                
+                delay = parse_retry_after(getattr(e, "retry_after", None))
+                delay = min(delay, self.policy.max_delay) if delay is not None else self.policy.backoff(attempt)
+                logging.info("Retrying %s in %.1fs after %s error (attempt %s): %s", url, delay, error_class, attempt, e)
+                self.retries += 1
+                METRICS.inc("retries_total", error_class=error_class)
+                if self.on_backoff is not None and error_class in self.policy.host_failures:
+                    await self.on_backoff(url, delay)
+                await asyncio.sleep(delay)
+                if before_retry is not None:
+                    await before_retry(e, error_class)
+    
+    def dead_letter(self, url: str, error: BaseException, error_class: str, attempts: int):
+        error.dead_lettered = True
+        METRICS.inc("dead_letters_total", error_class=error_class)
+        logging.error("Giving up on %s after %s attempt(s), %s: %s", url, attempts, error_class, error)
+        if self.dead_letters is not None:
+            self.dead_letters.record(url, error, error_class, attempts)
 
 class CapsolverHandler:
     def __init__(self):
@@ -65,8 +676,8 @@ class CapsolverHandler:
                             check_result = await check_resp.json()
                             if check_result.get("status") == "ready":
                                 return check_result["solution"]["gRecaptchaResponse"]
-        except:
-            pass
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            logging.warning("Capsolver reCAPTCHA solve failed (%s): %s", classify_error(e), e)
         return None
     
     async def solve_hcaptcha(self, sitekey: str, pageurl: str) -> Optional[str]:
@@ -93,8 +704,8 @@ class CapsolverHandler:
                             check_result = await check_resp.json()
                             if check_result.get("status") == "ready":
                                 return check_result["solution"]["token"]
-        except:
-            pass
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            logging.warning("Capsolver hCaptcha solve failed (%s): %s", classify_error(e), e)
         return None
 
 class EnhancedFingerprintSpoofer:
@@ -116,8 +727,8 @@ class EnhancedFingerprintSpoofer:
         }
     
     @staticmethod
-    async def inject_stealth_js(page: Page):
-        await page.add_init_script("""
+    async def inject_stealth_js(target: Union[Page, BrowserContext]):
+        await target.add_init_script("""
             Object.defineProperty(navigator, 'webdriver', { get: () => false });
             window.chrome = { runtime: {}, loadTimes: () => {}, csi: () => {}, app: {} };
             
@@ -208,34 +819,50 @@ class Humanizer:
         await asyncio.sleep(random.uniform(0.8, 3.2))
 
 class DynamicCaptchaDetector:
+    SELECTOR = ', '.join([
+        'iframe[src*="recaptcha"]',
+        'iframe[src*="hcaptcha"]',
+        'div[class*="captcha"]',
+        'div[class*="challenge"]',
+        '#captcha',
+        '#challenge'
+    ])
+    SETTLE_SECONDS = 0.5  # How long a clean page gets to start loading a challenge
+    WIDGET_TIMEOUT_MS = 5000  # How long a challenge seen on the wire gets to attach its widget
+    
+    @staticmethod
+    async def detect(page: Page, challenge_seen: asyncio.Event) -> bool:
+        if await page.locator(DynamicCaptchaDetector.SELECTOR).count() > 0:
+            return True
+        if not challenge_seen.is_set():
+            try:
+                await asyncio.wait_for(challenge_seen.wait(), DynamicCaptchaDetector.SETTLE_SECONDS)
+            except asyncio.TimeoutError:
+                return False
+        try:
+            await page.wait_for_selector(DynamicCaptchaDetector.SELECTOR, state="attached",
+                                         timeout=DynamicCaptchaDetector.WIDGET_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            pass
+        return True
+    
     @staticmethod
     async def detect_and_solve(page: Page, capsolver: CapsolverHandler) -> bool:
-        captcha_detected = False
+        challenge_seen = asyncio.Event()
         
         def check_response(response: Response):
-            nonlocal captcha_detected
             if 'captcha' in response.url.lower() or 'challenge' in response.url.lower():
-                captcha_detected = True
+                challenge_seen.set()
         
         page.on('response', check_response)
-        
-        await asyncio.sleep(3)
-        
-        captcha_selectors = [
-            'iframe[src*="recaptcha"]',
-            'iframe[src*="hcaptcha"]',
-            'div[class*="captcha"]',
-            'div[class*="challenge"]',
-            '#captcha',
-            '#challenge'
-        ]
-        
-        for selector in captcha_selectors:
-            if await page.locator(selector).count() > 0:
-                captcha_detected = True
-                break
-        
-        if captcha_detected:
+        try:
+            return await DynamicCaptchaDetector.solve(page, capsolver, challenge_seen)
+        finally:
+            page.remove_listener('response', check_response)
+    
+    @staticmethod
+    async def solve(page: Page, capsolver: CapsolverHandler, challenge_seen: asyncio.Event) -> bool:
+        if await DynamicCaptchaDetector.detect(page, challenge_seen):
             sitekey = await page.evaluate("""
                 () => {
                     const el = document.querySelector('[data-sitekey]');
@@ -277,7 +904,6 @@ class DynamicCaptchaDetector:
                         """, token)
                         return True
         
-        page.remove_listener('response', check_response)
         return False
 
 class SecureFileHandler:
@@ -298,338 +924,3796 @@ class SecureFileHandler:
         
         return basename
 
+ASSET_KINDS = (("images", "jpg"), ("videos", "mp4"), ("documents", "pdf"))
+
 class ContentExtractor:
-    @staticmethod
-    async def extract_all(page: Page, base_url: str) -> Dict:
-        await asyncio.sleep(2)
-        
-        content = {}
-        
-        title = await page.title()
-        content["title"] = title
-        content["url"] = base_url
-        
-        visible_text = await page.evaluate("""
-            () => {
-                const styleTags = document.querySelectorAll('style, script, noscript, iframe, svg');
-                styleTags.forEach(tag => tag.remove());
-                
+    READY_TIMEOUT_MS = 10000
+    LINK_CHUNK_SIZE = 2000
+    
+    # Text and links stay in the page and are pulled out by CHUNK_SCRIPT and LINKS_SCRIPT, so
+    # no single CDP message grows with the page; walking stops once the caps are reached
+    EXTRACT_SCRIPT = """
+        ({maxText, maxLinks, collectText}) => {
+            const skipTags = new Set(['STYLE', 'SCRIPT', 'NOSCRIPT', 'IFRAME', 'SVG', 'svg']);
+            const texts = [];
+            const truncated = {};
+            let textLength = 0;
+            
+            if (collectText && document.body) {
                 const walker = document.createTreeWalker(
                     document.body,
-                    NodeFilter.SHOW_TEXT,
-                    null,
-                    false
+                    NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT,
+                    {
+                        acceptNode(node) {
+                            if (node.nodeType === Node.ELEMENT_NODE) {
+                                return skipTags.has(node.tagName) ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_SKIP;
+                            }
+                            return NodeFilter.FILTER_ACCEPT;
+                        }
+                    }
                 );
                 
-                let texts = [];
                 let node;
                 while (node = walker.nextNode()) {
-                    if (node.parentElement && 
-                        node.parentElement.style.display !== 'none' &&
-                        node.parentElement.style.visibility !== 'hidden' &&
-                        node.parentElement.getAttribute('aria-hidden') !== 'true') {
+                    const parent = node.parentElement;
+                    if (parent &&
+                        parent.style.display !== 'none' &&
+                        parent.style.visibility !== 'hidden' &&
+                        parent.getAttribute('aria-hidden') !== 'true') {
                         const text = node.textContent.trim();
                         if (text.length > 1) {
+                            const room = maxText - textLength - (texts.length ? 1 : 0);
+                            if (text.length > room) {
+                                if (room > 0) texts.push(text.slice(0, room));
+                                truncated.text = true;
+                                break;
+                            }
                             texts.push(text);
+                            textLength += text.length + (texts.length > 1 ? 1 : 0);
                         }
                     }
                 }
-                return texts.join('\\n');
             }
-        """)
-        content["text"] = visible_text
-        
-        links = await page.evaluate("""
-            () => {
-                const results = {
-                    images: [],
-                    videos: [],
-                    documents: [],
-                    other: []
-                };
+            
+            const links = {
+                images: [],
+                videos: [],
+                documents: [],
+                other: []
+            };
+            
+            const docPatterns = /\\.(pdf|docx?|xlsx?|pptx?|zip|rar|tar\\.gz|dmg|exe)$/i;
+            const imgPatterns = /\\.(jpg|jpeg|png|gif|webp|bmp|svg|ico)$/i;
+            const videoPatterns = /\\.(mp4|webm|avi|mov|mkv|flv|wmv)$/i;
+            
+            const elements = document.querySelectorAll('a[href], img[src], video source[src], video[src], audio[src]');
+            
+            for (const el of elements) {
+                if (el.closest('svg')) continue;
                 
-                const docPatterns = /\\.(pdf|docx?|xlsx?|pptx?|zip|rar|tar\\.gz|dmg|exe)$/i;
-                const imgPatterns = /\\.(jpg|jpeg|png|gif|webp|bmp|svg|ico)$/i;
-                const videoPatterns = /\\.(mp4|webm|avi|mov|mkv|flv|wmv)$/i;
+                let url = el.href || el.src;
+                if (!url) continue;
                 
-                const elements = document.querySelectorAll('a[href], img[src], video source[src], video[src], audio[src]');
+                url = url.toString();
                 
-                for (const el of elements) {
-                    let url = el.href || el.src;
-                    if (!url) continue;
-                    
-                    url = url.toString();
-                    
-                    if (el.tagName === 'IMG' || imgPatterns.test(url)) {
-                        results.images.push(url);
-                    } else if (el.tagName === 'VIDEO' || el.tagName === 'SOURCE' || videoPatterns.test(url)) {
-                        results.videos.push(url);
-                    } else if (docPatterns.test(url)) {
-                        results.documents.push(url);
-                    } else if (el.tagName === 'A' && url.startsWith('http')) {
-                        results.other.push(url);
+                let kind = null;
+                if (el.tagName === 'IMG' || imgPatterns.test(url)) {
+                    kind = 'images';
+                } else if (el.tagName === 'VIDEO' || el.tagName === 'SOURCE' || videoPatterns.test(url)) {
+                    kind = 'videos';
+                } else if (docPatterns.test(url)) {
+                    kind = 'documents';
+                } else if (el.tagName === 'A' && url.startsWith('http')) {
+                    kind = 'other';
+                }
+                if (kind === null) continue;
+                if (links[kind].length >= maxLinks) {
+                    truncated[kind] = true;
+                    continue;
+                }
+                links[kind].push(url);
+            }
+            
+            window.__scrapeExtractText = texts.join('\\n');
+            window.__scrapeExtractLinks = links;
+            const linkCounts = {};
+            for (const kind in links) linkCounts[kind] = links[kind].length;
+            return {
+                title: document.title.slice(0, 2000),
+                textLength: window.__scrapeExtractText.length,
+                linkCounts: linkCounts,
+                truncated: truncated
+            };
+        }
+    """
+    
+    # Scores paragraph-like blocks by text length, commas and link density, credits their
+    # ancestors, and keeps the visible text of the best-scoring container minus boilerplate
+    # subtrees; MainContentExtractor does the same over parsed HTML
+    MAIN_CONTENT_SCRIPT = """
+        ({maxText, negative, positive}) => {
+            const negativeRe = new RegExp(negative, 'i');
+            const positiveRe = new RegExp(positive, 'i');
+            const skipTags = new Set(['STYLE', 'SCRIPT', 'NOSCRIPT', 'IFRAME', 'SVG', 'svg']);
+            const boilerplateTags = new Set(['NAV', 'FOOTER', 'HEADER', 'ASIDE', 'FORM']);
+            
+            const weight = (el) => {
+                const label = (typeof el.className === 'string' ? el.className : '') + ' ' + (el.id || '');
+                let w = 0;
+                if (negativeRe.test(label)) w -= 25;
+                if (positiveRe.test(label)) w += 25;
+                if (el.tagName === 'ARTICLE' || el.tagName === 'MAIN') w += 30;
+                if (boilerplateTags.has(el.tagName)) w -= 50;
+                return w;
+            };
+            const linkChars = (el) => {
+                let n = 0;
+                for (const a of el.getElementsByTagName('a')) n += a.textContent.length;
+                return n;
+            };
+            
+            const scores = new Map();
+            if (document.body) {
+                for (const el of document.body.querySelectorAll('p, pre, td, li, blockquote, dd')) {
+                    const text = el.textContent.trim();
+                    if (text.length < 25) continue;
+                    const commas = (text.match(/[,;]/g) || []).length;
+                    const score = (1 + commas + Math.min(Math.floor(text.length / 100), 3)) * (1 - linkChars(el) / text.length);
+                    let node = el.parentElement;
+                    for (let level = 0; node && node !== document.documentElement && level < 3; level++, node = node.parentElement) {
+                        if (!scores.has(node)) scores.set(node, weight(node));
+                        scores.set(node, scores.get(node) + score / (level === 0 ? 1 : level * 2));
                     }
                 }
-                
-                return results;
             }
-        """)
+            
+            let best = null;
+            let bestScore = 0;
+            for (const [el, score] of scores) {
+                const adjusted = score * (1 - linkChars(el) / (el.textContent.length || 1));
+                if (adjusted > bestScore) {
+                    best = el;
+                    bestScore = adjusted;
+                }
+            }
+            
+            const texts = [];
+            let length = 0;
+            if (best) {
+                const walker = document.createTreeWalker(
+                    best,
+                    NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT,
+                    {
+                        acceptNode(node) {
+                            if (node.nodeType === Node.ELEMENT_NODE) {
+                                const hidden = node.style.display === 'none' || node.style.visibility === 'hidden' ||
+                                    node.getAttribute('aria-hidden') === 'true';
+                                return skipTags.has(node.tagName) || hidden || weight(node) < 0
+                                    ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_SKIP;
+                            }
+                            return NodeFilter.FILTER_ACCEPT;
+                        }
+                    }
+                );
+                let node;
+                while (length < maxText && (node = walker.nextNode())) {
+                    const text = node.textContent.trim();
+                    if (text.length > 1) {
+                        texts.push(text);
+                        length += text.length + 1;
+                    }
+                }
+            }
+            
+            window.__scrapeExtractMain = texts.join('\\n').slice(0, maxText);
+            return window.__scrapeExtractMain.length;
+        }
+    """
+    
+    CHUNK_SCRIPT = """
+        ([key, start, size]) => (window[key] || '').slice(start, start + size)
+    """
+    
+    LINKS_SCRIPT = """
+        ([kind, start, size]) => ((window.__scrapeExtractLinks || {})[kind] || []).slice(start, start + size)
+    """
+    
+    CLEAR_SCRIPT = """
+        () => { delete window.__scrapeExtractText; delete window.__scrapeExtractMain; delete window.__scrapeExtractLinks; }
+    """
+    
+    @staticmethod
+    async def wait_until_ready(page: Page):
+        try:
+            await page.wait_for_function(
+                "() => document.readyState !== 'loading' && !!document.body",
+                timeout=ContentExtractor.READY_TIMEOUT_MS
+            )
+        except Exception as e:
+            logging.warning("Page not ready after %sms, extracting anyway: %s", ContentExtractor.READY_TIMEOUT_MS, e)
+    
+    @staticmethod
+    async def read_chunked(page: Page, key: str, length: int, chunk_chars: int) -> str:
+        chunks = []
+        for start in range(0, length, chunk_chars):
+            chunks.append(await page.evaluate(ContentExtractor.CHUNK_SCRIPT, [key, start, chunk_chars]))
+        return "".join(chunks)
+    
+    @staticmethod
+    async def read_links(page: Page, counts: Dict[str, int], chunk_size: int) -> Dict[str, List[str]]:
+        links = {}
+        for kind, count in counts.items():
+            links[kind] = []
+            for start in range(0, count, chunk_size):
+                links[kind].extend(await page.evaluate(ContentExtractor.LINKS_SCRIPT, [kind, start, chunk_size]))
+        return links
+    
+    @staticmethod
+    async def extract_all(page: Page, base_url: str, max_text_chars: int = ScrapeConfig.max_text_chars,
+                          max_links: int = ScrapeConfig.max_links_per_kind,
+                          chunk_chars: int = ScrapeConfig.extract_chunk_chars,
+                          main_content: str = ScrapeConfig.main_content) -> Dict:
+        await ContentExtractor.wait_until_ready(page)
+        
+        payload = await page.evaluate(ContentExtractor.EXTRACT_SCRIPT, {
+            "maxText": max_text_chars, "maxLinks": max_links, "collectText": main_content != "only"
+        })
+        main_text = None
+        try:
+            text = await ContentExtractor.read_chunked(page, "__scrapeExtractText", payload["textLength"], chunk_chars)
+            links = await ContentExtractor.read_links(page, payload["linkCounts"], ContentExtractor.LINK_CHUNK_SIZE)
+            if main_content != "off":
+                with METRICS.timer("main_content", mode="browser"):
+                    main_length = await page.evaluate(ContentExtractor.MAIN_CONTENT_SCRIPT, {
+                        "maxText": max_text_chars,
+                        "negative": MainContentExtractor.NEGATIVE.pattern,
+                        "positive": MainContentExtractor.POSITIVE.pattern
+                    })
+                main_text = await ContentExtractor.read_chunked(page, "__scrapeExtractMain", main_length, chunk_chars)
+        finally:
+            await page.evaluate(ContentExtractor.CLEAR_SCRIPT)
+        
+        content = {}
+        content["title"] = payload["title"]
+        content["url"] = base_url
+        if main_content != "only":
+            content["text"] = text
+        if main_text is not None:
+            content["main_text"] = main_text
         content["links"] = links
+        if payload["truncated"]:
+            content["truncated"] = payload["truncated"]
         
         return content
 
-class TLSFingerprintDownloader:
+class HtmlExtractor:
+    SKIP_TAGS = {"style", "script", "noscript", "iframe", "svg"}
+    DOC_PATTERN = re.compile(r"\.(pdf|docx?|xlsx?|pptx?|zip|rar|tar\.gz|dmg|exe)$", re.I)
+    IMG_PATTERN = re.compile(r"\.(jpg|jpeg|png|gif|webp|bmp|svg|ico)$", re.I)
+    VIDEO_PATTERN = re.compile(r"\.(mp4|webm|avi|mov|mkv|flv|wmv)$", re.I)
+    HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden", re.I)
+    EMPTY_APP_ROOT = re.compile(r'<div[^>]+id=["\']?(root|app|__next|__nuxt)["\']?[^>]*>\s*</div>', re.I)
+    
     @staticmethod
-    async def download_with_fingerprint(url: str, filepath: str) -> bool:
-        if AsyncSession is None:
+    def link_kind(tag: str, url: str, in_video: bool = False) -> Optional[str]:
+        if tag == "img" or HtmlExtractor.IMG_PATTERN.search(url):
+            return "images"
+        if tag == "video" or (tag == "source" and in_video) or HtmlExtractor.VIDEO_PATTERN.search(url):
+            return "videos"
+        if HtmlExtractor.DOC_PATTERN.search(url):
+            return "documents"
+        if tag == "a" and url.startswith("http"):
+            return "other"
+        return None
+    
+    @staticmethod
+    def is_visible(attrs: Dict) -> bool:
+        if attrs.get("aria-hidden") == "true":
             return False
-        try:
-            async with AsyncSession() as session:
-                response = await session.get(
-                    url,
-                    impersonate="chrome126",
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '').lower()
-                    if 'text/html' in content_type:
-                        return False
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    return True
-        except:
-            pass
-        return False
-
-class ScrapeCore:
-    def __init__(self):
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.current_proxy_index = 0
-        self.capsolver = CapsolverHandler()
-        self.humanizer = Humanizer()
-        self.output_dir = "./output"
-        
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
+        return not HtmlExtractor.HIDDEN_STYLE.search(attrs.get("style") or "")
     
-    def get_next_proxy(self) -> Optional[str]:
-        if not PROXIES:
-            return None
-        proxy = PROXIES[self.current_proxy_index]
-        self.current_proxy_index = (self.current_proxy_index + 1) % len(PROXIES)
-        return proxy
+    @staticmethod
+    def extract(html: str, base_url: str, max_text_chars: int = ScrapeConfig.max_text_chars,
+                max_links: int = ScrapeConfig.max_links_per_kind) -> Dict:
+        budget = ExtractBudget(max_text_chars, max_links)
+        if SelectolaxParser is not None:
+            return HtmlExtractor.extract_selectolax(html, base_url, budget)
+        parser = _HtmlTextLinkParser(base_url, budget)
+        parser.feed(html)
+        parser.close()
+        return budget.result(parser.title())
     
-    async def create_browser_context(self, config: ScrapeConfig) -> BrowserContext:
-        if self.browser:
-            await self.browser.close()
+    @staticmethod
+    def extract_selectolax(html: str, base_url: str, budget: "ExtractBudget") -> Dict:
+        tree = SelectolaxParser(html)
+        title_node = tree.css_first("title")
+        title = " ".join(title_node.text().split()) if title_node else ""
+        base_node = tree.css_first("base[href]")
+        if base_node:
+            base_url = urljoin(base_url, base_node.attributes.get("href") or "")
         
-        proxy = config.proxy or self.get_next_proxy()
-        browser_args = [
-            f'--user-agent={config.user_agent}',
-            '--disable-blink-features=AutomationControlled',
-            '--disable-dev-shm-usage',
-            '--no-sandbox',
-            '--disable-web-security',
-            '--disable-features=IsolateOrigins,site-per-process',
-            '--disable-site-isolation-trials',
-            '--disable-component-extensions-with-background-pages',
-            '--disable-default-apps',
-            '--disable-extensions',
-            '--disable-background-networking'
-        ]
+        for node in tree.css(", ".join(HtmlExtractor.SKIP_TAGS)):
+            node.decompose()
         
-        if proxy:
-            browser_args.append(f'--proxy-server={proxy}')
+        if tree.body is not None:
+            for node in tree.body.traverse(include_text=True):
+                if node.tag != "-text" or node.parent is None:
+                    continue
+                if not HtmlExtractor.is_visible(node.parent.attributes):
+                    continue
+                text = (node.text_content or "").strip()
+                if len(text) > 1 and not budget.add_text(text):
+                    break
         
-        self.browser = await self.playwright.chromium.launch(
-            headless=config.headless,
-            args=browser_args
-        )
+        for node in tree.css("a[href], img[src], video source[src], video[src], audio[src]"):
+            raw = node.attributes.get("href" if node.tag == "a" else "src")
+            if not raw:
+                continue
+            url = urljoin(base_url, raw.strip())
+            budget.add_link(HtmlExtractor.link_kind(node.tag, url, in_video=True), url)
         
-        context = await self.browser.new_context(
-            viewport={'width': config.viewport_width, 'height': config.viewport_height},
-            user_agent=config.user_agent,
-            java_script_enabled=True,
-            ignore_https_errors=True
-        )
+        return budget.result(title)
+    
+    @staticmethod
+    def looks_js_rendered(html: str, content: Dict, min_text_chars: int) -> bool:
+        if len(content["text"]) < min_text_chars:
+            return True
+        return bool(HtmlExtractor.EMPTY_APP_ROOT.search(html)) and len(content["text"]) < min_text_chars * 5
+
+class ExtractBudget:
+    def __init__(self, max_text_chars: int, max_links: int):
+        self.text_left = max_text_chars
+        self.max_links = max_links
+        self.texts: List[str] = []
+        self.links = {"images": [], "videos": [], "documents": [], "other": []}
+        self.truncated: Dict[str, bool] = {}
+    
+    def add_text(self, text: str) -> bool:
+        room = self.text_left - (1 if self.texts else 0)
+        if len(text) > room:
+            if room > 0:
+                self.texts.append(text[:room])
+            self.text_left = 0
+            self.truncated["text"] = True
+            return False
+        self.texts.append(text)
+        self.text_left = room - len(text)
+        return True
+    
+    def add_link(self, kind: Optional[str], url: str):
+        if kind is None:
+            return
+        if len(self.links[kind]) >= self.max_links:
+            self.truncated[kind] = True
+            return
+        self.links[kind].append(url)
+    
+    def result(self, title: str) -> Dict:
+        content = {"title": title, "text": "\n".join(self.texts), "links": self.links}
+        if self.truncated:
+            content["truncated"] = self.truncated
+        return content
+
+class _HtmlTextLinkParser(HTMLParser):
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+    
+    def __init__(self, base_url: str, budget: ExtractBudget):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.budget = budget
+        self.stack: List[Tuple[str, bool]] = []
+        self.skip_depth = 0
+        self.in_head = False
+        self.in_title = False
+        self.title_parts: List[str] = []
+        self.video_depth = 0
+    
+    def title(self) -> str:
+        return " ".join("".join(self.title_parts).split())
+    
+    def handle_starttag(self, tag: str, attrs):
+        attrs = dict(attrs)
+        if tag == "head":
+            self.in_head = True
+        elif tag == "body":
+            self.in_head = False
+        elif tag == "title":
+            self.in_title = True
+        elif tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
         
-        headers = EnhancedFingerprintSpoofer.get_chrome_headers()
-        await context.set_extra_http_headers(headers)
+        if tag in HtmlExtractor.SKIP_TAGS:
+            self.skip_depth += 1
         
-        page = context.pages[0] if context.pages() else await context.new_page()
-        await EnhancedFingerprintSpoofer.inject_stealth_js(page)
+        if self.skip_depth == 0:
+            url_attr = "href" if tag == "a" else "src" if tag in ("img", "video", "source", "audio") else None
+            raw = attrs.get(url_attr) if url_attr else None
+            if raw and (tag != "source" or self.video_depth):
+                url = urljoin(self.base_url, raw.strip())
+                self.budget.add_link(HtmlExtractor.link_kind(tag, url, self.video_depth > 0), url)
         
-        return context
+        if tag == "video":
+            self.video_depth += 1
+        if tag not in self.VOID_TAGS:
+            self.stack.append((tag, HtmlExtractor.is_visible(attrs)))
     
-    async def handle_captcha(self, page: Page):
-        # Legacy fallback; main logic now in DynamicCaptchaDetector
-        pass
+    def handle_startendtag(self, tag: str, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.VOID_TAGS:
+            self.handle_endtag(tag)
     
-    async def navigate_with_evasion(self, page: Page, url: str) -> Optional[Response]:
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = await page.goto(url, wait_until='networkidle', timeout=30000)
-                
-                if response and response.status in [403, 429, 503]:
-                    raise Exception(f"Blocked with status {response.status}")
-                
-                await asyncio.sleep(random.uniform(0.8, 2.5))
-                
-                captcha_solved = await DynamicCaptchaDetector.detect_and_solve(page, self.capsolver)
-                if captcha_solved:
-                    await asyncio.sleep(2)
-                
-                await self.humanizer.human_scroll(page)
-                
-                await self.humanizer.human_mouse_move(page, 100, 100)
+    def handle_endtag(self, tag: str):
+        if tag == "head":
+            self.in_head = False
+        elif tag == "title":
+            self.in_title = False
+        if tag in HtmlExtractor.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        if tag == "video" and self.video_depth:
+            self.video_depth -= 1
+        
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+    
+    def handle_data(self, data: str):
+        if self.in_title:
+            self.title_parts.append(data)
+            return
+        if self.in_head or self.skip_depth:
+            return
+        if self.stack and not self.stack[-1][1]:
+            return
+        text = data.strip()
+        if len(text) > 1 and self.budget.text_left > 0:
+            self.budget.add_text(text)
+
+class MainContentExtractor:
+    NEGATIVE = re.compile(r"comment|footer|footnote|nav|menu|sidebar|sponsor|banner|cookie|consent|share|social|"
+                          r"related|promo|breadcrumb|pagination|popup|modal|subscribe|newsletter", re.I)
+    POSITIVE = re.compile(r"article|content|main|post|entry|story|text|body|blog", re.I)
+    BLOCK_TAGS = {"p", "pre", "td", "li", "blockquote", "dd"}
+    BOILERPLATE_TAGS = {"nav", "footer", "header", "aside", "form"}
+    
+    @staticmethod
+    def weight(tag: str, attrs: Dict) -> int:
+        label = f"{attrs.get('class') or ''} {attrs.get('id') or ''}"
+        weight = 0
+        if MainContentExtractor.NEGATIVE.search(label):
+            weight -= 25
+        if MainContentExtractor.POSITIVE.search(label):
+            weight += 25
+        if tag in ("article", "main"):
+            weight += 30
+        if tag in MainContentExtractor.BOILERPLATE_TAGS:
+            weight -= 50
+        return weight
+    
+    @staticmethod
+    def extract(html: str, max_chars: int = ScrapeConfig.max_text_chars) -> str:
+        parser = _BlockTreeParser()
+        parser.feed(html)
+        parser.close()
+        return parser.main_text(max_chars)
+
+class _BlockTreeParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags: List[str] = []
+        self.parents: List[int] = []
+        self.weights: List[int] = []
+        self.visible: List[bool] = []
+        self.chars: List[int] = []
+        self.link_chars: List[int] = []
+        self.commas: List[int] = []
+        self.pieces: List[Tuple[int, str]] = []
+        self.stack: List[int] = []
+        self.skip_depth = 0
+        self.in_head = False
+        self.in_link = 0
+    
+    def handle_starttag(self, tag: str, attrs):
+        if tag == "head":
+            self.in_head = True
+        elif tag == "body":
+            self.in_head = False
+        if tag in HtmlExtractor.SKIP_TAGS:
+            self.skip_depth += 1
+        if tag in _HtmlTextLinkParser.VOID_TAGS:
+            return
+        attrs = dict(attrs)
+        self.tags.append(tag)
+        self.parents.append(self.stack[-1] if self.stack else -1)
+        self.weights.append(MainContentExtractor.weight(tag, attrs))
+        self.visible.append(HtmlExtractor.is_visible(attrs))
+        self.chars.append(0)
+        self.link_chars.append(0)
+        self.commas.append(0)
+        self.stack.append(len(self.tags) - 1)
+        if tag == "a":
+            self.in_link += 1
+    
+    def handle_startendtag(self, tag: str, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _HtmlTextLinkParser.VOID_TAGS:
+            self.handle_endtag(tag)
+    
+    def handle_endtag(self, tag: str):
+        if tag == "head":
+            self.in_head = False
+        if tag in HtmlExtractor.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.tags[self.stack[i]] == tag:
+                self.in_link -= sum(1 for node in self.stack[i:] if self.tags[node] == "a")
+                del self.stack[i:]
+                break
+    
+    def handle_data(self, data: str):
+        if self.in_head or self.skip_depth or not self.stack:
+            return
+        text = data.strip()
+        if len(text) > 1:
+            node = self.stack[-1]
+            self.chars[node] += len(text)
+            self.commas[node] += text.count(",") + text.count(";")
+            if self.in_link:
+                self.link_chars[node] += len(text)
+            self.pieces.append((node, text))
+    
+    def main_text(self, max_chars: int) -> str:
+        # Children always come after their parent, so one reverse pass rolls totals up the tree
+        chars, link_chars, commas = self.chars[:], self.link_chars[:], self.commas[:]
+        for node in range(len(self.tags) - 1, -1, -1):
+            parent = self.parents[node]
+            if parent >= 0:
+                chars[parent] += chars[node]
+                link_chars[parent] += link_chars[node]
+                commas[parent] += commas[node]
+        
+        scores: Dict[int, float] = {}
+        for node, tag in enumerate(self.tags):
+            if tag not in MainContentExtractor.BLOCK_TAGS or chars[node] < 25:
+                continue
+            score = (1 + commas[node] + min(chars[node] // 100, 3)) * (1 - link_chars[node] / chars[node])
+            ancestor = self.parents[node]
+            for level in range(3):
+                if ancestor < 0 or self.tags[ancestor] == "html":
+                    break
+                scores[ancestor] = scores.get(ancestor, self.weights[ancestor]) + score / (1 if level == 0 else level * 2)
+                ancestor = self.parents[ancestor]
+        
+        best, best_score = -1, 0.0
+        for node, score in scores.items():
+            adjusted = score * (1 - link_chars[node] / (chars[node] or 1))
+            if adjusted > best_score:
+                best, best_score = node, adjusted
+        if best < 0:
+            return ""
+        
+        # 1 = inside the best container and kept, 0 = outside it or under a hidden or boilerplate element
+        kept: Dict[int, int] = {best: 1}
+        def keep(node: int) -> int:
+            path = []
+            while node not in kept:
+                if node < 0:
+                    status = 0
+                    break
+                path.append(node)
+                node = self.parents[node]
+            else:
+                status = kept[node]
+            for visited in reversed(path):
+                if status and (self.weights[visited] < 0 or not self.visible[visited]):
+                    status = 0
+                kept[visited] = status
+            return status
+        
+        texts, length = [], 0
+        for node, text in self.pieces:
+            if length >= max_chars:
+                break
+            if keep(node):
+                texts.append(text)
+                length += len(text) + 1
+        return "\n".join(texts)[:max_chars]
+
+MAGIC_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"\x00\x00\x01\x00", "image/x-icon"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"FLV", "video/x-flv"),
+    (0, b"0&\xb2u\x8ef\xcf\x11", "video/x-ms-wmv"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftyp", "video/mp4"),
+)
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    if head[:4] == b"RIFF" and len(head) >= 12:
+        return {b"WEBP": "image/webp", b"AVI ": "video/x-msvideo"}.get(head[8:12])
+    for offset, signature, mime in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime
+    start = head.lstrip()[:256].lower()
+    if start.startswith(b"<svg") or (start.startswith(b"<?xml") and b"<svg" in start):
+        return "image/svg+xml"
+    if start.startswith(b"<!doctype html") or start.startswith(b"<html") or start.startswith(b"<head"):
+        return "text/html"
+    return None
+
+def precheck_response(headers, max_bytes: Optional[int], meta: Dict) -> bool:
+    content_type = (headers.get('Content-Type') or headers.get('content-type') or '').lower()
+    if 'text/html' in content_type:
+        meta["rejected"] = "html content type"
+        return False
+    length = headers.get('Content-Length') or headers.get('content-length')
+    if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+        meta["rejected"] = f"content length {length} over {max_bytes}"
+        return False
+    return True
+
+async def stream_to_file(chunks: AsyncIterator[bytes], filepath: str, max_bytes: Optional[int], meta: Dict) -> bool:
+    tmp_path = f"{filepath}.{uuid.uuid4().hex[:8]}.part"
+    f = await asyncio.to_thread(open, tmp_path, 'wb')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if size == 0:
+                mime = sniff_mime(chunk)
+                if mime == "text/html":
+                    meta["rejected"] = "html body"
+                    return False
+                meta["mime"] = mime
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                meta["rejected"] = f"body over {max_bytes} bytes"
+                return False
+            digest.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+        
+        await asyncio.to_thread(f.close)
+        if size == 0:
+            meta["rejected"] = "empty body"
+            return False
+        os.replace(tmp_path, filepath)
+        meta["size"] = size
+        meta["sha256"] = digest.hexdigest()
+        return True
+    finally:
+        if not f.closed:
+            await asyncio.to_thread(f.close)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class TLSFingerprintDownloader:
+    @staticmethod
+    async def download_with_fingerprint(url: str, filepath: str, session: Optional["AsyncSession"] = None,
+                                        headers: Optional[Dict[str, str]] = None, meta: Optional[Dict] = None,
+                                        max_bytes: Optional[int] = None) -> bool:
+        if AsyncSession is None:
+            return False
+        if session is None:
+            async with AsyncSession() as own_session:
+                return await TLSFingerprintDownloader.download_with_fingerprint(
+                    url, filepath, own_session, headers, meta, max_bytes)
+        # A response is final: retryable statuses raise for the retry engine and others are rejected.
+        # False without meta["rejected"] means curl_cffi itself failed and the caller may fall back
+        meta = meta if meta is not None else {}
+        try:
+            response = await session.get(
+                url,
+                headers=headers or None,
+                impersonate="chrome126",
+                timeout=30,
+                stream=True
+            )
+            try:
+                meta["status"] = response.status_code
+                meta["first_byte_at"] = time.monotonic()
+                if response.status_code == 304:
+                    return True
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise HttpStatusError(response.status_code, url, response.headers.get('retry-after'))
+                if response.status_code != 200:
+                    meta["rejected"] = f"status {response.status_code}"
+                    return False
+                meta["etag"] = response.headers.get('etag')
+                meta["last_modified"] = response.headers.get('last-modified')
+                if not precheck_response(response.headers, max_bytes, meta):
+                    return False
                 
-                elements = await page.query_selector_all('a, button, input[type="submit"]')
-                if elements:
-                    first_element = elements[0]
-                    box = await first_element.bounding_box()
-                    if box:
-                        await self.humanizer.human_mouse_move(page, box['x'] + box['width']/2, box['y'] + box['height']/2)
-                        await asyncio.sleep(random.uniform(0.2, 0.8))
-                        await page.mouse.down()
-                        await asyncio.sleep(random.uniform(0.05, 0.1))
-                        await page.mouse.up()
-                        await asyncio.sleep(random.uniform(1.0, 2.5))
+                return await stream_to_file(response.aiter_content(), filepath, max_bytes, meta)
+            finally:
+                await response.aclose()
+        except HttpStatusError:
+            raise
+        except Exception as e:
+            logging.warning("TLS download failed for %s, falling back to aiohttp: %s", url, e)
+        return False
+
+class RangeDownloader:
+    def __init__(self, session: ClientSession, partial_dir: str, segments: int, segment_threshold: int):
+        self.session = session
+        self.partial_dir = partial_dir
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        os.makedirs(partial_dir, exist_ok=True)
+    
+    def partial_path(self, url: str) -> str:
+        return os.path.join(self.partial_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + ".part")
+    
+    @staticmethod
+    def load_state(path: str) -> Dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    @staticmethod
+    def save_state(path: str, state: Dict):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    
+    @staticmethod
+    def discard(part_path: str, segments: int = 0):
+        for path in [part_path, f"{part_path}.json"] + [f"{part_path}.seg{i}" for i in range(segments)]:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    @staticmethod
+    def file_digests(path: str) -> Tuple[Dict[str, bytes], int, bytes]:
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5()
+        size = 0
+        with open(path, 'rb') as f:
+            head = f.read(512)
+            f.seek(0)
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+                md5.update(chunk)
+                size += len(chunk)
+        return {"sha-256": sha256.digest(), "md5": md5.digest()}, size, head
+    
+    @staticmethod
+    def expected_digests(headers) -> Dict[str, bytes]:
+        # Repr-Digest (RFC 9530) wraps base64 values in colons, Digest (RFC 3230) does not;
+        # Content-MD5 is the deprecated fallback few servers still send
+        expected: Dict[str, bytes] = {}
+        for name in ("Repr-Digest", "Digest"):
+            for item in (headers.get(name) or "").split(","):
+                algorithm, _, value = item.partition("=")
+                algorithm = algorithm.strip().lower()
+                if algorithm not in ("sha-256", "md5") or algorithm in expected:
+                    continue
+                try:
+                    expected[algorithm] = base64.b64decode(value.strip().strip(":"), validate=True)
+                except ValueError:
+                    continue
+        if "md5" not in expected and headers.get('Content-MD5'):
+            try:
+                expected["md5"] = base64.b64decode(headers['Content-MD5'].strip(), validate=True)
+            except ValueError:
+                pass
+        return expected
+    
+    async def append_stream(self, response, path: str, mode: str, limit: Optional[int]) -> int:
+        written = 0
+        f = await asyncio.to_thread(open, path, mode)
+        try:
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                written += len(chunk)
+                if limit and written > limit:
+                    raise ValueError(f"Range response longer than the {limit} bytes requested")
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        return written
+    
+    async def download(self, url: str, filepath: str, validators: Optional[Dict[str, str]], meta: Dict,
+                       max_bytes: Optional[int]) -> Optional[bool]:
+        # Returns None when the server gives nothing to resume against, so the caller can use a plain GET
+        async with self.session.head(url, headers=validators or None, allow_redirects=True) as response:
+            meta["status"] = response.status
+            meta["first_byte_at"] = time.monotonic()
+            if response.status == 304:
+                return True
+            if response.status != 200:
+                return None
+            headers = response.headers
+        
+        length = headers.get('Content-Length', '')
+        total = int(length) if length.isdigit() else None
+        accepts_ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+        if total is None or not accepts_ranges:
+            return None
+        if not precheck_response(headers, max_bytes, meta):
+            return False
+        
+        meta["etag"] = headers.get('ETag')
+        meta["last_modified"] = headers.get('Last-Modified')
+        part_path = self.partial_path(url)
+        state_path = f"{part_path}.json"
+        state = {"url": url, "etag": meta["etag"], "last_modified": meta["last_modified"], "total": total}
+        
+        segments = self.segments if total >= self.segment_threshold else 1
+        previous = self.load_state(state_path)
+        if previous and (previous.get("etag"), previous.get("last_modified"), previous.get("total")) != (
+                state["etag"], state["last_modified"], total):
+            # The remote file changed since the partial was written
+            self.discard(part_path, previous.get("segments", 0))
+            previous = {}
+        if previous.get("segments", segments) != segments:
+            segments = previous["segments"]
+        state["segments"] = segments
+        self.save_state(state_path, state)
+        
+        if segments > 1:
+            await self.fetch_segments(url, part_path, total, segments, meta["etag"])
+        else:
+            await self.fetch_single(url, part_path, total, meta["etag"])
+        
+        digests, size, head = await asyncio.to_thread(self.file_digests, part_path)
+        expected = self.expected_digests(headers)
+        mismatched = [algorithm for algorithm, value in expected.items() if digests[algorithm] != value]
+        if size != total or mismatched:
+            logging.warning("Discarding %s: got %s of %s bytes, mismatched digests %s", url, size, total, mismatched or "none")
+            self.discard(part_path, segments)
+            meta["rejected"] = "size or checksum mismatch"
+            return False
+        # Without a digest from the server only the size was checked
+        meta["checksum"] = "sha-256" if "sha-256" in expected else "md5" if expected else "unverified"
+        
+        mime = sniff_mime(head)
+        if mime == "text/html":
+            self.discard(part_path, segments)
+            meta["rejected"] = "html body"
+            return False
+        
+        os.replace(part_path, filepath)
+        self.discard(part_path, segments)
+        meta.update({"status": 200, "size": size, "sha256": digests["sha-256"].hex(), "mime": mime})
+        return True
+    
+    async def fetch_single(self, url: str, part_path: str, total: int, etag: Optional[str]):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset >= total:
+            return
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        if offset and etag:
+            headers["If-Range"] = etag
+        
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 206:
+                mode = 'ab'
+            elif response.status == 200:
+                mode, offset = 'wb', 0
+            else:
+                raise aiohttp.ClientResponseError(response.request_info, (), status=response.status,
+                                                  message="Unexpected status while resuming")
+            await self.append_stream(response, part_path, mode, total - offset)
+    
+    async def fetch_segments(self, url: str, part_path: str, total: int, segments: int, etag: Optional[str]):
+        step = total // segments
+        bounds = [(i * step, total - 1 if i == segments - 1 else (i + 1) * step - 1) for i in range(segments)]
+        
+        async def fetch_segment(index: int, start: int, end: int):
+            seg_path = f"{part_path}.seg{index}"
+            have = os.path.getsize(seg_path) if os.path.exists(seg_path) else 0
+            if have >= end - start + 1:
+                return
+            headers = {"Range": f"bytes={start + have}-{end}"}
+            if etag:
+                headers["If-Range"] = etag
+            async with self.session.get(url, headers=headers) as response:
+                if response.status != 206:
+                    raise aiohttp.ClientResponseError(response.request_info, (), status=response.status,
+                                                      message="Server ignored the segment range")
+                await self.append_stream(response, seg_path, 'ab', end - start + 1 - have)
+        
+        await asyncio.gather(*(fetch_segment(i, start, end) for i, (start, end) in enumerate(bounds)))
+        
+        def assemble():
+            with open(part_path, 'wb') as out:
+                for i in range(segments):
+                    with open(f"{part_path}.seg{i}", 'rb') as seg:
+                        for chunk in iter(lambda: seg.read(1024 * 1024), b''):
+                            out.write(chunk)
+            for i in range(segments):
+                os.remove(f"{part_path}.seg{i}")
+        
+        await asyncio.to_thread(assemble)
+
+class AssetStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        
+        # Called from threads so a shard waiting on another's write lock never holds the event loop
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self.db.commit()
+    
+    @staticmethod
+    def hash_file(filepath: str) -> Tuple[str, int]:
+        digest = hashlib.sha256()
+        size = 0
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+    
+    def temp_path(self) -> str:
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+    
+    def blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest[2:4], f"{digest}.{ext}")
+    
+    def lookup(self, url: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT blobs.path FROM urls JOIN blobs ON urls.hash = blobs.hash WHERE urls.url = ?", (url,)
+            ).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+    
+    def commit(self, url: str, tmp_path: str, digest: str, size: int, ext: str) -> str:
+        with self.lock:
+            row = self.db.execute("SELECT path FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row and os.path.exists(row[0]):
+                os.remove(tmp_path)
+                path = row[0]
+            else:
+                path = self.blob_path(digest, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self.db.execute("INSERT OR REPLACE INTO blobs (hash, path, size) VALUES (?, ?, ?)", (digest, path, size))
+            
+            self.db.execute("INSERT OR REPLACE INTO urls (url, hash, fetched_at) VALUES (?, ?, ?)", (url, digest, time.time()))
+            self.db.commit()
+        return path
+    
+    def close(self):
+        self.db.close()
+
+class FetchCache:
+    # Blocking like AssetStore; ScrapeCore calls it from threads
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fetches (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, fetched_at REAL NOT NULL)"
+        )
+        try:
+            self.db.execute("ALTER TABLE fetches ADD COLUMN links TEXT")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        self.db.commit()
+    
+    def get(self, url: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, content_hash, fetched_at FROM fetches WHERE url = ?", (url,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "fetched_at": row[3]}
+    
+    def validators(self, url: str) -> Dict[str, str]:
+        entry = self.get(url)
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    
+    def is_fresh(self, url: str, max_age: Optional[float]) -> bool:
+        entry = self.get(url)
+        if entry is None:
+            return False
+        return max_age is None or time.time() - entry["fetched_at"] < max_age
+    
+    def record(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               content_hash: Optional[str] = None, links: Optional[List[str]] = None):
+        # Pages keep their outgoing links so a crawl can go on past them while they are unchanged
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO fetches (url, etag, last_modified, content_hash, fetched_at, links) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+                "content_hash = COALESCE(excluded.content_hash, fetches.content_hash), fetched_at = excluded.fetched_at, "
+                "links = COALESCE(excluded.links, fetches.links)",
+                (url, etag, last_modified, content_hash, time.time(), json.dumps(links) if links is not None else None)
+            )
+            self.db.commit()
+    
+    def links(self, url: str) -> List[str]:
+        with self.lock:
+            row = self.db.execute("SELECT links FROM fetches WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else []
+    
+    def touch(self, url: str):
+        with self.lock:
+            self.db.execute("UPDATE fetches SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+    
+    def revisit(self, url: str) -> List[str]:
+        # An unchanged page counts as fetched now; its stored links are what a crawl follows
+        self.touch(url)
+        return self.links(url)
+    
+    def close(self):
+        self.db.close()
+
+class WarcArchive:
+    # One gzip member per WARC record, so any record can be read back from its offset alone
+    HOP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection"}
+    
+    def __init__(self, directory: str, rotate_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS records (url TEXT NOT NULL, filename TEXT NOT NULL, offset INTEGER NOT NULL, "
+            "length INTEGER NOT NULL, status INTEGER, content_type TEXT, archived_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS records_url ON records (url)")
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.file = None
+        self.filename: Optional[str] = None
+        self.sequence = 0
+    
+    @staticmethod
+    def record(headers: Dict[str, str], block: bytes) -> bytes:
+        head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        head += f"Content-Length: {len(block)}\r\n\r\n"
+        return gzip.compress(head.encode("utf-8") + block + b"\r\n\r\n")
+    
+    @staticmethod
+    def warc_date() -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    
+    def open_file(self):
+        self.sequence += 1
+        self.filename = f"crawl-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self.sequence:05d}.warc.gz"
+        self.file = open(os.path.join(self.directory, self.filename), 'ab')
+        info = b"software: webscrapping.py\r\nformat: WARC File Format 1.1\r\n"
+        self.file.write(self.record({
+            "WARC-Type": "warcinfo",
+            "WARC-Date": self.warc_date(),
+            "WARC-Filename": self.filename,
+            "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+            "Content-Type": "application/warc-fields"
+        }, info))
+    
+    def write(self, url: str, final_url: str, status: int, reason: str, headers: Dict[str, str], body: bytes):
+        # Bodies are stored decoded, so transfer and content encodings are dropped from the headers
+        http_head = f"HTTP/1.1 {status} {reason or ''}\r\n"
+        http_head += "".join(f"{k}: {v}\r\n" for k, v in headers.items() if k.lower() not in self.HOP_HEADERS)
+        http_head += f"Content-Length: {len(body)}\r\n\r\n"
+        data = self.record({
+            "WARC-Type": "response",
+            "WARC-Target-URI": final_url,
+            "WARC-Date": self.warc_date(),
+            "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+            "WARC-Payload-Digest": f"sha256:{hashlib.sha256(body).hexdigest()}",
+            "Content-Type": "application/http;msgtype=response"
+        }, http_head.encode("utf-8") + body)
+        
+        content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), None)
+        with self.lock:
+            if self.file is None or self.file.tell() >= self.rotate_bytes:
+                self.close_file()
+                self.open_file()
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            now = time.time()
+            self.db.executemany(
+                "INSERT INTO records (url, filename, offset, length, status, content_type, archived_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(u, self.filename, offset, len(data), status, content_type, now) for u in {url, final_url}]
+            )
+            self.db.commit()
+    
+    def read(self, url: str) -> Optional[Tuple[int, Dict[str, str], bytes, str]]:
+        # Returns status, headers, body and the URL the response came from, which differs from url after redirects
+        with self.lock:
+            row = self.db.execute(
+                "SELECT filename, offset, length FROM records WHERE url = ? ORDER BY archived_at DESC, rowid DESC LIMIT 1", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        with open(os.path.join(self.directory, row[0]), 'rb') as f:
+            f.seek(row[1])
+            data = gzip.decompress(f.read(row[2]))
+        
+        warc_head, _, http = data.partition(b"\r\n\r\n")
+        target_uri = url
+        for line in warc_head.decode("utf-8", errors="replace").split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "warc-target-uri":
+                target_uri = value.strip()
+        head, _, body = http.partition(b"\r\n\r\n")
+        lines = head.decode("utf-8", errors="replace").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip()] = value.strip()
+        length = int(headers.get("Content-Length", len(body) - 4))
+        return status, headers, body[:length], target_uri
+    
+    def urls(self) -> List[str]:
+        with self.lock:
+            return [url for (url,) in self.db.execute("SELECT DISTINCT url FROM records WHERE status = 200 ORDER BY rowid")]
+    
+    def close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def close(self):
+        with self.lock:
+            self.close_file()
+        self.db.close()
+
+SIMHASH_LANE = 32
+SIMHASH_SPREAD = [[sum((byte >> i & 1) << (SIMHASH_LANE * (pos * 8 + i)) for i in range(8)) for byte in range(256)]
+                  for pos in range(8)]
+
+class NearDuplicateIndex:
+    # 64-bit SimHash over word 3-shingles; the fingerprint is split into bands and any page
+    # within max_distance bits must match another on at least one band, so only those
+    # candidates are compared. Bands are kept in SQLite too: shard processes sharing the
+    # file look candidates up there instead of in a per-process copy
+    WORD = re.compile(r"\w+", re.UNICODE)
+    
+    def __init__(self, path: str, max_distance: int = 3, min_words: int = 50, shared: bool = False):
+        self.max_distance = max_distance
+        self.min_words = min_words
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS simhashes (url TEXT PRIMARY KEY, fingerprint INTEGER NOT NULL)")
+        # width is band_bits, so a file written with another max_distance is re-banded rather than misread
+        self.db.execute("CREATE TABLE IF NOT EXISTS simhash_bands (width INTEGER NOT NULL, band INTEGER NOT NULL, "
+                        "value INTEGER NOT NULL, url TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS simhash_band_lookup ON simhash_bands (width, band, value)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS simhash_band_url ON simhash_bands (url)")
+        self.db.commit()
+        self.db.execute("BEGIN IMMEDIATE")
+        banded = self.db.execute("SELECT COUNT(DISTINCT url) FROM simhash_bands WHERE width = ?", (self.band_bits,)).fetchone()[0]
+        if banded != self.db.execute("SELECT COUNT(*) FROM simhashes").fetchone()[0]:
+            self.db.execute("DELETE FROM simhash_bands")
+            for url, signed in self.db.execute("SELECT url, fingerprint FROM simhashes").fetchall():
+                self.store_bands(url, signed & 0xFFFFFFFFFFFFFFFF)
+        self.db.commit()
+        self.fingerprints: Dict[str, int] = {}
+        self.buckets: Dict[Tuple[int, int], List[str]] = {}
+        if not shared:
+            for url, signed in self.db.execute("SELECT url, fingerprint FROM simhashes"):
+                self.index(url, signed & 0xFFFFFFFFFFFFFFFF)
+    
+    @staticmethod
+    def fingerprint(text: str, min_words: int = 0) -> Optional[int]:
+        words = NearDuplicateIndex.WORD.findall(text.lower())
+        if len(words) < max(min_words, 3):
+            return None
+        # Per-bit counts are kept in LANE-bit lanes of one big integer, so each shingle costs
+        # eight table lookups and additions instead of a Python loop over 64 bits
+        lanes = SIMHASH_SPREAD
+        total = 0
+        shingles = len(words) - 2
+        for i in range(shingles):
+            digest = hashlib.blake2b(" ".join(words[i:i + 3]).encode("utf-8"), digest_size=8).digest()
+            total += (lanes[0][digest[0]] + lanes[1][digest[1]] + lanes[2][digest[2]] + lanes[3][digest[3]]
+                      + lanes[4][digest[4]] + lanes[5][digest[5]] + lanes[6][digest[6]] + lanes[7][digest[7]])
+        mask = (1 << SIMHASH_LANE) - 1
+        return sum(1 << bit for bit in range(64) if (total >> (bit * SIMHASH_LANE) & mask) * 2 > shingles)
+    
+    def band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+    
+    def index(self, url: str, fingerprint: int):
+        self.fingerprints[url] = fingerprint
+        for key in self.band_keys(fingerprint):
+            self.buckets.setdefault(key, []).append(url)
+    
+    def store_bands(self, url: str, fingerprint: int):
+        self.db.execute("DELETE FROM simhash_bands WHERE url = ?", (url,))
+        self.db.executemany("INSERT INTO simhash_bands (width, band, value, url) VALUES (?, ?, ?, ?)",
+                            [(self.band_bits, band, value, url) for band, value in self.band_keys(fingerprint)])
+    
+    def find_shared(self, url: str, fingerprint: int) -> Optional[str]:
+        for band, value in self.band_keys(fingerprint):
+            for candidate, signed in self.db.execute(
+                "SELECT s.url, s.fingerprint FROM simhash_bands b JOIN simhashes s ON s.url = b.url "
+                "WHERE b.width = ? AND b.band = ? AND b.value = ? AND b.url != ?",
+                (self.band_bits, band, value, url)
+            ):
+                if bin((signed & 0xFFFFFFFFFFFFFFFF) ^ fingerprint).count("1") <= self.max_distance:
+                    return candidate
+        return None
+    
+    def find(self, url: str, fingerprint: int) -> Optional[str]:
+        if self.shared:
+            return self.find_shared(url, fingerprint)
+        for key in self.band_keys(fingerprint):
+            for candidate in self.buckets.get(key, ()):
+                # Bucket entries can be stale after a page was re-fingerprinted
+                stored = self.fingerprints.get(candidate)
+                if candidate == url or stored is None or (stored >> (key[0] * self.band_bits) & ((1 << self.band_bits) - 1)) != key[1]:
+                    continue
+                if bin(stored ^ fingerprint).count("1") <= self.max_distance:
+                    return candidate
+        return None
+    
+    def check(self, url: str, fingerprint: Optional[int]) -> Optional[str]:
+        # Blocking; callers on the event loop run it in a thread
+        if fingerprint is None:
+            return None
+        signed = fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+        with self.lock:
+            # The write lock is taken before the lookup, so two processes seeing near-identical
+            # pages at once cannot both store theirs as an original
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                duplicate_of = self.find(url, fingerprint)
+                if duplicate_of is None:
+                    if self.shared:
+                        row = self.db.execute("SELECT fingerprint FROM simhashes WHERE url = ?", (url,)).fetchone()
+                        stored = row[0] & 0xFFFFFFFFFFFFFFFF if row else None
+                    else:
+                        stored = self.fingerprints.get(url)
+                    if stored != fingerprint:
+                        if not self.shared:
+                            self.index(url, fingerprint)
+                        self.db.execute("INSERT OR REPLACE INTO simhashes (url, fingerprint) VALUES (?, ?)", (url, signed))
+                        self.store_bands(url, fingerprint)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+        return duplicate_of
+    
+    def close(self):
+        self.db.close()
+
+class OutputSink:
+    def write(self, record: Dict):
+        raise NotImplementedError
+    
+    def location(self, record: Dict) -> Optional[str]:
+        # Where the record just written ended up, for callers that report it
+        return None
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.flush()
+
+class JsonDirSink(OutputSink):
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+    
+    def location(self, record: Dict) -> str:
+        sanitized_domain = re.sub(r'[^\w\-\.]', '_', urlparse(record["url"]).netloc)
+        return os.path.join(self.output_dir, sanitized_domain, "content.json")
+    
+    def write(self, record: Dict):
+        path = self.location(record)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+
+class RotatingSink(OutputSink):
+    extension = ""
+    
+    def __init__(self, directory: str, rotate_bytes: int, rotate_seconds: float):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.path: Optional[str] = None
+        self.opened_at = 0.0
+        self.sequence = 0
+        os.makedirs(directory, exist_ok=True)
+    
+    def next_path(self) -> str:
+        self.sequence += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        return os.path.join(self.directory, f"pages-{stamp}-{os.getpid()}-{self.sequence:05d}{self.extension}")
+    
+    def should_rotate(self) -> bool:
+        if self.path is None:
+            return False
+        return (self.bytes_written() >= self.rotate_bytes
+                or time.monotonic() - self.opened_at >= self.rotate_seconds)
+    
+    def bytes_written(self) -> int:
+        raise NotImplementedError
+    
+    def location(self, record: Dict) -> str:
+        # Buffered Parquet rows have no file yet; the directory is the best answer until they do
+        return self.path or self.directory
+
+class JsonlSink(RotatingSink):
+    def __init__(self, directory: str, rotate_bytes: int, rotate_seconds: float, compression: Optional[str] = None,
+                 flush_records: int = 500, flush_seconds: float = 1.0):
+        if compression not in (None, "zstd"):
+            raise ValueError(f"Unsupported JSONL compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd output requires: pip install zstandard")
+        self.extension = ".jsonl.zst" if compression else ".jsonl"
+        self.compression = compression
+        self.raw = None
+        self.stream = None
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.pending = 0
+        self.flushed_at = 0.0
+        super().__init__(directory, rotate_bytes, rotate_seconds)
+    
+    def open(self):
+        self.path = self.next_path()
+        self.opened_at = self.flushed_at = time.monotonic()
+        self.raw = open(self.path, 'ab')
+        if self.compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+    
+    def bytes_written(self) -> int:
+        return self.raw.tell() if self.raw else 0
+    
+    def write(self, record: Dict):
+        if self.should_rotate():
+            self.close()
+        if self.stream is None:
+            self.open()
+        line = json.dumps(dict(record, fetched_at=time.time()), ensure_ascii=False) + "\n"
+        self.stream.write(line.encode('utf-8'))
+        self.pending += 1
+        if self.pending >= self.flush_records or time.monotonic() - self.flushed_at >= self.flush_seconds:
+            self.flush()
+    
+    def flush(self):
+        if self.stream is None:
+            return
+        if self.compression == "zstd":
+            # A block flush per batch keeps everything up to the last batch decodable if the process dies
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        self.raw.flush()
+        self.pending = 0
+        self.flushed_at = time.monotonic()
+    
+    def close(self):
+        if self.stream is None:
+            return
+        if self.compression == "zstd":
+            self.stream.flush(zstandard.FLUSH_FRAME)
+        self.raw.close()
+        self.raw = None
+        self.stream = None
+        self.path = None
+        self.pending = 0
+
+class ParquetSink(RotatingSink):
+    extension = ".parquet"
+    
+    def __init__(self, directory: str, rotate_bytes: int, rotate_seconds: float, batch_size: int = 500):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output requires: pip install pyarrow")
+        super().__init__(directory, rotate_bytes, rotate_seconds)
+        self.batch_size = batch_size
+        self.buffer: List[Dict] = []
+        self.writer = None
+        self.link_kinds = ("images", "videos", "documents", "other")
+        self.schema = pyarrow.schema(
+            [("url", pyarrow.string()), ("title", pyarrow.string()), ("text", pyarrow.string()),
+             ("main_text", pyarrow.string()), ("fetched_at", pyarrow.float64())]
+            + [(kind, pyarrow.list_(pyarrow.string())) for kind in self.link_kinds]
+            + [("extra", pyarrow.string())]
+        )
+    
+    def bytes_written(self) -> int:
+        # Row groups are written straight through to the file, so its size tracks what has been flushed
+        return os.path.getsize(self.in_progress_path()) if self.path else 0
+    
+    def in_progress_path(self) -> str:
+        return f"{self.path}.inprogress"
+    
+    def write(self, record: Dict):
+        links = record.get("links") or {}
+        row = {
+            "url": record.get("url"),
+            "title": record.get("title"),
+            "text": record.get("text"),
+            "main_text": record.get("main_text"),
+            "fetched_at": time.time()
+        }
+        for kind in self.link_kinds:
+            row[kind] = list(links.get(kind, []))
+        extra = {k: v for k, v in record.items() if k not in ("url", "title", "text", "main_text", "links")}
+        row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+        self.buffer.append(row)
+        
+        if len(self.buffer) >= self.batch_size or self.should_rotate():
+            self.flush()
+    
+    def flush(self):
+        if self.buffer:
+            if self.writer is None:
+                self.path = self.next_path()
+                self.opened_at = time.monotonic()
+                self.writer = pq.ParquetWriter(self.in_progress_path(), self.schema, compression="zstd")
+            self.writer.write_table(pyarrow.Table.from_pylist(self.buffer, schema=self.schema))
+            self.buffer = []
+        if self.should_rotate():
+            self.close_file()
+    
+    def close_file(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.in_progress_path(), self.path)
+        self.writer = None
+        self.path = None
+    
+    def close(self):
+        self.flush()
+        self.close_file()
+
+def make_sink(config: ScrapeConfig, output_dir: str) -> OutputSink:
+    if config.output_format == "json":
+        return JsonDirSink(output_dir)
+    if config.output_format == "jsonl":
+        return JsonlSink(os.path.join(output_dir, "pages"), config.output_rotate_bytes,
+                         config.output_rotate_seconds, config.output_compression,
+                         config.output_batch_size, config.output_flush_seconds)
+    if config.output_format == "parquet":
+        return ParquetSink(os.path.join(output_dir, "pages"), config.output_rotate_bytes,
+                           config.output_rotate_seconds, config.output_batch_size)
+    raise ValueError(f"Unknown output format: {config.output_format}")
+
+class BloomFilter:
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.0001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+    
+    def add(self, item: str):
+        for pos in self.positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+    
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(item))
+    
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.size.to_bytes(8, 'little'))
+            f.write(self.hashes.to_bytes(4, 'little'))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        bloom = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            bloom.size = int.from_bytes(f.read(8), 'little')
+            bloom.hashes = int.from_bytes(f.read(4), 'little')
+            bloom.bits = bytearray(f.read())
+        return bloom
+
+@dataclass
+class CrawlScope:
+    same_domain: bool = True
+    max_depth: int = 2
+    include_patterns: Tuple[str, ...] = ()
+    exclude_patterns: Tuple[str, ...] = ()
+    allowed_hosts: set = field(default_factory=set)
+    
+    def __post_init__(self):
+        self.include = [re.compile(p) for p in self.include_patterns]
+        self.exclude = [re.compile(p) for p in self.exclude_patterns]
+    
+    def allows(self, url: str, depth: int) -> bool:
+        if depth > self.max_depth:
+            return False
+        if self.same_domain and urlparse(url).hostname not in self.allowed_hosts:
+            return False
+        if self.include and not any(p.search(url) for p in self.include):
+            return False
+        return not any(p.search(url) for p in self.exclude)
+
+class UrlFrontier:
+    def __init__(self, path: str, bloom_capacity: int = 10_000_000, shared: bool = False):
+        self.bloom_path = f"{path}.bloom"
+        self.shared = shared
+        # drain calls in from worker threads; the lock keeps one thread's statements out of another's transaction
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, host TEXT NOT NULL, depth INTEGER NOT NULL, "
+            "priority REAL NOT NULL DEFAULT 0, status TEXT NOT NULL DEFAULT 'pending', added_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS frontier_pending ON frontier (status, priority DESC)")
+        for column in ("worker INTEGER", "finished_at REAL", "not_before REAL"):
+            try:
+                self.db.execute(f"ALTER TABLE frontier ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        if not shared:
+            # Anything claimed by a crashed run goes back to the queue
+            self.db.execute("UPDATE frontier SET status = 'pending' WHERE status = 'in_progress'")
+        self.db.commit()
+        
+        self.unsaved = 0
+        if shared:
+            # Other processes add URLs too, so a per-process Bloom filter would miss them;
+            # the primary key does the de-duplication instead
+            self.seen = None
+        elif os.path.exists(self.bloom_path):
+            self.seen = BloomFilter.load(self.bloom_path)
+        else:
+            self.seen = BloomFilter(bloom_capacity)
+            for (url,) in self.db.execute("SELECT url FROM frontier"):
+                self.seen.add(url)
+    
+    def add(self, url: str, depth: int, priority: float = 0.0) -> bool:
+        # Bloom hits are treated as seen; a false positive drops roughly 1 in 10,000 new URLs
+        with self.lock:
+            if self.seen is not None:
+                if url in self.seen:
+                    return False
+                self.seen.add(url)
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO frontier (url, host, depth, priority, added_at) VALUES (?, ?, ?, ?, ?)",
+                (url, urlparse(url).netloc, depth, priority, time.time())
+            )
+            self.unsaved += 1
+            if self.unsaved >= 1000:
+                self.flush_locked()
+            return cursor.rowcount > 0
+    
+    def add_many(self, urls: List[str], depth: int, priority: float = 0.0) -> int:
+        return sum(self.add(url, depth, priority) for url in urls)
+    
+    def pop(self, skip_hosts: Optional[set] = None, worker: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        # Hosts that are at their concurrency limit or inside a crawl delay are passed over,
+        # so one slow host never stalls the workers
+        skip_hosts = list(skip_hosts or ())
+        placeholders = ",".join("?" * len(skip_hosts))
+        host_filter = f"AND host NOT IN ({placeholders}) " if skip_hosts else ""
+        with self.lock:
+            while True:
+                row = self.db.execute(
+                    f"SELECT url, depth FROM frontier WHERE status = 'pending' AND COALESCE(not_before, 0) <= ? "
+                    f"{host_filter}ORDER BY priority DESC, rowid LIMIT 1",
+                    [time.time()] + skip_hosts
+                ).fetchone()
+                if row is None:
+                    return None
+                # The status check makes the claim atomic when several processes share the frontier
+                cursor = self.db.execute("UPDATE frontier SET status = 'in_progress', worker = ? WHERE url = ? AND status = 'pending'",
+                                         (worker, row[0]))
+                self.db.commit()
+                if cursor.rowcount:
+                    return row[0], row[1]
+    
+    def finish(self, url: str, ok: bool = True):
+        with self.lock:
+            self.db.execute("UPDATE frontier SET status = ?, finished_at = ? WHERE url = ?",
+                            ("done" if ok else "failed", time.time(), url))
+            self.db.commit()
+    
+    def defer(self, url: str, until: float):
+        # Back to the queue, but not handed out again before until
+        with self.lock:
+            self.db.execute("UPDATE frontier SET status = 'pending', worker = NULL, not_before = ? WHERE url = ?", (until, url))
+            self.db.commit()
+    
+    def expire(self, max_age: float) -> int:
+        # Finished pages older than max_age go back to the queue, so re-running a crawl revisits them
+        cursor = self.db.execute(
+            "UPDATE frontier SET status = 'pending', worker = NULL "
+            "WHERE status IN ('done', 'failed') AND COALESCE(finished_at, 0) <= ?",
+            (time.time() - max_age,)
+        )
+        self.db.commit()
+        return cursor.rowcount
+    
+    def pending(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM frontier WHERE status = 'pending'").fetchone()[0]
+    
+    def outstanding(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM frontier WHERE status IN ('pending', 'in_progress')").fetchone()[0]
+    
+    def requeue(self, worker: int) -> int:
+        with self.lock:
+            cursor = self.db.execute("UPDATE frontier SET status = 'pending' WHERE status = 'in_progress' AND worker = ?", (worker,))
+            self.db.commit()
+            return cursor.rowcount
+    
+    def flush_locked(self):
+        self.db.commit()
+        self.unsaved = 0
+    
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+    
+    def close(self):
+        with self.lock:
+            self.flush_locked()
+            # The filter is only written on shutdown: a stale one after a crash merely misses recent URLs,
+            # which the primary key still de-duplicates
+            if self.seen is not None:
+                self.seen.save(self.bloom_path)
+            self.db.close()
+
+class HostLeases:
+    # Per-host concurrency and pacing shared by every process of a sharded run; a lease
+    # held by a worker that died expires instead of blocking its host forever. Calls block on
+    # the SQLite write lock, so the event loop makes them from a thread
+    LEASE_SECONDS = 600.0
+    
+    def __init__(self, path: str, worker: int):
+        self.worker = worker
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS host_leases (id INTEGER PRIMARY KEY, host TEXT NOT NULL, "
+            "worker INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS host_pacing (host TEXT PRIMARY KEY, next_allowed REAL NOT NULL)")
+    
+    def try_acquire(self, host: str, limit: int, interval: float) -> Tuple[Optional[int], float]:
+        with self.lock:
+            return self.acquire_locked(host, limit, interval)
+    
+    def acquire_locked(self, host: str, limit: int, interval: float) -> Tuple[Optional[int], float]:
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("DELETE FROM host_leases WHERE expires_at < ?", (now,))
+            held = self.db.execute("SELECT COUNT(*) FROM host_leases WHERE host = ?", (host,)).fetchone()[0]
+            row = self.db.execute("SELECT next_allowed FROM host_pacing WHERE host = ?", (host,)).fetchone()
+            ready_at = row[0] if row else 0.0
+            if held >= max(1, limit) or ready_at > now:
+                self.db.execute("COMMIT")
+                return None, max(ready_at - now, 0.05)
+            cursor = self.db.execute("INSERT INTO host_leases (host, worker, expires_at) VALUES (?, ?, ?)",
+                                     (host, self.worker, now + self.LEASE_SECONDS))
+            self.db.execute("INSERT OR REPLACE INTO host_pacing (host, next_allowed) VALUES (?, ?)", (host, now + interval))
+            self.db.execute("COMMIT")
+            return cursor.lastrowid, 0.0
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+    
+    def release(self, lease_id: int):
+        with self.lock:
+            self.db.execute("DELETE FROM host_leases WHERE id = ?", (lease_id,))
+    
+    def defer(self, host: str, until: float):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO host_pacing (host, next_allowed) VALUES (?, ?) "
+                "ON CONFLICT(host) DO UPDATE SET next_allowed = MAX(next_allowed, excluded.next_allowed)",
+                (host, until)
+            )
+    
+    def release_worker(self, worker: int):
+        with self.lock:
+            self.db.execute("DELETE FROM host_leases WHERE worker = ?", (worker,))
+    
+    def reset(self):
+        with self.lock:
+            self.db.execute("DELETE FROM host_leases")
+            self.db.execute("DELETE FROM host_pacing")
+    
+    def busy_hosts(self, limits: Dict[str, int], default: int) -> set:
+        # limits holds this process's current per-host caps; hosts it has no cap for get default
+        now = time.time()
+        with self.lock:
+            busy = {host for (host,) in self.db.execute("SELECT host FROM host_pacing WHERE next_allowed > ?", (now,))}
+            held = self.db.execute("SELECT host, COUNT(*) FROM host_leases WHERE expires_at >= ? GROUP BY host", (now,)).fetchall()
+        busy.update(host for host, count in held if count >= max(1, limits.get(host, default)))
+        return busy
+    
+    def close(self):
+        self.db.close()
+
+class AdaptiveLimiter:
+    # AIMD: every success adds 1/limit (about one slot per window of completions), while
+    # overload signals cut the limit by decrease_factor at most once per cooldown
+    def __init__(self, name: str, initial: int, minimum: int, maximum: int, signals: set,
+                 decrease_factor: float = 0.5, cooldown: float = 2.0):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.signals = signals
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.last_decrease = 0.0
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+    
+    @property
+    def full(self) -> bool:
+        return self.in_flight >= int(self.limit)
+    
+    def on_success(self, seconds: float):
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        # The baseline follows the best smoothed latency seen and slowly forgets it
+        self.baseline = self.latency if self.baseline is None else min(self.baseline * 1.01, self.latency)
+        if "latency" in self.signals and self.latency > 2 * self.baseline:
+            self.back_off("latency")
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+    
+    def on_error(self, error_class: str):
+        if error_class in self.signals:
+            self.back_off(error_class)
+    
+    def back_off(self, reason: str):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        METRICS.inc("limiter_backoffs_total", limiter=self.name, reason=reason)
+        logging.info("Concurrency for %s backed off to %s (%s)", self.name, int(self.limit), reason)
+    
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.full)
+            self.in_flight += 1
+    
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+class LatencyClock:
+    # The latency an adaptive slot reports: from entry (or restart) to stop(), or to the end of the slot.
+    # Callers stop it at the response headers so body size and their own sleeps are not counted
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stopped: Optional[float] = None
+    
+    def restart(self):
+        self.started = time.monotonic()
+        self.stopped = None
+    
+    def stop(self, at: Optional[float] = None):
+        if self.stopped is None:
+            self.stopped = at if at is not None else time.monotonic()
+    
+    @property
+    def seconds(self) -> float:
+        return max(0.0, (self.stopped or time.monotonic()) - self.started)
+
+class AdaptiveLimits:
+    # A global limiter plus one per host; hosts react to throttling, server errors and their own
+    # latency, the global limit to timeouts, connection failures and memory pressure. Latency stays
+    # per host: an average across hosts of very different speeds says nothing about any of them
+    HOST_SIGNALS = {"throttled", "blocked", "server", "timeout", "connect", "latency"}
+    GLOBAL_SIGNALS = {"timeout", "connect"}
+    
+    def __init__(self, name: str, initial: int, maximum: int, host_initial: int, host_maximum: int, minimum: int = 1):
+        self.name = name
+        self.global_limiter = AdaptiveLimiter(name, initial, minimum, maximum, self.GLOBAL_SIGNALS)
+        self.host_initial = host_initial
+        self.host_maximum = host_maximum
+        self.hosts: Dict[str, AdaptiveLimiter] = {}
+    
+    def host(self, host: str) -> AdaptiveLimiter:
+        if host not in self.hosts:
+            self.hosts[host] = AdaptiveLimiter(f"{self.name}:{host}", self.host_initial, 1, self.host_maximum,
+                                               self.HOST_SIGNALS)
+        return self.hosts[host]
+    
+    def busy_hosts(self) -> set:
+        return {host for host, limiter in self.hosts.items() if limiter.full}
+    
+    @asynccontextmanager
+    async def slot(self, host: str):
+        limiters = [self.global_limiter, self.host(host)]
+        acquired = []
+        try:
+            for limiter in limiters:
+                await limiter.acquire()
+                acquired.append(limiter)
+            # Queueing for the slots is not latency; callers restart the clock after politeness waits
+            clock = LatencyClock()
+            try:
+                yield clock
+            except Exception as e:
+                error_class = classify_error(e)
+                for limiter in limiters:
+                    limiter.on_error(error_class)
+                raise
+            for limiter in limiters:
+                limiter.on_success(clock.seconds)
+        finally:
+            for limiter in acquired:
+                await limiter.release()
+        METRICS.set_gauge("concurrency_limit", int(self.global_limiter.limit), limiter=self.name)
+
+class HostScheduler:
+    ROBOTS_TTL = 86400.0
+    
+    def __init__(self, config: ScrapeConfig, session: ClientSession, leases: Optional[HostLeases] = None):
+        self.config = config
+        self.session = session
+        self.leases = leases
+        self.robots: Dict[str, Tuple[Optional[RobotFileParser], float]] = {}
+        self.robots_locks: Dict[str, asyncio.Lock] = {}
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.page_limits: Optional[AdaptiveLimits] = None
+        if config.adaptive_concurrency:
+            self.page_limits = AdaptiveLimits("pages", config.concurrency, config.adaptive_max_concurrency,
+                                              config.host_concurrency, config.adaptive_max_per_host,
+                                              config.adaptive_min_concurrency)
+        self.next_allowed: Dict[str, float] = {}
+        self.intervals: Dict[str, float] = {}
+    
+    async def robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parsed = urlparse(url)
+        host = parsed.netloc
+        cached = self.robots.get(host)
+        if cached and time.monotonic() - cached[1] < self.ROBOTS_TTL:
+            return cached[0]
+        
+        lock = self.robots_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            cached = self.robots.get(host)
+            if cached and time.monotonic() - cached[1] < self.ROBOTS_TTL:
+                return cached[0]
+            
+            parser = None
+            try:
+                with METRICS.timer("robots"):
+                    async with self.session.get(f"{parsed.scheme}://{host}/robots.txt",
+                                                timeout=aiohttp.ClientTimeout(total=10)) as response:
+                        if response.status == 200:
+                            parser = RobotFileParser()
+                            parser.parse((await response.text(errors='replace')).splitlines())
+            except Exception as e:
+                logging.warning("robots.txt unavailable for %s: %s", host, e)
+            
+            delay = None
+            if parser is not None:
+                delay = parser.crawl_delay(self.config.user_agent)
+                rate = parser.request_rate(self.config.user_agent)
+                if delay is None and rate is not None and rate.requests:
+                    delay = rate.seconds / rate.requests
+            self.intervals[host] = min(max(self.config.min_host_interval, float(delay or 0)), self.config.max_crawl_delay)
+            self.robots[host] = (parser, time.monotonic())
+            return parser
+    
+    async def allowed(self, url: str) -> bool:
+        if not self.config.respect_robots:
+            return True
+        parser = await self.robots_for(url)
+        return parser is None or parser.can_fetch(self.config.user_agent, url)
+    
+    def host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(max(1, self.config.host_concurrency))
+        return self.host_limits[host]
+    
+    def host_cap(self, host: str) -> int:
+        # With adaptive limits a host gets as many leases across processes as its limiter here allows
+        if self.page_limits is None:
+            return self.config.host_concurrency
+        limiter = self.page_limits.hosts.get(host)
+        return int(limiter.limit) if limiter is not None else self.page_limits.host_initial
+    
+    async def busy_hosts(self) -> set:
+        now = time.monotonic()
+        busy = {host for host, ready_at in self.next_allowed.items() if ready_at > now}
+        busy.update(host for host, limit in self.host_limits.items() if limit.locked())
+        if self.page_limits is not None:
+            busy.update(self.page_limits.busy_hosts())
+        if self.leases is not None:
+            caps = {host: self.host_cap(host) for host in self.page_limits.hosts} if self.page_limits is not None else {}
+            busy.update(await asyncio.to_thread(self.leases.busy_hosts, caps, self.host_cap("")))
+        return busy
+    
+    async def defer(self, url: str, delay: float):
+        # Retry-After and retry backoff push back the whole host, not just the URL being retried
+        host = urlparse(url).netloc
+        self.next_allowed[host] = max(self.next_allowed.get(host, 0.0), time.monotonic() + delay)
+        if self.leases is not None:
+            await asyncio.to_thread(self.leases.defer, host, time.time() + delay)
+    
+    async def wait_turn(self, host: str):
+        while True:
+            wait = self.next_allowed.get(host, 0.0) - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+    
+    @asynccontextmanager
+    async def slot(self, url: str):
+        # Held for one request: callers take it per attempt so retry backoff never holds a slot
+        host = urlparse(url).netloc
+        if self.config.respect_robots:
+            await self.robots_for(url)
+        interval = self.intervals.get(host, self.config.min_host_interval)
+        if self.leases is None:
+            await self.wait_turn(host)
+        limit = self.page_limits.slot(host) if self.page_limits is not None else self.host_limit(host)
+        async with limit as clock:
+            if self.leases is not None:
+                while True:
+                    lease_id, wait = await asyncio.to_thread(self.leases.try_acquire, host, self.host_cap(host), interval)
+                    if lease_id is not None:
+                        break
+                    await asyncio.sleep(wait)
+                if clock is not None:
+                    clock.restart()
+                try:
+                    yield clock
+                finally:
+                    await asyncio.to_thread(self.leases.release, lease_id)
+                return
+            
+            await self.wait_turn(host)
+            self.next_allowed[host] = time.monotonic() + interval
+            if clock is not None:
+                clock.restart()
+            yield clock
+    
+    @staticmethod
+    def interleave(urls: List[str]) -> List[str]:
+        by_host: Dict[str, List[str]] = {}
+        for url in urls:
+            by_host.setdefault(urlparse(url).netloc, []).append(url)
+        queues = list(by_host.values())
+        ordered = []
+        for i in range(max((len(q) for q in queues), default=0)):
+            ordered.extend(q[i] for q in queues if i < len(q))
+        return ordered
+
+class SitemapDiscovery:
+    # Finds page URLs without rendering anything: robots.txt Sitemap lines (or /sitemap.xml),
+    # nested sitemap indexes and gzip files, parsed as they stream in
+    MAX_DEPTH = 3
+    INFLATE_STEP = 1024 * 1024
+    
+    def __init__(self, config: ScrapeConfig, session: ClientSession, scheduler: HostScheduler,
+                 fetch_cache: Optional[FetchCache] = None):
+        self.config = config
+        self.session = session
+        self.scheduler = scheduler
+        self.fetch_cache = fetch_cache
+    
+    @staticmethod
+    def is_sitemap(url: str) -> bool:
+        return urlparse(url).path.lower().endswith((".xml", ".xml.gz"))
+    
+    @staticmethod
+    def parse_lastmod(value: Optional[str]) -> Optional[float]:
+        # W3C datetime: anything from a bare year to a full timestamp, usually with a Z suffix
+        if not value:
+            return None
+        text = value.strip()
+        if text[-1:] in ("Z", "z"):
+            text = text[:-1] + "+00:00"
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            for fmt in ("%Y-%m", "%Y"):
+                try:
+                    parsed = datetime.strptime(text, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    
+    async def sitemaps_for(self, site: str) -> List[str]:
+        if self.is_sitemap(site):
+            return [site]
+        parsed = urlparse(site)
+        robots = await self.scheduler.robots_for(site)
+        listed = (robots.site_maps() if robots is not None else None) or []
+        return listed or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+    
+    async def read(self, sitemap_url: str) -> AsyncIterator[Tuple[str, str, Optional[float]]]:
+        # Yields ("url" | "sitemap", loc, lastmod); finished entries are dropped from the tree
+        # as soon as they are read, so memory stays flat however long the file is
+        parser = ElementTree.XMLPullParser(events=("start", "end"))
+        root = None
+        inflater = None
+        size = 0
+        # A sitemap request counts against the host's Crawl-delay and limits like a page request
+        timeout = aiohttp.ClientTimeout(total=300, sock_read=30)
+        async with self.scheduler.slot(sitemap_url), self.session.get(sitemap_url, timeout=timeout) as response:
+            if response.status != 200:
+                raise HttpStatusError(response.status, sitemap_url)
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                if inflater is None and size == 0 and chunk[:2] == b"\x1f\x8b":
+                    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                pieces = [chunk]
+                if inflater is not None:
+                    pieces = [inflater.decompress(chunk, self.INFLATE_STEP)]
+                    while inflater.unconsumed_tail and size + sum(map(len, pieces)) <= self.config.sitemap_max_bytes:
+                        pieces.append(inflater.decompress(inflater.unconsumed_tail, self.INFLATE_STEP))
                 
-                return response
+                for piece in pieces:
+                    size += len(piece)
+                    parser.feed(piece)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        root = element if root is None else root
+                        continue
+                    tag = element.tag.rsplit("}", 1)[-1]
+                    if tag not in ("url", "sitemap"):
+                        continue
+                    loc = lastmod = None
+                    for child in element:
+                        name = child.tag.rsplit("}", 1)[-1]
+                        if name == "loc":
+                            loc = (child.text or "").strip()
+                        elif name == "lastmod":
+                            lastmod = self.parse_lastmod(child.text)
+                    root.clear()
+                    if loc:
+                        yield tag, loc, lastmod
                 
+                if size > self.config.sitemap_max_bytes:
+                    logging.warning("Sitemap %s truncated at %s bytes", sitemap_url, self.config.sitemap_max_bytes)
+                    return
+    
+    async def discover(self, sites: List[str]) -> List[str]:
+        found: Dict[str, Optional[float]] = {}
+        pending: List[Tuple[str, int]] = []
+        for site in sites:
+            pending.extend((sitemap, 0) for sitemap in await self.sitemaps_for(site))
+        
+        seen = set()
+        while pending and len(found) < self.config.sitemap_max_urls:
+            sitemap_url, depth = pending.pop()
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                with METRICS.timer("sitemap"):
+                    async for kind, loc, lastmod in self.read(sitemap_url):
+                        loc = normalize_url(urljoin(sitemap_url, loc))
+                        if loc is None:
+                            continue
+                        if kind == "sitemap":
+                            if depth < self.MAX_DEPTH:
+                                pending.append((loc, depth + 1))
+                            continue
+                        if loc not in found or (lastmod or 0.0) > (found[loc] or 0.0):
+                            found[loc] = lastmod
+                        if len(found) >= self.config.sitemap_max_urls:
+                            break
+                METRICS.inc("sitemaps_total", status="ok")
+            except (aiohttp.ClientError, asyncio.TimeoutError, HttpStatusError, ElementTree.ParseError, zlib.error) as e:
+                METRICS.inc("sitemaps_total", status="failed")
+                logging.warning("Sitemap %s unreadable: %s", sitemap_url, e)
+        
+        entries = await asyncio.to_thread(self.changed_since_fetch, found)
+        METRICS.inc("sitemap_urls_total", len(entries), status="queued")
+        
+        # Most recently changed first; undated entries after all dated ones
+        entries.sort(key=lambda entry: (entry[1] is not None, entry[1] or 0.0), reverse=True)
+        logging.info("Sitemaps listed %s URLs from %s files, %s to scrape", len(found), len(seen), len(entries))
+        return [url for url, _ in entries]
+    
+    def changed_since_fetch(self, found: Dict[str, Optional[float]]) -> List[Tuple[str, Optional[float]]]:
+        entries = []
+        for url, lastmod in found.items():
+            # A page fetched after the sitemap says it last changed has nothing new to extract
+            if lastmod is not None and self.fetch_cache is not None and self.config.skip_unchanged_pages:
+                cached = self.fetch_cache.get(url)
+                if cached is not None and cached["fetched_at"] >= lastmod:
+                    METRICS.inc("sitemap_urls_total", status="unchanged")
+                    continue
+            entries.append((url, lastmod))
+        return entries
+    
+    @staticmethod
+    async def collect(config: ScrapeConfig, sites: List[str], output_dir: str = "./output") -> List[str]:
+        os.makedirs(output_dir, exist_ok=True)
+        fetch_cache = FetchCache(os.path.join(output_dir, "fetch_cache.sqlite"))
+        try:
+            async with ClientSession(headers={"User-Agent": config.user_agent}) as session:
+                return await SitemapDiscovery(config, session, HostScheduler(config, session), fetch_cache).discover(sites)
+        finally:
+            fetch_cache.close()
+
+PDF_PAGE_OBJECT = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+PDF_PAGE_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+EXIF_FIELDS = ("Make", "Model", "DateTime", "DateTimeOriginal", "Orientation", "Software", "Artist")
+
+def image_metadata(path: str) -> Dict:
+    with PILImage.open(path) as image:
+        info = {"width": image.width, "height": image.height, "format": image.format}
+        exif = image.getexif()
+        if exif:
+            names = {ExifTags.TAGS.get(tag, tag): value for tag, value in exif.items()}
+            info["exif"] = {name: str(names[name])[:200] for name in EXIF_FIELDS if name in names}
+            info["has_gps"] = 0x8825 in exif
+        # dHash: 64 brightness comparisons between neighbours of a 9x8 greyscale thumbnail
+        image.draft("L", (64, 64))
+        pixels = list(image.convert("L").resize((9, 8)).getdata())
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        info["dhash"] = f"{bits:016x}"
+    return info
+
+def pdf_page_count(path: str) -> Optional[int]:
+    # Counts page objects, falling back to the page tree's /Count when they sit in compressed object streams
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        pages = sum(1 for _ in PDF_PAGE_OBJECT.finditer(data))
+        counts = [int(a or b) for a, b in PDF_PAGE_COUNT.findall(data)]
+    return max([pages] + counts) or None
+
+def analyze_asset(entry: Dict) -> Dict:
+    result = dict(entry)
+    path = entry["path"]
+    try:
+        if not result.get("sha256"):
+            result["sha256"], result["size"] = AssetStore.hash_file(path)
+        if not result.get("mime"):
+            with open(path, 'rb') as f:
+                result["mime"] = sniff_mime(f.read(64))
+        mime = result.get("mime") or ""
+        if mime.startswith("image/") and PILImage is not None:
+            result.update(image_metadata(path))
+        elif mime == "application/pdf":
+            result["pdf_pages"] = pdf_page_count(path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {str(e)[:200]}"
+    return result
+
+def analyze_assets(entries: List[Dict]) -> List[Dict]:
+    return [analyze_asset(entry) for entry in entries]
+
+class AssetProcessor:
+    # Hashing, image decoding and PDF scanning run in a process pool in batches, so none of it
+    # holds the event loop; results are appended to output/asset_manifest.jsonl
+    def __init__(self, workers: int, manifest_path: str, batch_size: int = 32, batch_wait: float = 0.5):
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.manifest_path = manifest_path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_in_flight = workers * 2
+        self.batch: List[Dict] = []
+        self.in_flight: set = set()
+        self.flush_timer: Optional[asyncio.TimerHandle] = None
+        self.processed = 0
+    
+    async def submit(self, entry: Dict):
+        while len(self.in_flight) >= self.max_in_flight:
+            await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+        self.batch.append(entry)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = asyncio.get_running_loop().call_later(self.batch_wait, self.flush)
+    
+    def flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        future = asyncio.get_running_loop().run_in_executor(self.pool, analyze_assets, batch)
+        task = asyncio.ensure_future(self.write_results(future, len(batch)))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+    
+    async def write_results(self, future: Awaitable[List[Dict]], count: int):
+        try:
+            results = await future
+        except Exception as e:
+            logging.warning("Asset analysis failed for a batch of %s: %s", count, e)
+            return
+        append_lines(self.manifest_path, [json.dumps(result, ensure_ascii=False, default=str) for result in results])
+        for result in results:
+            METRICS.inc("assets_analyzed_total", kind=result.get("kind"), outcome="error" if "error" in result else "ok")
+        self.processed += len(results)
+    
+    async def join(self):
+        self.flush()
+        while self.in_flight:
+            await asyncio.gather(*list(self.in_flight))
+    
+    def close(self):
+        self.pool.shutdown()
+
+class AssetDownloader:
+    def __init__(self, core: "ScrapeCore", config: ScrapeConfig):
+        self.core = core
+        self.config = config
+        self.session: Optional[ClientSession] = None
+        self.tls_session = None
+        self.ranges: Optional[RangeDownloader] = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.download_queue_size)
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.limits: Optional[AdaptiveLimits] = None
+        if config.adaptive_concurrency:
+            self.limits = AdaptiveLimits("downloads", config.download_concurrency, config.adaptive_max_downloads,
+                                         config.download_per_host, config.adaptive_max_downloads_per_host,
+                                         config.adaptive_min_concurrency)
+        self.workers: List[asyncio.Task] = []
+        self.pending: set = set()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+    
+    async def start(self):
+        workers = self.config.download_concurrency
+        per_host = self.config.download_per_host
+        if self.limits is not None:
+            # The adaptive limits do the throttling; the pool only has to be big enough for their ceiling
+            workers = max(workers, self.config.adaptive_max_downloads)
+            per_host = max(per_host, self.config.adaptive_max_downloads_per_host)
+        connector = aiohttp.TCPConnector(limit=workers, limit_per_host=per_host, ttl_dns_cache=300)
+        self.session = ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300, sock_connect=30))
+        if AsyncSession is not None:
+            self.tls_session = AsyncSession(max_clients=self.config.download_concurrency)
+        self.ranges = RangeDownloader(self.session, os.path.join(self.core.assets.root, "partial"),
+                                      self.config.download_segments, self.config.segment_threshold)
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(max(1, workers))]
+    
+    def host_limit(self, url: str):
+        host = urlparse(url).netloc.lower()
+        if self.limits is not None:
+            return self.limits.slot(host)
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(max(1, self.config.download_per_host))
+        return self.host_limits[host]
+    
+    async def submit(self, url: str, kind: str, page_url: Optional[str] = None):
+        if url in self.pending:
+            self.skipped += 1
+            return
+        self.pending.add(url)
+        validators = await asyncio.to_thread(self.revalidation, url)
+        if validators is None:
+            self.pending.discard(url)
+            self.skipped += 1
+            return
+        await self.queue.put((url, kind, validators, page_url, CURRENT_TRACE.get()))
+        METRICS.set_gauge("download_queue_depth", self.queue.qsize())
+    
+    def revalidation(self, url: str) -> Optional[Dict[str, str]]:
+        # None while the stored copy is fresh, otherwise the validators to send (none for a new asset)
+        if self.core.assets.lookup(url) is None:
+            return {}
+        if self.core.fetch_cache.is_fresh(url, self.config.asset_revalidate_after):
+            return None
+        return self.core.fetch_cache.validators(url)
+    
+    def store(self, url: str, tmp_path: str, digest: str, size: int, ext: str, meta: Dict) -> str:
+        path = self.core.assets.commit(url, tmp_path, digest, size, ext)
+        self.core.fetch_cache.record(url, meta.get("etag"), meta.get("last_modified"), digest)
+        return path
+    
+    async def worker(self):
+        while True:
+            url, kind, validators, page_url, trace = await self.queue.get()
+            METRICS.set_gauge("download_queue_depth", self.queue.qsize())
+            token = METRICS.begin_trace(url, "download", trace) if trace is not None else None
+            outcome = "failed"
+            store = self.core.assets
+            tmp_path = store.temp_path()
+            meta: Dict = {}
+            try:
+                with METRICS.timer("download", kind=kind):
+                    success = await self.core.retry.run(url, lambda: self.fetch(url, kind, tmp_path, validators, meta))
+                if success and meta.get("status") == 304:
+                    await asyncio.to_thread(self.core.fetch_cache.touch, url)
+                    self.skipped += 1
+                    outcome = "not_modified"
+                    METRICS.inc("assets_total", kind=kind, outcome=outcome)
+                elif success:
+                    digest, size = meta.get("sha256"), meta.get("size")
+                    if not digest:
+                        digest, size = await asyncio.to_thread(AssetStore.hash_file, tmp_path)
+                    filename = SecureFileHandler.sanitize_filename(os.path.basename(urlparse(url).path),
+                                                                   dict(ASSET_KINDS)[kind])
+                    ext = filename.rsplit('.', 1)[1].lower()[:16]
+                    path = await asyncio.to_thread(self.store, url, tmp_path, digest, size, ext, meta)
+                    self.completed += 1
+                    if self.core.processor is not None:
+                        entry = {"url": url, "page_url": page_url, "kind": kind, "path": path,
+                                 "sha256": digest, "size": size, "mime": meta.get("mime")}
+                        if meta.get("checksum"):
+                            entry["checksum"] = meta["checksum"]
+                        await self.core.processor.submit(entry)
+                    outcome = "ok"
+                    METRICS.inc("assets_total", kind=kind, outcome=outcome)
+                    METRICS.inc("bytes_total", size, kind=kind)
+                else:
+                    if meta.get("rejected"):
+                        logging.info("Skipped asset %s: %s", url, meta["rejected"])
+                    self.failed += 1
+                    outcome = "rejected"
+                    METRICS.inc("assets_total", kind=kind, outcome=outcome)
             except Exception as e:
-                if attempt < max_retries - 1:
-                    await self.rotate_context(page)
+                error_class = outcome = classify_error(e)
+                logging.warning("Asset download failed for %s (%s): %s", url, error_class, e)
+                self.failed += 1
+                METRICS.inc("assets_total", kind=kind, outcome="failed")
+                METRICS.inc("failures_total", stage="download", error_class=error_class)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                self.pending.discard(url)
+                METRICS.end_trace(token, outcome)
+                self.queue.task_done()
+    
+    async def fetch(self, url: str, kind: str, tmp_path: str, validators: Dict[str, str], meta: Dict) -> bool:
+        # One attempt; the host slot is released before any retry backoff. Adaptive limits see the
+        # time to the response headers, since the full duration mostly measures the file's size
+        meta.pop("first_byte_at", None)
+        async with self.host_limit(url) as clock:
+            result = await self.core.download_file(self.session, url, tmp_path, validators, meta,
+                                                   max_bytes=self.config.max_asset_bytes.get(kind),
+                                                   resumable=kind in self.config.resumable_kinds)
+            if clock is not None and "first_byte_at" in meta:
+                clock.stop(meta["first_byte_at"])
+            return result
+    
+    async def join(self):
+        await self.queue.join()
+    
+    async def close(self):
+        await self.join()
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.tls_session is not None:
+            await self.tls_session.close()
+            self.tls_session = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+class RequestBlocker:
+    def __init__(self, resource_types: Tuple[str, ...], url_patterns: Tuple[str, ...]):
+        self.resource_types = set(resource_types)
+        self.url_pattern = re.compile("|".join(f"(?:{p})" for p in url_patterns)) if url_patterns else None
+        self.blocked = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.resource_types or self.url_pattern)
+    
+    async def handle(self, route: Route):
+        request = route.request
+        if request.resource_type in self.resource_types or (self.url_pattern and self.url_pattern.search(request.url)):
+            self.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+@dataclass
+class BrowserSlot:
+    browser: Browser
+    pids: List[int] = field(default_factory=list)
+    open_contexts: int = 0
+    retiring: bool = False
+
+@dataclass
+class PooledContext:
+    context: BrowserContext
+    slot: BrowserSlot
+    created_at: float = field(default_factory=time.monotonic)
+    pages_served: int = 0
+
+class BrowserPool:
+    def __init__(self, core: "ScrapeCore", config: ScrapeConfig):
+        self.core = core
+        self.config = config
+        self.slots: List[BrowserSlot] = []
+        self.idle: List[PooledContext] = []
+        self.leases: Dict[BrowserContext, PooledContext] = {}
+        self.lock = asyncio.Lock()
+        self.last_memory_check = 0.0
+    
+    @staticmethod
+    def chromium_pids() -> set:
+        if psutil is None:
+            return set()
+        try:
+            return {p.pid for p in psutil.Process().children(recursive=True)}
+        except psutil.Error:
+            return set()
+    
+    @staticmethod
+    def slot_memory_mb(slot: BrowserSlot) -> float:
+        total = 0
+        for pid in slot.pids:
+            try:
+                root = psutil.Process(pid)
+                for proc in [root] + root.children(recursive=True):
+                    total += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+    
+    async def launch_slot(self) -> BrowserSlot:
+        before = self.chromium_pids()
+        with METRICS.timer("browser_launch"):
+            browser = await self.core.launch_browser(self.config)
+        new_pids = self.chromium_pids() - before
+        roots = []
+        for pid in new_pids:
+            try:
+                if psutil.Process(pid).ppid() not in new_pids:
+                    roots.append(pid)
+            except psutil.Error:
+                continue
+        slot = BrowserSlot(browser=browser, pids=roots)
+        self.slots.append(slot)
+        METRICS.inc("browser_launches_total")
+        return slot
+    
+    async def start(self):
+        async with self.lock:
+            while len(self.slots) < max(1, self.config.browser_pool_size):
+                await self.launch_slot()
+    
+    def check_memory(self):
+        if psutil is None or not (self.config.max_browser_memory_mb or self.config.adaptive_rss_limit_mb):
+            return
+        now = time.monotonic()
+        if now - self.last_memory_check < 5.0:
+            return
+        self.last_memory_check = now
+        total = 0.0
+        for slot in self.slots:
+            used = self.slot_memory_mb(slot)
+            total += used
+            if self.config.max_browser_memory_mb and not slot.retiring and used > self.config.max_browser_memory_mb:
+                logging.warning("Recycling browser above %s MB", self.config.max_browser_memory_mb)
+                slot.retiring = True
+        METRICS.set_gauge("browser_rss_mb", round(total, 1))
+        
+        scheduler = self.core.scheduler
+        if (self.config.adaptive_rss_limit_mb and total > self.config.adaptive_rss_limit_mb
+                and scheduler is not None and scheduler.page_limits is not None):
+            scheduler.page_limits.global_limiter.back_off("rss")
+    
+    def is_expired(self, lease: PooledContext) -> bool:
+        return (lease.slot.retiring
+                or lease.pages_served >= self.config.max_pages_per_context
+                or time.monotonic() - lease.created_at >= self.config.max_context_age)
+    
+    async def acquire(self, config: ScrapeConfig) -> BrowserContext:
+        async with self.lock:
+            self.check_memory()
+            
+            while self.idle:
+                lease = self.idle.pop()
+                if self.is_expired(lease):
+                    await self.close_lease(lease)
                     continue
-                else:
-                    raise
+                lease.pages_served += 1
+                self.leases[lease.context] = lease
+                return lease.context
+            
+            await self.replace_retired_slots()
+            slot = min((s for s in self.slots if not s.retiring), key=lambda s: s.open_contexts)
+            with METRICS.timer("context_create"):
+                context = await self.core.new_context(config, slot.browser)
+            slot.open_contexts += 1
+            lease = PooledContext(context=context, slot=slot, pages_served=1)
+            self.leases[context] = lease
+            return context
+    
+    async def release(self, context: BrowserContext, discard: bool = False):
+        async with self.lock:
+            lease = self.leases.pop(context, None)
+            if lease is None:
+                return
+            if discard or self.is_expired(lease):
+                await self.close_lease(lease)
+                return
+            try:
+                for page in context.pages:
+                    await page.close()
+                await context.clear_cookies()
+            except Exception as e:
+                logging.warning("Dropping context that failed to reset: %s", e)
+                await self.close_lease(lease)
+                return
+            self.idle.append(lease)
+    
+    async def close_lease(self, lease: PooledContext):
+        try:
+            await lease.context.close()
+        except Exception:
+            pass
+        lease.slot.open_contexts -= 1
+        if lease.slot.retiring and lease.slot.open_contexts <= 0:
+            await self.close_slot(lease.slot)
+    
+    async def close_slot(self, slot: BrowserSlot):
+        if slot in self.slots:
+            self.slots.remove(slot)
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass
+    
+    async def replace_retired_slots(self):
+        for slot in list(self.slots):
+            if slot.retiring and slot.open_contexts <= 0:
+                await self.close_slot(slot)
+        while len([s for s in self.slots if not s.retiring]) < max(1, self.config.browser_pool_size):
+            await self.launch_slot()
+    
+    async def close(self):
+        async with self.lock:
+            for lease in list(self.idle) + list(self.leases.values()):
+                try:
+                    await lease.context.close()
+                except Exception:
+                    pass
+            self.idle.clear()
+            self.leases.clear()
+            for slot in list(self.slots):
+                await self.close_slot(slot)
+
+class ScrapeCore:
+    IDLE_POLL = 0.05
+    IDLE_POLL_MAX = 1.0
+    
+    def __init__(self, config: Optional[ScrapeConfig] = None, sink: Optional[OutputSink] = None,
+                 leases: Optional[HostLeases] = None):
+        self.config = config or ScrapeConfig()
+        self.playwright = None
+        self.pool: Optional[BrowserPool] = None
+        self.browser_lock = asyncio.Lock()
+        self.downloader: Optional[AssetDownloader] = None
+        self.processor: Optional[AssetProcessor] = None
+        self.scheduler: Optional[HostScheduler] = None
+        self.sink = sink
+        self.writer: Optional[ThreadPoolExecutor] = None
+        self.leases = leases
+        self.metrics_runner = None
+        self.metrics_task: Optional[asyncio.Task] = None
+        self.blocker = RequestBlocker(self.config.blocked_resource_types, self.config.blocked_url_patterns)
+        self.current_proxy_index = 0
+        self.capsolver = CapsolverHandler()
+        self.humanizer = Humanizer()
+        self.output_dir = "./output"
+        
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        
+        self.assets = AssetStore(os.path.join(self.output_dir, "assets"))
+        self.retry = RetryEngine(RetryPolicy(), DeadLetterLog(os.path.join(self.output_dir, "dead_letter.jsonl")))
+        self.fetch_cache = FetchCache(os.path.join(self.output_dir, "fetch_cache.sqlite"))
+        self.archive = None
+        if self.config.archive or self.config.replay:
+            self.archive = WarcArchive(os.path.join(self.output_dir, "warc"), self.config.archive_rotate_bytes)
+        self.near_duplicates = None
+        if self.config.near_duplicate_distance is not None:
+            self.near_duplicates = NearDuplicateIndex(os.path.join(self.output_dir, "near_duplicates.sqlite"),
+                                                      self.config.near_duplicate_distance,
+                                                      self.config.near_duplicate_min_words,
+                                                      shared=leases is not None)
+    
+    def get_next_proxy(self) -> Optional[str]:
+        if not PROXIES:
+            return None
+        proxy = PROXIES[self.current_proxy_index]
+        self.current_proxy_index = (self.current_proxy_index + 1) % len(PROXIES)
+        return proxy
+    
+    def make_config(self) -> ScrapeConfig:
+        return replace(
+            self.config,
+            viewport_width=self.config.viewport_width + random.randint(-100, 100),
+            viewport_height=self.config.viewport_height + random.randint(-100, 100),
+            proxy=self.config.proxy or self.get_next_proxy()
+        )
+    
+    @staticmethod
+    def proxy_settings(proxy: Optional[str]) -> Optional[Dict]:
+        if not proxy:
+            return None
+        parsed = urlparse(proxy)
+        settings = {"server": f"{parsed.scheme}://{parsed.netloc.rpartition('@')[2]}"}
+        if parsed.username:
+            settings["username"] = parsed.username
+            settings["password"] = parsed.password or ""
+        return settings
     
-    async def rotate_context(self, page: Page):
-        if self.context:
-            await self.context.close()
+    async def launch_browser(self, config: ScrapeConfig) -> Browser:
+        browser_args = [
+            f'--user-agent={config.user_agent}',
+            '--disable-blink-features=AutomationControlled',
+            '--disable-dev-shm-usage',
+            '--no-sandbox',
+            '--disable-web-security',
+            '--disable-features=IsolateOrigins,site-per-process',
+            '--disable-site-isolation-trials',
+            '--disable-component-extensions-with-background-pages',
+            '--disable-default-apps',
+            '--disable-extensions',
+            '--disable-background-networking'
+        ]
         
-        config = ScrapeConfig(
-            viewport_width=1920 + random.randint(-100, 100),
-            viewport_height=1080 + random.randint(-100, 100),
-            proxy=self.get_next_proxy(),
-            headless="new"
+        return await self.playwright.chromium.launch(
+            headless=config.headless,
+            args=browser_args
+        )
+    
+    async def new_context(self, config: ScrapeConfig, browser: Browser) -> BrowserContext:
+        context = await browser.new_context(
+            viewport={'width': config.viewport_width, 'height': config.viewport_height},
+            user_agent=config.user_agent,
+            java_script_enabled=True,
+            ignore_https_errors=True,
+            proxy=self.proxy_settings(config.proxy)
         )
         
-        self.context = await self.create_browser_context(config)
-        return await self.context.new_page()
+        headers = EnhancedFingerprintSpoofer.get_chrome_headers()
+        await context.set_extra_http_headers(headers)
+        await EnhancedFingerprintSpoofer.inject_stealth_js(context)
+        
+        if self.blocker.enabled:
+            await context.route("**/*", self.blocker.handle)
+        
+        return context
+    
+    async def create_browser_context(self, config: ScrapeConfig) -> BrowserContext:
+        await self.start()
+        await self.ensure_browser()
+        return await self.pool.acquire(config)
+    
+    async def ensure_browser(self):
+        # Playwright and its browsers start on the first page that needs them, so HTTP-only runs
+        # and auto runs that never fall back never launch Chromium
+        async with self.browser_lock:
+            if self.pool is not None:
+                return
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            pool = BrowserPool(self, self.config)
+            try:
+                await pool.start()
+            except BaseException:
+                await pool.close()
+                raise
+            self.pool = pool
+    
+    async def start(self):
+        if self.config.fetch_mode == "browser":
+            await self.ensure_browser()
+        if self.processor is None and self.config.asset_processors > 0 and not self.config.replay:
+            self.processor = AssetProcessor(self.config.asset_processors, os.path.join(self.output_dir, "asset_manifest.jsonl"))
+        if self.downloader is None:
+            self.downloader = AssetDownloader(self, self.config)
+            await self.downloader.start()
+        if self.scheduler is None:
+            self.scheduler = HostScheduler(self.config, self.downloader.session, self.leases)
+            self.retry.on_backoff = self.scheduler.defer
+        if self.sink is None:
+            self.sink = make_sink(self.config, self.output_dir)
+        if self.writer is None:
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sink")
+        METRICS.trace_path = self.config.trace_file
+        if self.config.metrics_port and self.metrics_runner is None:
+            self.metrics_runner = await METRICS.serve(self.config.metrics_port)
+        if self.config.metrics_file and self.metrics_task is None:
+            self.metrics_task = asyncio.create_task(
+                METRICS.write_periodically(self.config.metrics_file, self.config.metrics_interval))
+    
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        if self.downloader:
+            await self.downloader.close()
+            self.downloader = None
+        if self.processor:
+            await self.processor.join()
+            self.processor.close()
+            self.processor = None
+        self.scheduler = None
+        if self.writer is not None:
+            await asyncio.to_thread(self.writer.shutdown)
+            self.writer = None
+        if self.sink:
+            await asyncio.to_thread(self.sink.close)
+            self.sink = None
+        if self.archive is not None:
+            self.archive.close_file()
+        if self.metrics_task:
+            self.metrics_task.cancel()
+            self.metrics_task = None
+            METRICS.write_file(self.config.metrics_file)
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+    
+    async def handle_captcha(self, page: Page):
+        # Legacy fallback; main logic now in DynamicCaptchaDetector
+        pass
+    
+    async def navigate_with_evasion(self, page: Page, url: str) -> Tuple[Page, Optional[Response]]:
+        async def attempt() -> Tuple[Page, Optional[Response]]:
+            async with self.scheduler.slot(url) as clock:
+                with METRICS.timer("goto"):
+                    response = await page.goto(url, wait_until=self.config.wait_until, timeout=30000)
+                if clock is not None:
+                    clock.stop()
+                
+                if response and (response.status in (403, 429) or response.status >= 500):
+                    raise HttpStatusError(response.status, url, response.headers.get('retry-after'))
+                
+                if self.config.wait_for_selector:
+                    await page.wait_for_selector(self.config.wait_for_selector, timeout=30000)
+                if self.config.wait_for_function:
+                    await page.wait_for_function(self.config.wait_for_function, timeout=30000)
+            
+            captcha_solved = await DynamicCaptchaDetector.detect_and_solve(page, self.capsolver)
+            if captcha_solved:
+                await asyncio.sleep(2)
+            
+            if not self.config.humanize:
+                return page, response
+            
+            await asyncio.sleep(random.uniform(0.8, 2.5))
+            
+            await self.humanizer.human_scroll(page)
+            
+            await self.humanizer.human_mouse_move(page, 100, 100)
+            
+            elements = await page.query_selector_all('a, button, input[type="submit"]')
+            if elements:
+                first_element = elements[0]
+                box = await first_element.bounding_box()
+                if box:
+                    await self.humanizer.human_mouse_move(page, box['x'] + box['width']/2, box['y'] + box['height']/2)
+                    await asyncio.sleep(random.uniform(0.2, 0.8))
+                    await page.mouse.down()
+                    await asyncio.sleep(random.uniform(0.05, 0.1))
+                    await page.mouse.up()
+                    await asyncio.sleep(random.uniform(1.0, 2.5))
+            
+            return page, response
+        
+        async def before_retry(error: BaseException, error_class: str):
+            nonlocal page
+            page = await self.rotate_context(page)
+        
+        original = page
+        try:
+            return await self.retry.run(url, attempt, before_retry)
+        except BaseException:
+            # The caller still holds the page it passed in; a context rotated in since then is ours to return
+            if page is not original:
+                await self.pool.release(page.context)
+            raise
+    
+    async def rotate_context(self, page: Page) -> Page:
+        await self.pool.release(page.context, discard=True)
+        
+        context = await self.pool.acquire(self.make_config())
+        try:
+            return await context.new_page()
+        except BaseException:
+            await self.pool.release(context, discard=True)
+            raise
     
-    async def download_file(self, session: ClientSession, url: str, filepath: str) -> bool:
+    async def download_file(self, session: ClientSession, url: str, filepath: str,
+                            validators: Optional[Dict[str, str]] = None, meta: Optional[Dict] = None,
+                            max_bytes: Optional[int] = None, resumable: bool = False) -> bool:
+        # Conditional requests report a 304 through meta["status"] without writing filepath
+        meta = meta if meta is not None else {}
+        
+        if resumable and self.downloader and self.downloader.ranges:
+            # Errors propagate to the retry engine; the partial file stays so the retry resumes
+            result = await self.downloader.ranges.download(url, filepath, validators, meta, max_bytes)
+            if result is not None:
+                return result
+        
         # Try TLS-fingerprinted download first
         if AsyncSession is not None:
-            success = await TLSFingerprintDownloader.download_with_fingerprint(url, filepath)
+            tls_session = self.downloader.tls_session if self.downloader else None
+            success = await TLSFingerprintDownloader.download_with_fingerprint(
+                url, filepath, tls_session, validators, meta, max_bytes)
             if success:
                 return True
+            if meta.get("rejected"):
+                return False
         
-        # Fallback to aiohttp
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    content_type = response.headers.get('Content-Type', '').lower()
-                    if 'text/html' in content_type:
-                        return False
-                    
-                    with open(filepath, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                    return True
-        except:
-            pass
+        # Fallback to aiohttp; errors and retryable statuses propagate to the retry engine
+        async with session.get(url, headers=validators or None) as response:
+            meta["status"] = response.status
+            meta["first_byte_at"] = time.monotonic()
+            if response.status == 304:
+                return True
+            if response.status == 429 or response.status >= 500:
+                raise HttpStatusError(response.status, url, response.headers.get('Retry-After'))
+            if response.status == 200:
+                meta["etag"] = response.headers.get('ETag')
+                meta["last_modified"] = response.headers.get('Last-Modified')
+                if not precheck_response(response.headers, max_bytes, meta):
+                    return False
+                
+                return await stream_to_file(response.content.iter_chunked(64 * 1024), filepath, max_bytes, meta)
+        meta["rejected"] = f"status {meta['status']}"
         return False
     
     async def save_content(self, domain: str, content: Dict):
-        sanitized_domain = re.sub(r'[^\w\-\.]', '_', domain)
-        domain_dir = os.path.join(self.output_dir, sanitized_domain)
+        if self.near_duplicates is not None:
+            # Boilerplate-free text, when there is any, makes template-heavy pages easier to tell apart
+            fingerprint = await asyncio.to_thread(NearDuplicateIndex.fingerprint,
+                                                  content.get("main_text") or content.get("text") or "",
+                                                  self.near_duplicates.min_words)
+            duplicate_of = await asyncio.to_thread(self.near_duplicates.check, content["url"], fingerprint)
+            if duplicate_of:
+                # Keep a slim record pointing at the original and leave its assets alone
+                content["duplicate_of"] = duplicate_of
+                METRICS.inc("near_duplicates_total")
+                await self.write_record({k: v for k, v in content.items() if k not in ("text", "main_text")}, content)
+                return
+        
+        await self.write_record(content, content)
+        if self.config.replay:
+            return
+        
+        for kind, _ in ASSET_KINDS:
+            for asset_url in content["links"].get(kind, []):
+                await self.downloader.submit(asset_url, kind, content["url"])
+    
+    def write_to_sink(self, record: Dict) -> Optional[str]:
+        self.sink.write(record)
+        return self.sink.location(record)
+    
+    async def write_record(self, record: Dict, content: Dict):
+        # Sinks do file I/O and QueueSink blocks while the shard supervisor catches up, so writes go
+        # through one thread, which also keeps them in order. The location is set on content after
+        # the write, so the stored record itself is unchanged
+        location = await asyncio.get_running_loop().run_in_executor(self.writer, self.write_to_sink, record)
+        if location is not None:
+            content["output"] = location
+    
+    async def unchanged_page(self, url: str) -> Dict:
+        # Nothing is extracted again, but a crawl still needs the links the page had last time
+        links = await asyncio.to_thread(self.fetch_cache.revisit, url)
+        return {"url": url, "unchanged": True, "links": {"other": links}}
+    
+    @staticmethod
+    def content_hash(content: Dict) -> str:
+        return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    async def response_body(response: Optional[Response]) -> Optional[bytes]:
+        if response is None:
+            return None
+        try:
+            body = await response.body()
+        except Exception:
+            return None
+        METRICS.inc("bytes_total", len(body), kind="page")
+        return body
+    
+    async def scrape_page(self, url: str) -> Dict:
+        token = METRICS.begin_trace(url)
+        METRICS.add_gauge("pages_in_flight", 1)
+        try:
+            with METRICS.timer("page"):
+                content = await self.fetch_and_extract(url)
+        except Exception as e:
+            error_class = classify_error(e)
+            outcomes = {"robots": "disallowed", "circuit_open": "deferred"}
+            METRICS.inc("pages_total", outcome=outcomes.get(error_class, "failed"))
+            METRICS.inc("failures_total", stage="page", error_class=error_class)
+            METRICS.end_trace(token, error_class)
+            raise
+        finally:
+            METRICS.add_gauge("pages_in_flight", -1)
         
-        os.makedirs(os.path.join(domain_dir, "images"), exist_ok=True)
-        os.makedirs(os.path.join(domain_dir, "videos"), exist_ok=True)
-        os.makedirs(os.path.join(domain_dir, "documents"), exist_ok=True)
-        os.makedirs(os.path.join(domain_dir, "other"), exist_ok=True)
+        outcome = "unchanged" if content.get("unchanged") else "ok"
+        METRICS.inc("pages_total", outcome=outcome)
+        METRICS.end_trace(token, outcome)
+        return content
+    
+    async def fetch_and_extract(self, url: str) -> Dict:
+        if self.config.replay:
+            return await self.scrape_replay(url)
         
-        with open(os.path.join(domain_dir, "content.json"), 'w', encoding='utf-8') as f:
-            json.dump(content, f, indent=2, ensure_ascii=False)
+        if not await self.scheduler.allowed(url):
+            raise RobotsDisallowed(f"Disallowed by robots.txt: {url}")
         
-        async with aiohttp.ClientSession() as session:
-            for img_url in content["links"].get("images", []):
-                try:
-                    filename = SecureFileHandler.sanitize_filename(
-                        os.path.basename(urlparse(img_url).path),
-                        "jpg"
-                    )
-                    filepath = os.path.join(domain_dir, "images", filename)
-                    await self.download_file(session, img_url, filepath)
-                    await asyncio.sleep(random.uniform(0.1, 0.5))
-                except:
-                    continue
-            
-            for vid_url in content["links"].get("videos", []):
-                try:
-                    filename = SecureFileHandler.sanitize_filename(
-                        os.path.basename(urlparse(vid_url).path),
-                        "mp4"
-                    )
-                    filepath = os.path.join(domain_dir, "videos", filename)
-                    await self.download_file(session, vid_url, filepath)
-                    await asyncio.sleep(random.uniform(0.1, 0.5))
-                except:
-                    continue
-            
-            for doc_url in content["links"].get("documents", []):
-                try:
-                    filename = SecureFileHandler.sanitize_filename(
-                        os.path.basename(urlparse(doc_url).path),
-                        "pdf"
-                    )
-                    filepath = os.path.join(domain_dir, "documents", filename)
-                    await self.download_file(session, doc_url, filepath)
-                    await asyncio.sleep(random.uniform(0.1, 0.5))
-                except:
-                    continue
+        if self.config.fetch_mode in ("http", "auto"):
+            content = await self.retry.run(url, lambda: self.scrape_http(url, fallback=self.config.fetch_mode == "auto"))
+            if content is not None:
+                return content
+        return await self.scrape_browser(url)
     
-    async def scrape_target(self, url: str):
-        self.playwright = await async_playwright().start()
+    async def scrape_http(self, url: str, fallback: bool = False) -> Optional[Dict]:
+        headers = EnhancedFingerprintSpoofer.get_chrome_headers()
+        headers["accept-encoding"] = "gzip, deflate"
+        if self.config.skip_unchanged_pages:
+            headers.update(await asyncio.to_thread(self.fetch_cache.validators, url))
         
-        config = ScrapeConfig(
-            viewport_width=1920 + random.randint(-100, 100),
-            viewport_height=1080 + random.randint(-100, 100),
-            proxy=self.get_next_proxy(),
-            headless="new"
-        )
+        with METRICS.timer("http_fetch"):
+            async with self.scheduler.slot(url) as clock, self.downloader.session.get(url, headers=headers) as response:
+                if clock is not None:
+                    clock.stop()
+                if response.status == 304:
+                    return await self.unchanged_page(url)
+                
+                if response.status == 429 or response.status >= 500:
+                    raise HttpStatusError(response.status, url, response.headers.get('Retry-After'))
+                
+                content_type = response.headers.get('Content-Type', '').lower()
+                if response.status != 200 or 'html' not in content_type:
+                    if fallback:
+                        return None
+                    if response.status != 200:
+                        raise HttpStatusError(response.status, url)
+                    raise ValueError(f"HTTP fetch returned {content_type or 'no content type'} for {url}")
+                
+                response_headers = dict(response.headers)
+                body = bytearray()
+                async for chunk in response.content.iter_chunked(65536):
+                    body += chunk
+                    if len(body) > self.config.max_html_bytes:
+                        del body[self.config.max_html_bytes:]
+                        html_truncated = True
+                        break
+                else:
+                    html_truncated = False
+                final_url = str(response.url)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                html = body.decode(response.charset or 'utf-8', errors='replace')
+        METRICS.inc("bytes_total", len(body), kind="page")
+        
+        page_hash = hashlib.sha256(body).hexdigest()
+        if self.config.skip_unchanged_pages:
+            cached = await asyncio.to_thread(self.fetch_cache.get, url)
+            if cached and cached["content_hash"] == page_hash:
+                return await self.unchanged_page(url)
+        
+        content = await self.extract_html(url, final_url, html, fallback)
+        if content is None:
+            return None
+        if html_truncated:
+            content["truncated"] = dict(content.get("truncated", {}), html=True)
+        
+        if self.archive is not None:
+            await asyncio.to_thread(self.archive.write, url, final_url, 200, "OK", response_headers, bytes(body))
+        await self.save_content(urlparse(url).netloc, content)
+        await asyncio.to_thread(self.fetch_cache.record, url, etag, last_modified, page_hash,
+                                content["links"].get("other", []))
+        
+        return content
+    
+    async def extract_html(self, url: str, final_url: str, html: str, fallback: bool = False) -> Optional[Dict]:
+        with METRICS.timer("extract", mode="http"):
+            extracted = await asyncio.to_thread(HtmlExtractor.extract, html, final_url,
+                                                self.config.max_text_chars, self.config.max_links_per_kind)
+        if fallback and HtmlExtractor.looks_js_rendered(html, extracted, self.config.http_min_text_chars):
+            return None
+        main_text = None
+        if self.config.main_content != "off":
+            with METRICS.timer("main_content", mode="http"):
+                main_text = await asyncio.to_thread(MainContentExtractor.extract, html, self.config.max_text_chars)
+        
+        content = {}
+        content["title"] = extracted["title"]
+        content["url"] = url
+        if self.config.main_content != "only":
+            content["text"] = extracted["text"]
+        if main_text is not None:
+            content["main_text"] = main_text
+        content["links"] = extracted["links"]
+        if extracted.get("truncated"):
+            content["truncated"] = extracted["truncated"]
+        return content
+    
+    async def scrape_replay(self, url: str) -> Dict:
+        record = await asyncio.to_thread(self.archive.read, url)
+        if record is None:
+            raise ReplayMiss(f"Not in the archive: {url}")
+        status, headers, body, final_url = record
+        
+        if self.config.fetch_mode == "browser":
+            return await self.scrape_browser(url)
         
-        self.context = await self.create_browser_context(config)
-        page = await self.context.new_page()
+        charset = None
+        match = re.search(r"charset=([\w-]+)", headers.get("Content-Type", ""), re.I)
+        if match:
+            charset = match.group(1)
+        try:
+            html = body.decode(charset or "utf-8", errors="replace")
+        except LookupError:
+            html = body.decode("utf-8", errors="replace")
+        # Links resolve against the URL the live run ended up at, not the one it asked for
+        content = await self.extract_html(url, final_url, html)
+        await self.save_content(urlparse(url).netloc, content)
+        return content
+    
+    async def replay_route(self, route: Route):
+        # Replay never reaches the network: archived URLs are served from the WARC, everything else fails
+        record = await asyncio.to_thread(self.archive.read, route.request.url)
+        if record is None:
+            await route.abort("internetdisconnected")
+            return
+        status, headers, body, final_url = record
+        if final_url != route.request.url:
+            # Replay the redirect so the page's own URL, and so its links, match the live run
+            await route.fulfill(status=302, headers={"Location": final_url})
+            return
+        await route.fulfill(status=status, headers=headers, body=body)
+    
+    async def scrape_browser(self, url: str) -> Dict:
+        await self.ensure_browser()
+        context = await self.pool.acquire(self.make_config())
+        try:
+            page = await context.new_page()
+        except BaseException:
+            await self.pool.release(context, discard=True)
+            raise
         
         try:
-            await self.navigate_with_evasion(page, url)
+            if self.config.replay:
+                await page.route("**/*", self.replay_route)
+                with METRICS.timer("goto"):
+                    response = await page.goto(url, wait_until=self.config.wait_until, timeout=30000)
+            else:
+                page, response = await self.navigate_with_evasion(page, url)
+            
+            body = None if self.config.replay else await self.response_body(response)
             
-            content = await ContentExtractor.extract_all(page, url)
+            with METRICS.timer("extract", mode="browser"):
+                content = await ContentExtractor.extract_all(page, url, self.config.max_text_chars,
+                                                             self.config.max_links_per_kind, self.config.extract_chunk_chars,
+                                                             self.config.main_content)
             
+            # The HTML shell of a script-rendered page can stay the same while its content changes,
+            # so browser pages are compared by what was extracted rather than by the response body
+            page_hash = None if self.config.replay else self.content_hash(content)
+            if self.config.skip_unchanged_pages and page_hash:
+                cached = await asyncio.to_thread(self.fetch_cache.get, url)
+                if cached and cached["content_hash"] == page_hash:
+                    return await self.unchanged_page(url)
+            
+            if self.archive is not None and body is not None:
+                await asyncio.to_thread(self.archive.write, url, response.url, response.status, response.status_text,
+                                        response.headers, body)
             domain = urlparse(url).netloc
             await self.save_content(domain, content)
             
+            headers = response.headers if response else {}
+            await asyncio.to_thread(self.fetch_cache.record, url, headers.get('etag'), headers.get('last-modified'),
+                                    page_hash, content["links"].get("other", []))
+            
             return content
             
         finally:
-            if self.browser:
-                await self.browser.close()
-            await self.playwright.stop()
+            await self.pool.release(page.context)
+    
+    async def scrape_target(self, url: str):
+        await self.start()
+        try:
+            return await self.scrape_page(url)
+        finally:
+            await self.close()
+    
+    async def scrape_batch(self, urls: List[str], concurrency: Optional[int] = None) -> CrawlStats:
+        stats = CrawlStats(total=len(urls))
+        queue: asyncio.Queue = asyncio.Queue()
+        for url in HostScheduler.interleave(urls):
+            queue.put_nowait(url)
+        deferred = 0
+        
+        def requeue(url: str):
+            nonlocal deferred
+            deferred -= 1
+            queue.put_nowait(url)
+        
+        async def worker():
+            nonlocal deferred
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    if deferred == 0:
+                        return
+                    await asyncio.sleep(0.05)
+                    continue
+                started = time.monotonic()
+                try:
+                    content = await self.scrape_page(url)
+                    stats.record_success(content, time.monotonic() - started)
+                except CircuitOpenError as e:
+                    deferred += 1
+                    asyncio.get_running_loop().call_later(max(0.0, e.reopens_in), requeue, url)
+                except RobotsDisallowed:
+                    stats.disallowed += 1
+                except Exception as e:
+                    self.record_page_failure(stats, url, e)
+        
+        workers = max(1, min(concurrency or self.page_workers(), len(urls)))
+        await self.start()
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+            await self.record_download_stats(stats)
+        finally:
+            await self.close()
+            stats.finish()
+        
+        return stats
+    
+    def page_workers(self) -> int:
+        # With adaptive limits there are enough workers for the ceiling and the limiter gates them
+        if self.config.adaptive_concurrency:
+            return max(self.config.concurrency, self.config.adaptive_max_concurrency)
+        return self.config.concurrency
+    
+    def record_page_failure(self, stats: CrawlStats, url: str, error: Exception):
+        stats.record_failure(url, error)
+        if not getattr(error, "dead_lettered", False):
+            self.retry.dead_letter(url, error, classify_error(error), 1)
+    
+    async def record_download_stats(self, stats: CrawlStats):
+        await self.downloader.join()
+        stats.assets_downloaded = self.downloader.completed
+        stats.assets_failed = self.downloader.failed
+        stats.assets_skipped = self.downloader.skipped
+        stats.retries = self.retry.retries
+    
+    async def crawl(self, seeds: List[str], scope: CrawlScope, max_pages: Optional[int] = None,
+                    concurrency: Optional[int] = None) -> CrawlStats:
+        frontier = UrlFrontier(os.path.join(self.output_dir, "frontier.sqlite"))
+        if self.config.recrawl_after is not None:
+            frontier.expire(self.config.recrawl_after)
+        seed_frontier(frontier, seeds, scope)
+        return await self.drain(frontier, scope, max_pages, concurrency)
+    
+    async def drain(self, frontier: UrlFrontier, scope: Optional[CrawlScope], max_pages: Optional[int] = None,
+                    concurrency: Optional[int] = None, worker_id: Optional[int] = None) -> CrawlStats:
+        # Works the frontier until nothing is pending or in progress anywhere; without a scope
+        # it is a plain batch and links are not followed
+        # Frontier and lease calls wait on SQLite locks other processes hold, so they run in threads
+        stats = CrawlStats()
+        active = 0
+        progress = asyncio.Event()
+        
+        async def worker():
+            nonlocal active
+            idle = self.IDLE_POLL
+            while max_pages is None or stats.total < max_pages:
+                item = await asyncio.to_thread(frontier.pop, await self.scheduler.busy_hosts(), worker_id)
+                if item is None:
+                    if active == 0 and await asyncio.to_thread(frontier.outstanding) == 0:
+                        return
+                    # A page finishing here wakes the worker at once; work from other processes or
+                    # hosts coming off a delay is polled for, backing off while nothing turns up
+                    progress.clear()
+                    try:
+                        await asyncio.wait_for(progress.wait(), idle)
+                    except asyncio.TimeoutError:
+                        idle = min(idle * 2, self.IDLE_POLL_MAX)
+                    continue
+                
+                idle = self.IDLE_POLL
+                url, depth = item
+                active += 1
+                stats.total += 1
+                started = time.monotonic()
+                try:
+                    content = await self.scrape_page(url)
+                    stats.record_success(content, time.monotonic() - started)
+                    children = []
+                    for link in content.get("links", {}).get("other", []) if scope else ():
+                        child = normalize_url(link)
+                        if child and scope.allows(child, depth + 1):
+                            children.append(child)
+                    if children:
+                        await asyncio.to_thread(frontier.add_many, children, depth + 1, -(depth + 1))
+                    await asyncio.to_thread(frontier.finish, url, True)
+                except CircuitOpenError as e:
+                    # The host is cooling down; the URL waits in the frontier instead of failing
+                    stats.total -= 1
+                    await asyncio.to_thread(frontier.defer, url, time.time() + e.reopens_in)
+                except RobotsDisallowed:
+                    stats.disallowed += 1
+                    await asyncio.to_thread(frontier.finish, url, False)
+                except Exception as e:
+                    self.record_page_failure(stats, url, e)
+                    await asyncio.to_thread(frontier.finish, url, False)
+                finally:
+                    active -= 1
+                    progress.set()
+        
+        await self.start()
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency or self.page_workers()))))
+            await self.record_download_stats(stats)
+        finally:
+            await asyncio.to_thread(frontier.close)
+            await self.close()
+            stats.finish()
+        
+        return stats
+
+def seed_frontier(frontier: UrlFrontier, seeds: List[str], scope: Optional[CrawlScope]):
+    for seed in seeds:
+        url = normalize_url(seed)
+        if url:
+            if scope is not None:
+                scope.allowed_hosts.add(urlparse(url).hostname)
+            frontier.add(url, 0, priority=1.0)
+    frontier.flush()
+
+class QueueSink(OutputSink):
+    def __init__(self, records: "multiprocessing.Queue"):
+        self.records = records
+    
+    def write(self, record: Dict):
+        self.records.put(record)
+
+def shard_worker(index: int, config: ScrapeConfig, frontier_path: str, scope: Optional[CrawlScope],
+                 max_pages: Optional[int], records: "multiprocessing.Queue", results: "multiprocessing.Queue"):
+    leases = HostLeases(frontier_path, index)
+    frontier = UrlFrontier(frontier_path, shared=True)
+    core = ScrapeCore(config, sink=QueueSink(records), leases=leases)
+    try:
+        stats = asyncio.run(core.drain(frontier, scope, max_pages, worker_id=index))
+    finally:
+        leases.close()
+    results.put((index, stats))
+
+class ShardSupervisor:
+    # Runs one ScrapeCore per process against a shared SQLite frontier; the supervisor owns
+    # the output sink and host limits are enforced across processes through HostLeases
+    def __init__(self, config: ScrapeConfig, processes: int):
+        self.config = config
+        self.processes = max(1, processes)
+        self.output_dir = "./output"
+    
+    def worker_config(self, index: int) -> ScrapeConfig:
+        return replace(
+            self.config,
+            metrics_port=None,
+            metrics_file=f"{self.config.metrics_file}.{index}" if self.config.metrics_file else None
+        )
+    
+    def write_records(self, records: "multiprocessing.Queue", sink: OutputSink):
+        while True:
+            record = records.get()
+            if record is None:
+                return
+            sink.write(record)
+    
+    def run(self, seeds: List[str], scope: Optional[CrawlScope] = None, max_pages: Optional[int] = None) -> CrawlStats:
+        os.makedirs(self.output_dir, exist_ok=True)
+        if scope is not None:
+            frontier_path = os.path.join(self.output_dir, "frontier.sqlite")
+        else:
+            frontier_path = os.path.join(self.output_dir, "batch_queue.sqlite")
+            self.remove_queue(frontier_path)
+        
+        frontier = UrlFrontier(frontier_path)
+        if scope is not None and self.config.recrawl_after is not None:
+            frontier.expire(self.config.recrawl_after)
+        seed_frontier(frontier, seeds, scope)
+        leases = HostLeases(frontier_path, -1)
+        leases.reset()
+        
+        stats = CrawlStats()
+        context = multiprocessing.get_context("spawn")
+        records = context.Queue(maxsize=1000)
+        results = context.Queue()
+        sink = make_sink(self.config, self.output_dir)
+        writer = threading.Thread(target=self.write_records, args=(records, sink), daemon=True)
+        writer.start()
+        
+        share = -(-max_pages // self.processes) if max_pages else None
+        workers = {
+            index: context.Process(target=shard_worker, name=f"scrape-shard-{index}",
+                                   args=(index, self.worker_config(index), frontier_path, scope, share, records, results))
+            for index in range(self.processes)
+        }
+        for process in workers.values():
+            process.start()
+        
+        done = set()
+        try:
+            while len(done) < len(workers):
+                try:
+                    index, worker_stats = results.get(timeout=1.0)
+                    stats.merge(worker_stats)
+                    done.add(index)
+                except queue.Empty:
+                    pass
+                for index, process in workers.items():
+                    if index not in done and process.exitcode not in (None, 0):
+                        # Hand the crashed worker's claimed URLs and host leases back to the others
+                        requeued = frontier.requeue(index)
+                        leases.release_worker(index)
+                        logging.error("Shard %s exited with %s; requeued %s URLs", index, process.exitcode, requeued)
+                        done.add(index)
+        finally:
+            for process in workers.values():
+                process.join()
+            records.put(None)
+            writer.join()
+            sink.close()
+            leases.close()
+            frontier.close()
+            if scope is None:
+                self.remove_queue(frontier_path)
+            stats.finish()
+        
+        return stats
+    
+    @staticmethod
+    def remove_queue(path: str):
+        for suffix in ("", "-wal", "-shm", ".bloom"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+@dataclass
+class ScrapeJob:
+    id: str
+    urls: List[str]
+    status: str = "queued"  # queued, running, done or cancelled
+    remaining: int = 0
+    stats: CrawlStats = field(default_factory=CrawlStats)
+    results: List[Dict] = field(default_factory=list)  # Per-URL outcome and output path, never page content
+    tasks: set = field(default_factory=set)
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "cancelled")
+    
+    def notify(self):
+        # Waiters hold the old event, so swapping in a fresh one wakes each of them exactly once
+        event, self.updated = self.updated, asyncio.Event()
+        event.set()
+    
+    def finish(self, status: str):
+        self.status = status
+        self.finished_at = time.time()
+        self.stats.finish()
+    
+    def as_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "urls": len(self.urls),
+            "remaining": self.remaining,
+            "results": len(self.results),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "stats": self.stats.as_dict()
+        }
+
+class ScrapeService:
+    # Keeps one ScrapeCore, its browser pool and download sessions warm across jobs
+    # submitted over a local HTTP API
+    JOB_TTL = 3600.0
+    
+    def __init__(self, config: ScrapeConfig, drain_timeout: float = 60.0):
+        self.config = config
+        self.core = ScrapeCore(config)
+        self.drain_timeout = drain_timeout
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.jobs: Dict[str, ScrapeJob] = {}
+        self.workers: List[asyncio.Task] = []
+        self.accepting = True
+    
+    def submit(self, urls: List[str]) -> ScrapeJob:
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at and now - job.finished_at > self.JOB_TTL]:
+            del self.jobs[job_id]
+        
+        job = ScrapeJob(id=uuid.uuid4().hex, urls=urls, remaining=len(urls))
+        job.stats.total = len(urls)
+        self.jobs[job.id] = job
+        for url in HostScheduler.interleave(urls):
+            self.queue.put_nowait((job, url))
+        METRICS.inc("service_jobs_total")
+        return job
+    
+    def cancel(self, job: ScrapeJob):
+        if job.finished:
+            return
+        job.finish("cancelled")
+        for task in list(job.tasks):
+            task.cancel()
+        job.notify()
+    
+    async def worker(self):
+        while True:
+            job, url = await self.queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                job.status = "running"
+                task = asyncio.create_task(self.core.scrape_page(url))
+                job.tasks.add(task)
+                started = time.monotonic()
+                try:
+                    content = await task
+                    job.stats.record_success(content, time.monotonic() - started)
+                    job.results.append(self.result_entry(url, content))
+                except asyncio.CancelledError:
+                    if job.status != "cancelled":
+                        raise
+                except RobotsDisallowed:
+                    job.stats.disallowed += 1
+                    job.results.append({"url": url, "status": "disallowed"})
+                except Exception as e:
+                    self.core.record_page_failure(job.stats, url, e)
+                    job.results.append({"url": url, "status": "failed", "error_class": classify_error(e),
+                                        "error": str(e)[:200]})
+                finally:
+                    job.tasks.discard(task)
+            finally:
+                job.remaining -= 1
+                if job.remaining == 0 and not job.finished:
+                    job.finish("done")
+                job.notify()
+                self.queue.task_done()
+    
+    @staticmethod
+    def result_entry(url: str, content: Dict) -> Dict:
+        # Jobs stay in memory until JOB_TTL, so they keep where a page was written rather than its text
+        if content.get("unchanged"):
+            status = "unchanged"
+        elif content.get("duplicate_of"):
+            status = "duplicate"
+        else:
+            status = "ok"
+        entry = {"url": url, "status": status, "title": content.get("title"), "output": content.get("output")}
+        if content.get("duplicate_of"):
+            entry["duplicate_of"] = content["duplicate_of"]
+        return entry
+    
+    @staticmethod
+    def remove_stale_socket(path: str):
+        # A socket file left behind by a service that died makes the bind fail; one that still answers is in use
+        if not os.path.exists(path) or not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise RuntimeError(f"Another process is already serving on {path}")
+        finally:
+            probe.close()
+    
+    def job_or_404(self, request: "web.Request") -> ScrapeJob:
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "unknown job"}), content_type="application/json")
+        return job
+    
+    async def handle_submit(self, request: "web.Request") -> "web.Response":
+        if not self.accepting:
+            return web.json_response({"error": "draining"}, status=503)
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "body must be JSON"}, status=400)
+        if not isinstance(body, dict):
+            return web.json_response({"error": "body must be a JSON object"}, status=400)
+        urls = body.get("urls") or ([body["url"]] if body.get("url") else [])
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+            return web.json_response({"error": "expected {\"urls\": [...]} or {\"url\": ...}"}, status=400)
+        job = self.submit([url.strip() for url in urls])
+        return web.json_response(job.as_dict(), status=202)
+    
+    async def handle_status(self, request: "web.Request") -> "web.Response":
+        return web.json_response(self.job_or_404(request).as_dict())
+    
+    async def handle_results(self, request: "web.Request") -> "web.StreamResponse":
+        # NDJSON, one record per line as pages finish; the stream ends with the job
+        job = self.job_or_404(request)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        sent = 0
+        while True:
+            updated = job.updated
+            while sent < len(job.results):
+                await response.write((json.dumps(job.results[sent], ensure_ascii=False) + "\n").encode("utf-8"))
+                sent += 1
+            if job.finished:
+                break
+            await updated.wait()
+        await response.write_eof()
+        return response
+    
+    async def handle_cancel(self, request: "web.Request") -> "web.Response":
+        job = self.job_or_404(request)
+        self.cancel(job)
+        return web.json_response(job.as_dict())
+    
+    async def handle_health(self, request: "web.Request") -> "web.Response":
+        return web.json_response({
+            "status": "ok" if self.accepting else "draining",
+            "queued": self.queue.qsize(),
+            "jobs": sum(1 for job in self.jobs.values() if not job.finished)
+        })
+    
+    def app(self) -> "web.Application":
+        app = web.Application()
+        app.router.add_post("/jobs", self.handle_submit)
+        app.router.add_get("/jobs/{job_id}", self.handle_status)
+        app.router.add_get("/jobs/{job_id}/results", self.handle_results)
+        app.router.add_delete("/jobs/{job_id}", self.handle_cancel)
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/metrics", METRICS.handle_metrics)
+        return app
+    
+    async def run(self, host: str = "127.0.0.1", port: Optional[int] = 8765, socket_path: Optional[str] = None):
+        await self.core.start()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(max(1, self.core.page_workers()))]
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        if socket_path:
+            self.remove_stale_socket(socket_path)
+            await web.UnixSite(runner, socket_path).start()
+        else:
+            await web.TCPSite(runner, host, port).start()
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # No signal handlers on this platform; Ctrl+C still ends asyncio.run
+        print(f"Scrape service listening on {socket_path or f'http://{host}:{port}'}")
+        
+        try:
+            await stop.wait()
+            # Drain: refuse new jobs, let queued and in-flight pages finish, then shut down
+            self.accepting = False
+            try:
+                await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Drain timed out after %ss; cancelling remaining jobs", self.drain_timeout)
+                for job in self.jobs.values():
+                    self.cancel(job)
+        finally:
+            for task in self.workers:
+                task.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+            await runner.cleanup()
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+            await self.core.close()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="webscrapping.py")
+    parser.add_argument("url", nargs="?", help="single URL to scrape")
+    parser.add_argument("--batch", metavar="FILE", help="file with one URL per line, '-' for stdin")
+    parser.add_argument("--crawl", metavar="FILE", help="seed URLs to crawl by following links ('-' for stdin); "
+                        "an interrupted crawl resumes from output/frontier.sqlite")
+    parser.add_argument("--sitemap", metavar="FILE",
+                        help="site or sitemap URLs ('-' for stdin) whose sitemaps list the pages to scrape; "
+                        "with --crawl they are added to the seeds")
+    parser.add_argument("--recrawl-after", type=float, metavar="SECONDS",
+                        help="re-queue --crawl pages finished more than SECONDS ago (0 revisits everything)")
+    parser.add_argument("--max-depth", type=int, default=CrawlScope.max_depth, help="link depth limit for --crawl")
+    parser.add_argument("--max-pages", type=int, help="stop --crawl after this many pages")
+    parser.add_argument("--any-domain", action="store_true", help="let --crawl leave the seed hosts")
+    parser.add_argument("--include", action="append", default=[], metavar="REGEX", help="only crawl URLs matching")
+    parser.add_argument("--exclude", action="append", default=[], metavar="REGEX", help="never crawl URLs matching")
+    parser.add_argument("--concurrency", type=int, default=ScrapeConfig.concurrency, help="concurrent page workers")
+    parser.add_argument("--serve", action="store_true", help="run as a long-lived service accepting jobs over HTTP")
+    parser.add_argument("--port", type=int, default=8765, help="--serve listens on 127.0.0.1:PORT")
+    parser.add_argument("--socket", metavar="PATH", help="--serve listens on this Unix socket instead")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="seconds --serve waits for jobs on shutdown")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="shard --batch/--crawl across this many processes, each with its own browsers")
+    parser.add_argument("--browsers", type=int, default=ScrapeConfig.browser_pool_size, help="warm browser processes")
+    parser.add_argument("--max-browser-memory", type=int, metavar="MB", help="recycle a browser above this RSS")
+    parser.add_argument("--asset-processors", type=int, default=ScrapeConfig.asset_processors,
+                        help="processes building output/asset_manifest.jsonl (0 disables)")
+    parser.add_argument("--downloads", type=int, default=ScrapeConfig.download_concurrency, help="concurrent asset downloads")
+    parser.add_argument("--profile", choices=sorted(LOAD_PROFILES), default="full", help="page-load profile")
+    parser.add_argument("--fetch-mode", choices=["browser", "http", "auto"], default=ScrapeConfig.fetch_mode,
+                        help="http skips the browser; auto uses it only for pages that look JS-rendered")
+    parser.add_argument("--main-content", choices=["off", "add", "only"], default=ScrapeConfig.main_content,
+                        help="extract the main article text as main_text, next to or instead of the full text")
+    parser.add_argument("--wait-for", metavar="SELECTOR", help="wait for this selector instead of relying on the load state")
+    parser.add_argument("--ignore-robots", action="store_true", help="do not fetch or honor robots.txt")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="adjust page and download concurrency to observed latency and errors (AIMD)")
+    parser.add_argument("--max-concurrency", type=int, default=ScrapeConfig.adaptive_max_concurrency,
+                        help="upper bound on page workers with --adaptive")
+    parser.add_argument("--max-browser-rss", type=int, metavar="MB",
+                        help="with --adaptive, back off while all browsers together use more than this")
+    parser.add_argument("--host-concurrency", type=int, default=ScrapeConfig.host_concurrency, help="pages in flight per host")
+    parser.add_argument("--host-interval", type=float, default=ScrapeConfig.min_host_interval,
+                        help="minimum seconds between requests to one host")
+    parser.add_argument("--output-format", choices=["json", "jsonl", "parquet"], default=ScrapeConfig.output_format,
+                        help="json overwrites output/<domain>/content.json; jsonl and parquet stream to output/pages/")
+    parser.add_argument("--compress", choices=["zstd"], help="compress jsonl output")
+    parser.add_argument("--full-recrawl", action="store_true", help="re-extract pages even if unchanged since the last run")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="FILE", help="periodically write Prometheus metrics to FILE")
+    parser.add_argument("--trace", metavar="FILE", help="append per-page stage traces as JSONL")
+    parser.add_argument("--log-level", default="ERROR", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--archive", action="store_true", help="keep raw page responses in output/warc/*.warc.gz")
+    parser.add_argument("--replay", action="store_true",
+                        help="re-extract from output/warc without network access; with no --batch, replays every archived page")
+    parser.add_argument("--stats", metavar="FILE", help="write run stats as JSON")
+    return parser.parse_args(argv)
+
+def build_config(args: argparse.Namespace) -> ScrapeConfig:
+    return ScrapeConfig(
+        concurrency=args.concurrency,
+        browser_pool_size=args.browsers,
+        max_browser_memory_mb=args.max_browser_memory,
+        download_concurrency=args.downloads,
+        asset_processors=args.asset_processors,
+        skip_unchanged_pages=not args.full_recrawl,
+        recrawl_after=args.recrawl_after,
+        fetch_mode=args.fetch_mode,
+        main_content=args.main_content,
+        archive=args.archive,
+        replay=args.replay,
+        output_format=args.output_format,
+        output_compression=args.compress,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        trace_file=args.trace,
+        respect_robots=not args.ignore_robots,
+        host_concurrency=args.host_concurrency,
+        adaptive_concurrency=args.adaptive,
+        adaptive_max_concurrency=args.max_concurrency,
+        adaptive_rss_limit_mb=args.max_browser_rss,
+        min_host_interval=args.host_interval,
+        wait_for_selector=args.wait_for
+    ).with_profile(args.profile)
+
+async def run_batch(args: argparse.Namespace):
+    config = build_config(args)
+    if args.replay and not (args.crawl or args.batch):
+        archive = WarcArchive(os.path.join("./output", "warc"))
+        urls = archive.urls()
+        archive.close()
+    elif args.crawl or args.batch:
+        urls = load_urls(args.crawl or args.batch)
+    else:
+        urls = []
+    if args.sitemap:
+        listed = await SitemapDiscovery.collect(config, load_urls(args.sitemap))
+        urls = list(dict.fromkeys(urls + listed))
+    if not urls:
+        print("No URLs to scrape")
+        return
+    
+    scope = None
+    if args.crawl:
+        scope = CrawlScope(
+            same_domain=not args.any_domain,
+            max_depth=args.max_depth,
+            include_patterns=tuple(args.include),
+            exclude_patterns=tuple(args.exclude)
+        )
+    
+    if args.processes > 1:
+        supervisor = ShardSupervisor(config, args.processes)
+        stats = await asyncio.to_thread(supervisor.run, urls, scope, args.max_pages if args.crawl else None)
+    elif args.crawl:
+        stats = await ScrapeCore(config).crawl(urls, scope, max_pages=args.max_pages)
+    else:
+        stats = await ScrapeCore(config).scrape_batch(urls)
+    summary = stats.as_dict()
+    
+    print(f"Batch complete: {summary['succeeded']}/{summary['total']} pages "
+          f"({summary['unchanged']} unchanged, {summary['duplicates']} near-duplicates, "
+          f"{summary['disallowed']} disallowed by robots.txt) in "
+          f"{summary['elapsed_seconds']}s ({summary['pages_per_second']} pages/s)")
+    print(f"Extracted: {summary['images']} images, {summary['videos']} videos, "
+          f"{summary['documents']} documents ({summary['assets_downloaded']} downloaded, "
+          f"{summary['assets_failed']} failed, {summary['assets_skipped']} already stored)")
+    
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
 
 async def main():
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python scrapecore.py <url>")
+    args = parse_args()
+    logging.getLogger().setLevel(args.log_level)
+    if args.serve:
+        await ScrapeService(build_config(args), args.drain_timeout).run(port=args.port, socket_path=args.socket)
+        return
+    
+    if args.batch or args.crawl or args.replay or args.sitemap:
+        await run_batch(args)
+        return
+    
+    if not args.url:
+        print("Usage: python webscrapping.py <url> | --batch <file|-> | --crawl <file|-> | --sitemap <file|-> [--concurrency N]")
         return
     
-    target_url = sys.argv[1]
-    core = ScrapeCore()
+    target_url = args.url
+    core = ScrapeCore(build_config(args))
     
     try:
         result = await core.scrape_target(target_url)